@@ -0,0 +1,216 @@
+# analytics.py
+"""
+Analyses de tendance sur une année : part des heures supplémentaires par
+ligne de production, dérive de l'effectif, répartition VOH / FOH / ADMIN.
+
+Chaque table brute est lue en une seule requête, en colonnes (array_agg :
+une liste par colonne) ; les tableaux croisés (clé x semaine), moyennes
+glissantes et écarts d'une semaine sur l'autre sont ensuite calculés par
+opérations vectorisées NumPy, sans boucle sur les lignes.
+
+Les rapports sont mémorisés par (année, versions des tables) : les versions
+(table_versions, voir http_cache.py) changent à chaque écriture, un rapport
+n'est donc jamais resservi après une saisie qui le modifie.
+
+Axe des semaines : semaines saisies de l'année, dans l'ordre ('W1', 'W2'...) ;
+une semaine absente n'est pas comptée comme une semaine à zéro.
+
+NumPy est une dépendance optionnelle : sans lui, analytics_available() est
+faux et les routes répondent 501.
+"""
+
+import time
+
+import psycopg2  # type: ignore
+
+from cache import TTLCache
+from config import Config
+from http_cache import VERSION_SQL
+from importer import HOUR_WEIGHTS
+
+try:  # dépendance optionnelle (analyses vectorisées)
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover
+    np = None
+
+DL_TABLE = "weekly_dl_metrics"
+VOH_TABLE = "weekly_voh_metrics"
+
+# Une ligne de résultat, une liste par colonne ; semaines au format 'Wn' uniquement
+_COLUMNS_SQL = """
+    SELECT array_agg(substring("WeekNo" from 2)::int) AS week,
+           array_agg("BU") AS bu,
+           array_agg({key}) AS key,
+           array_agg("DL_Headcount") AS headcount,
+           array_agg("H100") AS h100,
+           array_agg("H125") AS h125,
+           array_agg("H150") AS h150,
+           array_agg("H200") AS h200
+    FROM public.{table}
+    WHERE "Year" = %s AND "WeekNo" ~ '^W[0-9]+$'
+"""
+DL_COLUMNS_SQL = _COLUMNS_SQL.format(key='"Production_line"', table=DL_TABLE)
+VOH_COLUMNS_SQL = _COLUMNS_SQL.format(key='"Type"', table=VOH_TABLE)
+
+# Rapports calculés : (année, versions des tables) -> dict ; le TTL ne sert qu'à libérer la mémoire
+reports = TTLCache('analytics', ttl=Config.ANALYTICS_CACHE_TTL, maxsize=32)
+
+
+def analytics_available() -> bool:
+    return np is not None
+
+
+# -----------------------------------------------------------------------------
+# Lecture en colonnes
+# -----------------------------------------------------------------------------
+def load_columns(cur, sql, year):
+    """Colonnes de l'année sous forme de tableaux NumPy (heures remises à leur valeur saisie)."""
+    cur.execute(sql, (year,))
+    week, bu, key, headcount, *hours = cur.fetchone()
+    cols = {
+        'week': np.asarray(week or [], dtype=np.int64),
+        'bu': np.asarray(bu or [], dtype=object),
+        'key': np.asarray(key or [], dtype=object),
+        'headcount': np.asarray(headcount or [], dtype=np.float64),
+    }
+    # colonnes stockées pondérées -> heures saisies
+    for name, values in zip(HOUR_WEIGHTS, hours):
+        cols[name] = np.asarray(values or [], dtype=np.float64) / HOUR_WEIGHTS[name]
+    return cols
+
+
+# -----------------------------------------------------------------------------
+# Opérations vectorisées
+# -----------------------------------------------------------------------------
+def week_axis(weeks):
+    """Semaines distinctes triées + indice de chaque ligne sur cet axe."""
+    return np.unique(weeks, return_inverse=True)
+
+
+def pivot(keys, week_idx, n_weeks, values):
+    """Somme de `values` par (clé, semaine) -> (clés triées, matrice clés x semaines)."""
+    labels, key_idx = np.unique(keys.astype(str), return_inverse=True)
+    flat = np.bincount(key_idx * n_weeks + week_idx, weights=values, minlength=len(labels) * n_weeks)
+    return labels, flat.reshape(len(labels), n_weeks)
+
+
+def ratio(numerator, denominator):
+    """numerator / denominator, NaN là où le dénominateur est nul."""
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, dtype=np.float64), denominator)
+    return np.divide(numerator, denominator, out=np.full(numerator.shape, np.nan), where=denominator != 0)
+
+
+def week_over_week(values):
+    """Écart avec la semaine saisie précédente (dernier axe) ; NaN pour la première."""
+    return np.diff(values, axis=-1, prepend=np.nan)
+
+
+def rolling_mean(values, window):
+    """Moyenne glissante des `window` dernières semaines (dernier axe, fenêtre réduite en début d'année)."""
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[-1]
+    summed = np.cumsum(values, axis=-1)
+    shifted = np.zeros_like(summed)
+    shifted[..., window:] = summed[..., :-window]
+    return (summed - shifted) / np.minimum(np.arange(1, n + 1), window)
+
+
+def to_json(values, digits=4):
+    """Tableau -> listes JSON (NaN / infini -> null)."""
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(values), np.round(values, digits), None).tolist()
+
+
+# -----------------------------------------------------------------------------
+# Rapports
+# -----------------------------------------------------------------------------
+def dl_report(cols, window):
+    """Part des heures supplémentaires par ligne et dérive de l'effectif DL."""
+    weeks, week_idx = week_axis(cols['week'])
+    n = len(weeks)
+    raw = cols['H100'] + cols['H125'] + cols['H150'] + cols['H200']
+    overtime = raw - cols['H100']
+
+    lines, raw_by_line = pivot(cols['key'], week_idx, n, raw)
+    _, overtime_by_line = pivot(cols['key'], week_idx, n, overtime)
+    _, headcount_by_line = pivot(cols['key'], week_idx, n, cols['headcount'])
+    first = np.unique(cols['key'].astype(str), return_index=True)[1]
+
+    headcount = headcount_by_line.sum(axis=0)
+    raw_total = raw_by_line.sum(axis=0)
+    overtime_total = overtime_by_line.sum(axis=0)
+    return {
+        'weeks': [f"W{w}" for w in weeks.tolist()],
+        'lines': lines.tolist(),
+        'bus': cols['bu'][first].tolist(),
+        'overtime_share': to_json(ratio(overtime_by_line, raw_by_line)),
+        'overtime_share_year': to_json(ratio(overtime_by_line.sum(axis=1), raw_by_line.sum(axis=1))),
+        'headcount_by_line': to_json(headcount_by_line, 0),
+        'headcount_wow_by_line': to_json(week_over_week(headcount_by_line), 0),
+        'totals': {
+            'headcount': to_json(headcount, 0),
+            'headcount_wow': to_json(week_over_week(headcount), 0),
+            'headcount_rolling': to_json(rolling_mean(headcount, window), 2),
+            'raw_hours': to_json(raw_total, 2),
+            'raw_hours_rolling': to_json(rolling_mean(raw_total, window), 2),
+            'overtime_share': to_json(ratio(overtime_total, raw_total)),
+            'overtime_share_rolling': to_json(ratio(rolling_mean(overtime_total, window),
+                                                    rolling_mean(raw_total, window))),
+        },
+    }
+
+
+def voh_report(cols, window):
+    """Répartition de l'effectif et des heures VOH / FOH / ADMIN par semaine."""
+    weeks, week_idx = week_axis(cols['week'])
+    n = len(weeks)
+    weighted = sum(cols[name] * weight for name, weight in HOUR_WEIGHTS.items())
+
+    types, headcount = pivot(cols['key'], week_idx, n, cols['headcount'])
+    _, hours = pivot(cols['key'], week_idx, n, weighted)
+    share = ratio(headcount, headcount.sum(axis=0))
+    return {
+        'weeks': [f"W{w}" for w in weeks.tolist()],
+        'types': types.tolist(),
+        'headcount': to_json(headcount, 0),
+        'headcount_share': to_json(share),
+        'headcount_share_wow': to_json(week_over_week(share)),
+        'headcount_share_rolling': to_json(ratio(rolling_mean(headcount, window),
+                                                 rolling_mean(headcount.sum(axis=0), window))),
+        'weighted_hours': to_json(hours, 2),
+        'headcount_share_year': to_json(ratio(headcount.sum(axis=1), headcount.sum())),
+        'hours_share_year': to_json(ratio(hours.sum(axis=1), hours.sum())),
+    }
+
+
+def build_report(cur, year, window):
+    started = time.perf_counter()
+    dl = dl_report(load_columns(cur, DL_COLUMNS_SQL, year), window)
+    voh = voh_report(load_columns(cur, VOH_COLUMNS_SQL, year), window)
+    return {
+        'year': year,
+        'window': window,
+        'dl': dl,
+        'voh': voh,
+        'compute_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def data_marker(cur):
+    """Versions des tables brutes (None si la migration 5 n'est pas appliquée : pas de mémorisation)."""
+    try:
+        cur.execute(VERSION_SQL, ([DL_TABLE, VOH_TABLE],))
+        return tuple((table, version) for table, version, _ in cur.fetchall())
+    except psycopg2.Error:
+        cur.connection.rollback()
+        return None
+
+
+def year_report(conn, year, window=None):
+    """Rapport de l'année, mémorisé tant que les tables brutes ne changent pas."""
+    window = max(1, window or Config.ANALYTICS_ROLLING_WEEKS)  # 0 ou négatif : pas de moyenne glissante
+    with conn.cursor() as cur:
+        marker = data_marker(cur)
+        if marker is None:
+            return build_report(cur, year, window)
+        return reports.get_or_load((year, window, marker), lambda: build_report(cur, year, window))
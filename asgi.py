@@ -0,0 +1,30 @@
+# asgi.py
+"""
+Point d'entrée ASGI : variante asynchrone des routes chaudes + application WSGI existante.
+
+    hypercorn asgi:application --workers 2 --bind 0.0.0.0:8000
+
+Les chemins de async_app.routes.ASYNC_PATHS (accueil, saisie/listing RH et VOH,
+API paginées) et les fichiers statiques sont servis par Quart + asyncpg, sans
+thread par requête. Toutes les autres routes (modification, export, import,
+tableau de bord, /health, /metrics) sont transmises à l'application Flask
+(run.app) via WsgiToAsgi, qui les exécute dans un pool de threads.
+"""
+
+from asgiref.wsgi import WsgiToAsgi  # type: ignore
+
+from async_app.app import create_async_app
+from async_app.routes import ASYNC_PATHS
+from run import app as wsgi_app
+
+async_app = create_async_app()
+wsgi_fallback = WsgiToAsgi(wsgi_app)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await async_app(scope, receive, send)
+    path = scope.get('path', '')
+    if scope['type'] == 'http' and (path in ASYNC_PATHS or path.startswith('/static/')):
+        return await async_app(scope, receive, send)
+    return await wsgi_fallback(scope, receive, send)
@@ -0,0 +1,55 @@
+# async_app/app.py
+"""Application Quart : routes asynchrones RH / VOH + page d'accueil (voir asgi.py)."""
+
+from quart import Blueprint, Quart, render_template, request
+from quart.wrappers.response import DataBody
+
+from async_app.db import close_async_pool, init_async_pool
+from async_app.routes import ROOT, _served_by_wsgi, rh_async_bp, voh_async_bp
+from config import Config
+from http_cache import choose_encoding, compress, compressible
+
+
+def create_async_app():
+    app = Quart(__name__, root_path=ROOT, static_folder='static', template_folder='templates')
+    app.config.from_object(Config)
+
+    # Pool asyncpg créé dans la boucle d'événements du serveur
+    @app.before_serving
+    async def _open_pool():
+        await init_async_pool(app)
+
+    @app.after_serving
+    async def _close_pool():
+        await close_async_pool(app)
+
+    # Compression gzip / brotli, comme http_cache.init_http_cache côté WSGI
+    @app.after_request
+    async def _compress(response):
+        if not compressible(response) or not isinstance(response.response, DataBody):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = await response.get_data()
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None or len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    app.register_blueprint(rh_async_bp, url_prefix="/rh")
+    app.register_blueprint(voh_async_bp, url_prefix="/voh")
+
+    # Tableau de bord et KPI servis par l'application WSGI : déclarés pour url_for() uniquement
+    dashboard_bp = Blueprint('dashboard', __name__)
+    dashboard_bp.add_url_rule('/', 'index', _served_by_wsgi)
+    app.register_blueprint(dashboard_bp, url_prefix="/dashboard")
+    kpi_bp = Blueprint('kpi', __name__)
+    kpi_bp.add_url_rule('/', 'index', _served_by_wsgi)
+    app.register_blueprint(kpi_bp, url_prefix="/kpi")
+
+    @app.route('/')
+    async def home():
+        return await render_template('home.html')
+
+    return app
@@ -0,0 +1,236 @@
+# async_app/db.py
+"""
+Accès PostgreSQL asynchrone (asyncpg) pour la variante ASGI des blueprints.
+
+Le pool est créé au démarrage du serveur (before_serving) dans la boucle
+d'événements qui le servira ; chaque requête SQL emprunte une connexion le
+temps de l'appel, ce qui permet de lancer plusieurs requêtes d'une même page
+en parallèle (asyncio.gather) sans thread par requête.
+
+Les constantes SQL des blueprints synchrones (paramètres %s / %(nom)s,
+style psycopg2) sont réutilisées telles quelles : to_asyncpg() les convertit
+en paramètres positionnels $1, $2...
+
+Réplique en lecture (DB_REPLICA_DSN) : fetch() ne sert que des lectures et
+passe par la réplique, avec les mêmes règles que la variante synchrone
+(session épinglée au primaire après une écriture, mise à l'écart après une
+erreur ou un retard excessif). Les écritures empruntent get_async_pool().
+"""
+
+import asyncio
+import logging
+import re
+import time
+
+import asyncpg  # type: ignore
+from quart import current_app, request, session
+
+from config import Config
+from db import REPLICA_LAG_SQL, replica_connect_kwargs
+from ids import RESERVE_SQL, encode, random_ids
+
+logger = logging.getLogger(__name__)
+
+_PARAM = re.compile(r'%\((\w+)\)s|%s')
+
+# Types PostgreSQL des colonnes insérées (INSERT ... SELECT * FROM unnest(...))
+COLUMN_TYPES = {
+    'ID': 'varchar', 'BU': 'varchar', 'Production_line': 'varchar',
+    'Department_function': 'varchar', 'Type': 'varchar', 'DL_Headcount': 'int4',
+    'H100': 'float8', 'H125': 'float8', 'H150': 'float8', 'H200': 'float8',
+    'WeekNo': 'varchar', 'Import_Date': 'date', 'Year': 'int4',
+}
+
+
+def to_asyncpg(sql, params=()):
+    """SQL psycopg2 (%s ou %(nom)s) -> (SQL asyncpg avec $n, liste d'arguments)."""
+    args, positions = [], {}
+    values = iter(params) if not isinstance(params, dict) else None
+
+    def replace(match):
+        name = match.group(1)
+        if name is None:
+            args.append(next(values))
+            return f"${len(args)}"
+        if name not in positions:
+            args.append(params[name])
+            positions[name] = len(args)
+        return f"${positions[name]}"
+
+    return _PARAM.sub(replace, sql), args
+
+
+def _connect_kwargs(cfg):
+    return dict(
+        host=cfg['DB_HOST'],
+        port=cfg['DB_PORT'],
+        database=cfg['DB_DATABASE'],
+        user=cfg['DB_LOGIN'],
+        password=cfg['DB_PASSWORD'],
+        sslmode=cfg['SSL_MODE'],
+    )
+
+
+async def _create_pool(cfg, connect_kwargs, min_size):
+    sslmode = connect_kwargs.pop('sslmode', 'disable')
+    connect_kwargs['port'] = int(connect_kwargs['port'])
+    return await asyncpg.create_pool(
+        **connect_kwargs,
+        ssl=None if sslmode == 'disable' else sslmode,
+        min_size=min_size,
+        max_size=cfg['DB_POOL_MAX'],
+        max_inactive_connection_lifetime=cfg['DB_POOL_MAX_IDLE'],
+        timeout=cfg['DB_POOL_TIMEOUT'],
+    )
+
+
+async def _recycle(pools, lifetime):
+    """
+    Durée de vie maximale (DB_POOL_MAX_LIFETIME, comme db.ConnectionPool) : asyncpg ne
+    connaît que l'inactivité. Toutes les `lifetime` secondes, les connexions ouvertes sont
+    périmées ; chacune est remplacée à son prochain emprunt (ou fermée à sa restitution
+    si elle est en cours d'utilisation), aucune ne dépasse donc `lifetime`.
+    """
+    while True:
+        await asyncio.sleep(lifetime)
+        for pool in pools:
+            await pool.expire_connections()
+
+
+async def init_async_pool(app):
+    cfg = app.config
+    app.extensions['async_db_pool'] = await _create_pool(cfg, _connect_kwargs(cfg), cfg['DB_POOL_MIN'])
+    if cfg['DB_REPLICA_DSN']:
+        # aucune connexion ouverte d'avance : une réplique injoignable n'empêche pas le démarrage
+        replica_kwargs = replica_connect_kwargs(_connect_kwargs(cfg), cfg['DB_REPLICA_DSN'])
+        app.extensions['async_db_replica'] = await _create_pool(cfg, replica_kwargs, 0)
+        app.after_request(pin_primary_after_write)
+    if cfg['DB_POOL_MAX_LIFETIME']:
+        pools = [app.extensions[name] for name in ('async_db_pool', 'async_db_replica') if name in app.extensions]
+        app.extensions['async_db_recycler'] = asyncio.get_running_loop().create_task(
+            _recycle(pools, cfg['DB_POOL_MAX_LIFETIME'])
+        )
+
+
+async def close_async_pool(app):
+    recycler = app.extensions.pop('async_db_recycler', None)
+    if recycler is not None:
+        recycler.cancel()
+    for name in ('async_db_pool', 'async_db_replica'):
+        pool = app.extensions.pop(name, None)
+        if pool is not None:
+            await pool.close()
+
+
+def get_async_pool():
+    return current_app.extensions['async_db_pool']
+
+
+# -----------------------------------------------------------------------------
+# Réplique en lecture (même règles que db.ReplicaRouter)
+# -----------------------------------------------------------------------------
+_replica_state = {'down_until': 0.0, 'checked_at': 0.0, 'lagging': False}
+
+
+def _mark_replica_down(reason):
+    cfg = current_app.config
+    if time.monotonic() >= _replica_state['down_until']:
+        logger.warning("Réplique écartée %.0f s, lectures sur le primaire : %s", cfg['DB_REPLICA_RETRY_SECONDS'], reason)
+    _replica_state['down_until'] = time.monotonic() + cfg['DB_REPLICA_RETRY_SECONDS']
+
+
+def get_async_read_pool():
+    """Pool de la réplique si elle est configurée, saine et que la session n'est pas épinglée au primaire."""
+    replica = current_app.extensions.get('async_db_replica')
+    if replica is None or time.monotonic() < _replica_state['down_until']:
+        return None
+    if session.get('db_primary_until', 0) > time.time():
+        return None
+    return replica
+
+
+async def pin_primary_after_write(response):
+    """Lecture de ses propres écritures : voir db.pin_primary_after_write."""
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        session['db_primary_until'] = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
+    return response
+
+
+async def _fetch_replica(replica, query, args):
+    cfg = current_app.config
+    async with replica.acquire(timeout=cfg['DB_POOL_TIMEOUT']) as conn:
+        now = time.monotonic()
+        if cfg['DB_REPLICA_MAX_LAG'] and now - _replica_state['checked_at'] >= cfg['DB_REPLICA_HEALTH_CHECK_INTERVAL']:
+            _replica_state['checked_at'] = now
+            lag = float(await conn.fetchval(REPLICA_LAG_SQL))
+            lagging, _replica_state['lagging'] = _replica_state['lagging'], lag > cfg['DB_REPLICA_MAX_LAG']
+            if lagging and _replica_state['lagging']:  # deux mesures consécutives
+                _mark_replica_down(f"retard de réplication {lag:.1f} s > {cfg['DB_REPLICA_MAX_LAG']:.0f} s")
+                return None
+        return await conn.fetch(query, *args)
+
+
+async def fetch(sql, params=()):
+    """
+    Exécute une requête de lecture sur une connexion empruntée le temps de l'appel :
+    sur la réplique si possible (repli sur le primaire en cas d'erreur de connexion ou de retard).
+    """
+    query, args = to_asyncpg(sql, params)
+    replica = get_async_read_pool()
+    if replica is not None:
+        try:
+            rows = await _fetch_replica(replica, query, args)
+            if rows is not None:
+                return rows
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError) as e:
+            _mark_replica_down(e)
+    async with get_async_pool().acquire(timeout=current_app.config['DB_POOL_TIMEOUT']) as conn:
+        return await conn.fetch(query, *args)
+
+
+async def allocate_ids(conn, year, count, exclude=()):
+    """Équivalent asyncio de ids.allocate()."""
+    if Config.ID_ALLOCATION != 'sequence':
+        return random_ids(year, count, exclude=exclude)
+    query, args = to_asyncpg(RESERVE_SQL, (count,))
+    values = await conn.fetch(query, *args)
+    allocated = [rid for rid in (encode(year, r[0]) for r in values) if rid not in exclude]
+    if len(allocated) < count:
+        allocated += await allocate_ids(conn, year, count - len(allocated), exclude)
+    return allocated
+
+
+async def insert_with_short_ids(conn, table, columns, rows, year, max_tries=5):
+    """
+    Équivalent asyncio de db.bulk_insert_with_short_ids : un seul INSERT ... unnest()
+    par tentative, seules les lignes dont l'ID a collisionné sont réessayées.
+    `rows` ne contient pas l'ID (ajouté en tête). Retourne les ID dans l'ordre des lignes.
+    """
+    cols = ('ID',) + tuple(columns)
+    col_list = ", ".join(f'"{c}"' for c in cols)
+    arrays = ", ".join(f"${i}::{COLUMN_TYPES[c]}[]" for i, c in enumerate(cols, start=1))
+    sql = (
+        f"INSERT INTO public.{table} ({col_list}) SELECT * FROM unnest({arrays}) "
+        'ON CONFLICT ("ID") DO NOTHING RETURNING "ID"'
+    )
+
+    rows = [tuple(r) for r in rows]
+    ids = [None] * len(rows)
+    pending = list(range(len(rows)))
+
+    for _ in range(max_tries):
+        if not pending:
+            break
+        used = set(i for i in ids if i is not None)
+        # un lot d'ID distincts, sans doublon avec ceux déjà attribués
+        for idx, rid in zip(pending, await allocate_ids(conn, year, len(pending), exclude=used)):
+            ids[idx] = rid
+        batch = [(ids[idx],) + rows[idx] for idx in pending]
+
+        returned = await conn.fetch(sql, *[list(column) for column in zip(*batch)])
+        inserted = {r['ID'] for r in returned}
+        pending = [idx for idx in pending if ids[idx] not in inserted]
+
+    if pending:
+        raise RuntimeError("Impossible de générer un ID court unique après plusieurs tentatives.")
+    return ids
@@ -0,0 +1,334 @@
+# async_app/routes.py
+"""
+Variante asynchrone (Quart + asyncpg) des routes chaudes des blueprints RH et VOH :
+page d'accueil (saisie hebdomadaire + filtres) et API de listing paginée.
+
+Les blueprints portent les mêmes noms ('rh', 'voh') et les mêmes templates que
+la version synchrone ; les routes moins sollicitées (modification, export,
+import) et les colonnes de la grille (api_columns, servies depuis le cache de
+fragments du worker) restent servies par l'application WSGI (voir asgi.py) et
+ne sont déclarées ici que pour url_for().
+
+Sur une même page, les requêtes indépendantes (années saisies, bannière)
+partent en parallèle, chacune sur sa propre connexion du pool.
+
+Les POST passent par le même limiteur et les mêmes clés d'idempotence que la
+version WSGI (write_guard.guard, configuré par run.create_app) : l'état
+partagé dans PostgreSQL est lu et écrit dans un thread (asyncio.to_thread).
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime
+from functools import wraps
+
+import asyncpg  # type: ignore
+from quart import (Blueprint, abort, flash, get_flashed_messages, jsonify, make_response, redirect,
+                   render_template, request, session, url_for)
+
+import history
+import http_cache
+import write_guard
+from async_app.db import fetch, get_async_pool, insert_with_short_ids, to_asyncpg
+from cache import filled_weeks
+from pagination import build_filters, page_query, parse_limit, serialize_row, split_page
+from registry import REGISTRY_TABLE, registry
+from rh_app import routes as rh
+from jobs import enqueue_query, wake as wake_jobs
+from voh_app import routes as voh
+from write_guard import guard
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+rh_async_bp = Blueprint('rh', __name__, template_folder=os.path.join(ROOT, 'rh_app', 'templates'))
+voh_async_bp = Blueprint('voh', __name__, template_folder=os.path.join(ROOT, 'voh_app', 'templates'))
+
+# Colonnes insérées (ordre de build_week_rows, sans l'ID)
+RH_INSERT_COLUMNS = ("BU", "Production_line", "DL_Headcount", "H100", "H125", "H150", "H200",
+                     "WeekNo", "Import_Date", "Year")
+VOH_INSERT_COLUMNS = ("BU", "Department_function", "Type", "DL_Headcount", "H100", "H125", "H150", "H200",
+                      "WeekNo", "Import_Date", "Year")
+
+# Routes servies par l'application WSGI (asgi.py) : déclarées pour url_for() uniquement
+WSGI_ROUTES = [
+    ('/update/<string:id>', 'update', ['GET', 'POST']),
+    ('/export.<fmt>', 'export', ['GET']),
+    ('/import', 'import_weeks', ['GET', 'POST']),
+    ('/api/columns', 'api_columns', ['GET']),
+    ('/week/<string:weekno>', 'edit_week', ['GET', 'POST']),
+]
+
+# Chemins servis par cette variante (le reste est transmis à l'application WSGI)
+ASYNC_PATHS = {'/', '/rh/', '/voh/', '/rh/api/metrics', '/voh/api/metrics'}
+
+
+async def _served_by_wsgi(**kwargs):
+    abort(404)
+
+
+for _bp in (rh_async_bp, voh_async_bp):
+    for _rule, _endpoint, _methods in WSGI_ROUTES:
+        _bp.add_url_rule(_rule, _endpoint, _served_by_wsgi, methods=_methods)
+
+
+# -----------------------------------------------------------------------------
+# Requêtes partagées
+# -----------------------------------------------------------------------------
+async def catalog(source):
+    return await registry.get_async(source, get_async_pool())
+
+
+async def week_is_filled(table, filled_sql, year, weekno):
+    """Sonde de la bannière, même cache que la version synchrone."""
+    found, value = filled_weeks.get((table, year, weekno))
+    if found:
+        return value
+    value = bool(await fetch(filled_sql, (year, weekno)))
+    filled_weeks.set((table, year, weekno), value)
+    return value
+
+
+async def insert_week(table, source, columns, rows, year, weekno):
+    """INSERT de la semaine + travail de fond des agrégats, dans une transaction."""
+    context = json.dumps(history.request_context(request), default=str)
+    async with get_async_pool().acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(*_flatten(to_asyncpg(history.CONTEXT_SQL, (context,))))
+            await insert_with_short_ids(conn, table, columns, rows, year)
+            job = enqueue_query('refresh_rollup', {'source': source, 'year': year, 'weeks': [weekno]})
+            await conn.execute(*_flatten(to_asyncpg(*job)))
+    wake_jobs()
+    filled_weeks.set((table, year, weekno), True)  # write-through : la semaine est saisie
+
+
+def _flatten(query):
+    sql, args = query
+    return (sql, *args)
+
+
+async def handle_insert(table, source, columns, build_rows, lines, success_message):
+    """POST du formulaire hebdomadaire ; retourne une redirection ou None (erreur flashée)."""
+    form = await request.form
+    weekno = form.get('weekno', '')
+    year = rh.current_year()
+    try:
+        rows = build_rows(form, lines, weekno, datetime.now().date(), year)
+        await insert_week(table, source, columns, rows, year, weekno)
+        await flash(success_message.format(year=year), "success")
+        return redirect(url_for(f'{request.blueprint}.index', filled_week=weekno))
+    except asyncpg.UniqueViolationError:
+        await flash(f"⚠️ Erreur : Des données existent déjà pour la semaine {weekno} de {year}. Veuillez modifier les données existantes si besoin.", 'warning')
+    except ValueError as ve:
+        await flash(f"❌ Erreur de saisie : Veuillez vérifier que tous les champs numériques sont corrects. Détails : {ve}", 'danger')
+    except RuntimeError as rid_err:
+        await flash(f"❌ Erreur lors de la génération d'ID : {rid_err}", 'danger')
+    except asyncpg.PostgresError as db_error:
+        await flash(f"❌ Erreur de base de données : {db_error}", 'danger')
+    return None
+
+
+def conditional(*tables, key=None):
+    """Équivalent asyncio de http_cache.conditional (`key` : coroutine) ; mêmes ETag que la version WSGI."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return await view(*args, **kwargs)
+            try:
+                rows = await fetch(http_cache.VERSION_SQL, (list(tables),))
+                etag, last_modified = http_cache.validators([tuple(r) for r in rows],
+                                                            await key() if key else ())
+            except (asyncpg.PostgresError, OSError, asyncio.TimeoutError):
+                return await view(*args, **kwargs)
+
+            if http_cache.is_fresh(request, etag, last_modified):
+                return http_cache.set_validators(await make_response('', 304), etag, last_modified)
+            response = await make_response(await view(*args, **kwargs))
+            if response.status_code != 200 or get_flashed_messages():
+                return response
+            return http_cache.set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+async def _guard_call(method, *args):
+    # stockage PostgreSQL (psycopg2, bloquant) : hors de la boucle d'événements
+    if guard.shared:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+def guarded_write(view):
+    """Équivalent asyncio de write_guard.guarded_write."""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        if request.method != 'POST':
+            return await view(*args, **kwargs)
+
+        retry_after = await _guard_call(guard.take, write_guard.client_key(request))
+        if retry_after:
+            await flash(write_guard.RATE_LIMITED_MESSAGE.format(seconds=write_guard.retry_after_header(retry_after)),
+                        'warning')
+            response = redirect(request.url)
+            response.headers['Retry-After'] = write_guard.retry_after_header(retry_after)
+            return response
+
+        key = write_guard.submission_key(request, await request.form)
+        if key is None:
+            return await view(*args, **kwargs)
+
+        deadline = asyncio.get_running_loop().time() + guard.wait
+        while (existing := await _guard_call(guard.claim, key)) is not None:
+            state, result = existing
+            if state == 'done':
+                guard.count('replayed')
+                for category, message in result['flashes']:
+                    await flash(message, category)
+                response = redirect(result['location'])
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+            if asyncio.get_running_loop().time() >= deadline:
+                guard.count('in_flight')
+                await flash(write_guard.IN_FLIGHT_MESSAGE, 'warning')
+                return redirect(request.url)
+            await asyncio.sleep(write_guard.WAIT_STEP)
+
+        flashes_before = len(session.get('_flashes', []))
+        try:
+            response = await make_response(await view(*args, **kwargs))
+        except Exception:
+            await _guard_call(guard.release, key)
+            raise
+        flashes = write_guard.new_flashes(session, get_flashed_messages, flashes_before)
+        result = write_guard.recorded_result(response, flashes, request.url)
+        if result is not None:
+            await _guard_call(guard.complete, key, result)
+        else:
+            await _guard_call(guard.release, key)
+        return response
+    return wrapper
+
+
+async def api_page(select_sql, filter_columns, args, is_editable):
+    try:
+        clauses, params = build_filters(args, filter_columns)
+        limit = parse_limit(args.get('limit'))
+        sql, params = page_query(select_sql, clauses, params, args.get('cursor'), limit)
+        rows, next_cursor = split_page(await fetch(sql, params), limit)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    except asyncpg.PostgresError as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+
+    items = []
+    for row in rows:
+        item = serialize_row(row)
+        item['editable'] = is_editable(row)
+        items.append(item)
+    return jsonify(items=items, next_cursor=next_cursor)
+
+
+# -----------------------------------------------------------------------------
+# RH
+# -----------------------------------------------------------------------------
+async def _rh_index_key():
+    return (rh.current_year(), rh.current_prev_week_label(), (await catalog('DL')).version)
+
+
+async def _rh_api_key():
+    return (rh.current_year(), rh.current_prev_week_label())
+
+
+@rh_async_bp.route('/', methods=['GET', 'POST'])
+@guarded_write
+@conditional(rh.TABLE, REGISTRY_TABLE, key=_rh_index_key)
+async def index():
+    this_year = rh.current_year()
+    lines, banner_week = None, None
+    try:
+        lines = await catalog('DL')
+        if request.method == 'POST':
+            response = await handle_insert(
+                rh.TABLE, 'DL', RH_INSERT_COLUMNS, rh.build_week_rows, lines,
+                "Toutes les lignes Valeo + Nidec {year} ont été enregistrées avec succès !")
+            if response is not None:
+                return response
+
+        banner_week = request.args.get('filled_week')
+        default_week = rh.current_prev_week_label()
+        if not banner_week and await week_is_filled(rh.TABLE, rh.FILLED_WEEK_SQL, this_year, default_week):
+            banner_week = default_week
+    except Exception as e:
+        await flash(f"❌ Erreur système : {e}", 'danger')
+
+    return await render_template(
+        'rh/index.html',
+        lines=lines,
+        this_year=this_year,
+        editable_week=rh.editable_week(),
+        filled_week=banner_week
+    )
+
+
+@rh_async_bp.route('/api/metrics')
+@conditional(rh.TABLE, key=_rh_api_key)
+async def api_metrics():
+    args = request.args.to_dict()
+    args.setdefault('year', str(rh.current_year()))
+    return await api_page(rh.SELECT_SQL, rh.FILTER_COLUMNS, args, rh.is_editable)
+
+
+# -----------------------------------------------------------------------------
+# VOH
+# -----------------------------------------------------------------------------
+async def _voh_index_key():
+    return (voh.current_year(), voh.current_prev_week_label(), (await catalog('VOH')).version)
+
+
+async def _voh_api_key():
+    return (voh.current_year(), voh.current_prev_week_label())
+
+
+@voh_async_bp.route('/', methods=['GET', 'POST'], endpoint='index')
+@guarded_write
+@conditional(voh.TABLE, REGISTRY_TABLE, key=_voh_index_key)
+async def voh_index():
+    this_year = voh.current_year()
+    functions, years, filled_week = None, [], None
+    try:
+        functions = await catalog('VOH')
+        if request.method == 'POST':
+            response = await handle_insert(
+                voh.TABLE, 'VOH', VOH_INSERT_COLUMNS, voh.build_week_rows, functions,
+                "✅ Toutes les lignes ont été enregistrées avec succès !")
+            if response is not None:
+                return response
+
+        filled_week = request.args.get('filled_week')
+        default_week = voh.current_prev_week_label()
+        year_rows, filled = await asyncio.gather(
+            fetch(voh.YEARS_SQL),
+            week_is_filled(voh.TABLE, voh.FILLED_WEEK_SQL, this_year, default_week) if not filled_week
+            else asyncio.sleep(0, False),
+        )
+        years = sorted((int(r[0]) for r in year_rows), reverse=True)
+        if not filled_week and filled:
+            filled_week = default_week
+    except Exception as e:
+        await flash(f"❌ Erreur système : {e}", 'danger')
+
+    return await render_template(
+        'voh/index.html',
+        years=years,
+        functions=functions,
+        this_year=this_year,
+        editable_week=voh.editable_week(),
+        filled_week=filled_week
+    )
+
+
+@voh_async_bp.route('/api/metrics', endpoint='api_metrics')
+@conditional(voh.TABLE, key=_voh_api_key)
+async def voh_api_metrics():
+    return await api_page(voh.SELECT_SQL, voh.FILTER_COLUMNS, request.args, voh.is_editable)
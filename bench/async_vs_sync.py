@@ -0,0 +1,90 @@
+# bench/async_vs_sync.py
+"""
+Banc de charge : routes synchrones (Flask, run:app) contre variante asynchrone (asgi:application).
+
+Lancer les deux serveurs sur la même base, avec le même nombre de workers, ex :
+
+    gunicorn -w 2 --threads 8 -b 127.0.0.1:8002 run:app          # synchrone
+    hypercorn -w 2 -b 127.0.0.1:8001 asgi:application             # asynchrone
+
+puis :
+
+    python bench/async_vs_sync.py --sync http://127.0.0.1:8002 --async http://127.0.0.1:8001 \
+        --concurrency 50 --requests 2000
+
+Chaque chemin est chargé séparément (après un échauffement) ; le rapport donne
+req/s, p50, p95, p99 et le nombre d'erreurs par cible.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx  # type: ignore
+
+DEFAULT_PATHS = ['/rh/', '/voh/', '/rh/api/metrics', '/voh/api/metrics?limit=50']
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+async def load(base_url, path, concurrency, total, warmup):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        for _ in range(warmup):
+            await client.get(path)
+
+        latencies, errors = [], 0
+        remaining = total
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': statistics.median(latencies) * 1000 if latencies else float('nan'),
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'errors': errors,
+    }
+
+
+async def main(args):
+    targets = [(name, url) for name, url in (('sync', args.sync), ('async', args.async_)) if url]
+    print(f"{'chemin':<28} {'cible':<6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erreurs':>8}")
+    for path in args.paths:
+        for name, url in targets:
+            r = await load(url, path, args.concurrency, args.requests, args.warmup)
+            print(f"{path:<28} {name:<6} {r['rps']:>9.1f} {r['p50']:>9.1f} {r['p95']:>9.1f} "
+                  f"{r['p99']:>9.1f} {r['errors']:>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sync', help="URL de base de l'application synchrone")
+    parser.add_argument('--async', dest='async_', help="URL de base de la variante asynchrone")
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000, help="requêtes par chemin et par cible")
+    parser.add_argument('--warmup', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+# bench/ids.py
+"""
+Micro-banc des générateurs d'ID courts (ids.py) contre l'ancienne fonction
+des blueprints (un secrets.choice() par caractère).
+
+    python -m bench.ids --count 1000 --repeat 20
+
+Pour chaque variante : temps pour produire `--count` ID (meilleur de
+`--repeat` passes), temps par ID et gain par rapport à l'ancienne fonction.
+Le mode séquence est mesuré sans l'aller-retour en base (encodage seul).
+"""
+
+import argparse
+import secrets
+import timeit
+
+from ids import ALPHABET, encode, new_id_year_prefixed, random_ids, year_prefix
+
+YEAR = 2025
+
+
+def legacy_new_id(year: int, core_len: int = 8) -> str:
+    """Ancienne version (rh_app / voh_app) : 8 appels à secrets.choice par ID."""
+    core = "".join(secrets.choice(ALPHABET) for _ in range(core_len))
+    return f"{year_prefix(year)}{core}"
+
+
+def legacy_batch(count):
+    used = set()
+    for _ in range(count):
+        rid = legacy_new_id(YEAR)
+        while rid in used:
+            rid = legacy_new_id(YEAR)
+        used.add(rid)
+    return used
+
+
+def variants(count):
+    return {
+        'legacy (secrets.choice x8)': lambda: legacy_batch(count),
+        'new_id_year_prefixed (1 par appel)': lambda: [new_id_year_prefixed(YEAR) for _ in range(count)],
+        'random_ids (lot)': lambda: random_ids(YEAR, count),
+        'encode (séquence, hors base)': lambda: [encode(YEAR, v) for v in range(1, count + 1)],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-banc des générateurs d'ID courts.")
+    parser.add_argument('--count', type=int, default=1000, help="ID produits par passe")
+    parser.add_argument('--repeat', type=int, default=20, help="passes (le meilleur temps est retenu)")
+    args = parser.parse_args(argv)
+
+    assert len(set(random_ids(YEAR, args.count))) == args.count
+    assert len({encode(YEAR, v) for v in range(1, args.count + 1)}) == args.count
+
+    results = {name: min(timeit.repeat(fn, number=1, repeat=args.repeat)) for name, fn in variants(args.count).items()}
+    baseline = results['legacy (secrets.choice x8)']
+    print(f"{'variante':<38}{'total (ms)':>12}{'µs / ID':>10}{'gain':>8}")
+    for name, seconds in results.items():
+        print(f"{name:<38}{seconds * 1000:>12.3f}{seconds / args.count * 1e6:>10.3f}{baseline / seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# bench/pg.py
+"""
+Base PostgreSQL jetable pour les bancs de charge.
+
+Deux modes :
+- LocalPostgres : instance privée (initdb + pg_ctl) dans un répertoire
+  temporaire, détruite à la fin (binaires trouvés via --pg-bin, $PG_BIN,
+  `pg_config --bindir` ou le PATH ; initdb refuse de tourner en root) ;
+- ScratchDatabase : base `bench_<pid>` créée sur un serveur existant (ex :
+  conteneur `docker run -p 5433:5432 -e POSTGRES_HOST_AUTH_METHOD=trust postgres:16`),
+  supprimée à la fin.
+
+Les deux exposent settings() : valeurs à reporter dans Config avant
+d'importer run.py.
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+
+import psycopg2  # type: ignore
+from psycopg2 import sql  # type: ignore
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def find_pg_bin(explicit=None):
+    candidates = [explicit, os.environ.get('PG_BIN')]
+    try:
+        candidates.append(subprocess.check_output(['pg_config', '--bindir'], text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    which = shutil.which('pg_ctl')
+    if which:
+        candidates.append(os.path.dirname(which))
+    for path in candidates:
+        if path and os.path.exists(os.path.join(path, 'pg_ctl')):
+            return path
+    raise RuntimeError("Binaires PostgreSQL introuvables (--pg-bin ou $PG_BIN).")
+
+
+class LocalPostgres:
+    """Instance PostgreSQL privée, le temps du banc."""
+
+    def __init__(self, pg_bin=None, port=None, database='metrics_bench'):
+        self.bin = find_pg_bin(pg_bin)
+        self.port = port or _free_port()
+        self.database = database
+        self.root = None
+
+    def _run(self, name, *args):
+        subprocess.run([os.path.join(self.bin, name), *args], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def start(self):
+        self.root = tempfile.mkdtemp(prefix='vo_rh_bench_')
+        data = os.path.join(self.root, 'data')
+        self._run('initdb', '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-locale')
+        self._run('pg_ctl', '-D', data, '-l', os.path.join(self.root, 'postgres.log'), '-w',
+                  '-o', f"-p {self.port} -k {self.root} -c listen_addresses=127.0.0.1", 'start')
+        with psycopg2.connect(host='127.0.0.1', port=self.port, user='postgres', dbname='postgres') as conn:
+            conn.autocommit = True
+            conn.cursor().execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(self.database)))
+        return self
+
+    def stop(self):
+        if self.root:
+            self._run('pg_ctl', '-D', os.path.join(self.root, 'data'), '-m', 'fast', '-w', 'stop')
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.root = None
+
+    def settings(self):
+        return dict(DB_HOST='127.0.0.1', DB_PORT=self.port, DB_LOGIN='postgres', DB_PASSWORD='',
+                    DB_DATABASE=self.database, SSL_MODE='disable')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class ScratchDatabase:
+    """Base temporaire sur un serveur existant (conteneur, instance de dev)."""
+
+    def __init__(self, host, port, user, password=''):
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.database = f"bench_{os.getpid()}"
+
+    def _admin(self, statement):
+        conn = psycopg2.connect(host=self.host, port=self.port, user=self.user,
+                                password=self.password, dbname='postgres')
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(statement)
+        finally:
+            conn.close()
+
+    def start(self):
+        self._admin(sql.SQL("CREATE DATABASE {} ENCODING 'UTF8' TEMPLATE template0")
+                    .format(sql.Identifier(self.database)))
+        return self
+
+    def stop(self):
+        self._admin(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(self.database)))
+
+    def settings(self):
+        return dict(DB_HOST=self.host, DB_PORT=self.port, DB_LOGIN=self.user, DB_PASSWORD=self.password,
+                    DB_DATABASE=self.database, SSL_MODE='disable')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,81 @@
+# bench/seed.py
+"""
+Données synthétiques pour les bancs : plusieurs années de semaines complètes
+pour chaque ligne RH et chaque fonction VOH du référentiel.
+
+Le générateur est initialisé avec une graine fixe : deux exécutions avec les
+mêmes paramètres produisent exactement les mêmes tables (ID compris). L'année
+courante est remplie jusqu'à la semaine précédente, comme en production, pour
+que les routes update (limitées à l'année courante) aient des lignes à modifier.
+"""
+
+import csv
+import io
+import random
+from datetime import date, datetime, timedelta
+
+from migrations import migrate
+from registry import LOAD_SQL, build_catalog
+from ids import ALPHABET, year_prefix
+from rollups import rebuild_all
+
+TABLES = {
+    'DL': ('weekly_dl_metrics', ("ID", "BU", "Production_line", "DL_Headcount",
+                                 "H100", "H125", "H150", "H200", "WeekNo", "Import_Date", "Year")),
+    'VOH': ('weekly_voh_metrics', ("ID", "BU", "Department_function", "Type", "DL_Headcount",
+                                   "H100", "H125", "H150", "H200", "WeekNo", "Import_Date", "Year")),
+}
+
+
+def seed_weeks(this_year, years):
+    """(année, 'Wn', date de saisie) : `years` années pleines + l'année courante jusqu'à S-1."""
+    last_week = max(datetime.now().isocalendar()[1] - 1, 1)
+    for year in range(this_year - years, this_year + 1):
+        for n in range(1, (52 if year < this_year else last_week) + 1):
+            monday = date.fromisocalendar(year, n, 1)
+            yield year, f"W{n}", monday + timedelta(days=7)
+
+
+def _rows(rng, source, catalog, weeks):
+    for year, weekno, import_date in weeks:
+        for bu in catalog.bus:
+            for line in catalog.lines[bu]:
+                rid = year_prefix(year) + "".join(rng.choice(ALPHABET) for _ in range(8))
+                headcount = rng.randint(1, 40)
+                hours = [round(rng.uniform(0, 45) * headcount, 2)] + [round(rng.uniform(0, 6), 2) for _ in range(3)]
+                weighted = [hours[0], hours[1] * 1.25, hours[2] * 0.5, hours[3] * 2]
+                typed = (catalog.type_map[line],) if source == 'VOH' else ()
+                yield (rid, bu, line) + typed + (headcount, *weighted, weekno, import_date.isoformat(), year)
+
+
+def seed(conn, years=5, rng_seed=42):
+    """Migre le schéma puis charge les données synthétiques (COPY). Retourne {source: nb de lignes}."""
+    migrate(conn)
+    rng = random.Random(rng_seed)
+    this_year = datetime.now().year
+    weeks = list(seed_weeks(this_year, years))
+    counts = {}
+    with conn.cursor() as cur:
+        for source, (table, columns) in TABLES.items():
+            cur.execute(LOAD_SQL, (source,))
+            catalog = build_catalog(source, None, cur.fetchall())
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            n = 0
+            for row in _rows(rng, source, catalog, weeks):
+                writer.writerow(row)
+                n += 1
+            buffer.seek(0)
+            cur.execute(f"TRUNCATE public.{table}")
+            col_list = ", ".join(f'"{c}"' for c in columns)
+            cur.copy_expert(f"COPY public.{table} ({col_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+            counts[source] = n
+        rebuild_all(cur)
+    conn.commit()
+
+    old_autocommit = conn.autocommit
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE")
+    conn.autocommit = old_autocommit
+    return counts
@@ -0,0 +1,375 @@
+# bench/suite.py
+"""
+Banc de charge reproductible de l'application (base PostgreSQL locale jetable).
+
+    # instance privée (initdb + pg_ctl, hors root)
+    python -m bench.suite --pg-bin /usr/lib/postgresql/16/bin
+    # ou base temporaire sur un serveur existant (conteneur, instance de dev)
+    python -m bench.suite --host 127.0.0.1 --port 5433 --user postgres
+
+Étapes :
+1. base jetable, migrations, `--years` années de semaines synthétiques (bench/seed.py) ;
+2. mode "client" : chaque scénario (rh.index, voh.index, API, update GET/POST,
+   POST hebdomadaires) est rejoué `--iterations` fois via le client de test Flask ;
+3. mode "http" : les scénarios GET sont chargés via un serveur WSGI threadé et
+   le générateur de bench/async_vs_sync.py (`--concurrency` clients) ;
+4. rapport : req/s, p50/p95/p99 (ms), requêtes SQL par requête HTTP (logs
+   JSON de instrumentation.py), enregistré dans `--output` (JSON, nommé par
+   date et commit) ; `--compare FICHIER` signale les régressions au-delà de
+   `--threshold` % et sort en erreur.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from bench.pg import LocalPostgres, ScratchDatabase
+from config import Config
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+BENCH_WEEK_PREFIX = 'X'  # semaines des POST hebdomadaires (X001, X002...), supprimées en fin de banc
+
+
+# -----------------------------------------------------------------------------
+# Requêtes SQL par requête HTTP (logs JSON de instrumentation.py)
+# -----------------------------------------------------------------------------
+class QueryCapture(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self._lock = threading.Lock()
+        self.counts = []
+
+    def emit(self, record):
+        try:
+            payload = json.loads(record.getMessage())
+        except ValueError:
+            return
+        with self._lock:
+            self.counts.append(payload.get('db_queries', 0))
+
+    def reset(self):
+        with self._lock:
+            counts, self.counts = self.counts, []
+        return counts
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+def summarize(latencies, elapsed, errors, queries):
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50': round(statistics.median(latencies) * 1000, 2),
+        'p95': round(percentile(latencies, 95) * 1000, 2),
+        'p99': round(percentile(latencies, 99) * 1000, 2),
+        'errors': errors,
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+# -----------------------------------------------------------------------------
+# Scénarios
+# -----------------------------------------------------------------------------
+def _update_form(row, line_column, typed):
+    form = {
+        'id': row['ID'], 'bu': row['BU'], line_column.lower(): row[line_column],
+        'dl_headcount': row['DL_Headcount'], 'weekno': row['WeekNo'],
+        'h100': row['H100'], 'h125': row['H125'] / 1.25, 'h150': row['H150'] / 0.5, 'h200': row['H200'] / 2,
+    }
+    if typed:
+        form['type'] = row['Type']
+    return form
+
+
+def _week_form(catalog, weekno):
+    form = {'weekno': weekno}
+    for bu in catalog.bus:
+        for line in catalog.lines[bu]:
+            form.update({f"{line}_dl_headcount": 12, f"{line}_h100": 420, f"{line}_h125": 6,
+                         f"{line}_h150": 2, f"{line}_h200": 1})
+    return form
+
+
+def build_scenarios(pool):
+    """(nom, méthode, chemin, fabrique de formulaire(i) ou None, statut attendu)."""
+    import psycopg2.extras  # type: ignore
+
+    from registry import catalog
+
+    this_year = datetime.now().year
+    samples = {}
+    with pool.connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        for table in ('weekly_dl_metrics', 'weekly_voh_metrics'):
+            cur.execute(f'SELECT * FROM public.{table} WHERE "Year" = %s ORDER BY "Import_Date" DESC, "ID" LIMIT 1',
+                        (this_year,))
+            samples[table] = cur.fetchone()
+        dl, voh = catalog('DL', conn), catalog('VOH', conn)
+        conn.rollback()
+
+    rh_row, voh_row = samples['weekly_dl_metrics'], samples['weekly_voh_metrics']
+    rh_form = _update_form(rh_row, 'Production_line', False)
+    voh_form = _update_form(voh_row, 'Department_function', True)
+
+    def current_version(table, rid):
+        # le formulaire renvoie la version courante, comme après un GET (concurrence optimiste)
+        with pool.connection() as conn, conn.cursor() as c:
+            c.execute(f'SELECT "Version" FROM public.{table} WHERE "ID" = %s', (rid,))
+            version = c.fetchone()[0]
+            conn.rollback()
+        return version
+
+    def grid_form(row):
+        # toutes les lignes de la (BU, semaine) de `row`, modifiées : un seul UPDATE côté serveur
+        with pool.connection() as conn, conn.cursor() as c:
+            c.execute('SELECT "ID", "Version" FROM public.weekly_dl_metrics '
+                      'WHERE "Year" = %s AND "WeekNo" = %s AND "BU" = %s', (row['Year'], row['WeekNo'], row['BU']))
+            versions = c.fetchall()
+            conn.rollback()
+        form = {}
+        for rid, version in versions:
+            form.update({f"{rid}_version": version, f"{rid}_dl_headcount": 12, f"{rid}_h100": 420,
+                         f"{rid}_h125": 6, f"{rid}_h150": 2, f"{rid}_h200": 1})
+        return form
+    week = lambda i: f"{BENCH_WEEK_PREFIX}{i:03d}"  # noqa: E731
+    rh_grid = f"/rh/week/{rh_row['WeekNo']}?bu={rh_row['BU']}"
+
+    return [
+        ('rh.index', 'GET', '/rh/', None, 200),
+        ('voh.index', 'GET', '/voh/', None, 200),
+        ('rh.api_metrics', 'GET', '/rh/api/metrics', None, 200),
+        ('voh.api_metrics', 'GET', f'/voh/api/metrics?year={this_year}', None, 200),
+        ('rh.api_columns', 'GET', f'/rh/api/columns?year={this_year}', None, 200),
+        ('voh.api_columns', 'GET', f'/voh/api/columns?year={this_year}', None, 200),
+        ('dashboard.api_analytics', 'GET', f'/dashboard/api/analytics?year={this_year}', None, 200),
+        ('rh.update:get', 'GET', f"/rh/update/{rh_row['ID']}", None, 200),
+        ('voh.update:get', 'GET', f"/voh/update/{voh_row['ID']}", None, 200),
+        ('rh.update:post', 'POST', f"/rh/update/{rh_row['ID']}",
+         lambda i: dict(rh_form, version=current_version('weekly_dl_metrics', rh_row['ID'])), 302),
+        ('voh.update:post', 'POST', f"/voh/update/{voh_row['ID']}",
+         lambda i: dict(voh_form, version=current_version('weekly_voh_metrics', voh_row['ID'])), 302),
+        ('rh.edit_week:get', 'GET', rh_grid, None, 200),
+        ('rh.edit_week:post', 'POST', rh_grid, lambda i: grid_form(rh_row), 302),
+        ('rh.index:post', 'POST', '/rh/', lambda i: _week_form(dl, week(i)), 302),
+        ('voh.index:post', 'POST', '/voh/', lambda i: _week_form(voh, week(i)), 302),
+        # même clé d'idempotence à chaque itération : une insertion, puis des rejeux (write_guard.py)
+        ('rh.index:replay', 'POST', '/rh/',
+         lambda i: dict(_week_form(dl, week(999)), idempotency_key='bench-replay-key'), 302),
+    ]
+
+
+def cleanup(conn):
+    with conn.cursor() as cur:
+        for table in ('weekly_dl_metrics', 'weekly_voh_metrics', 'weekly_hours_rollup'):
+            cur.execute(f'DELETE FROM public.{table} WHERE "WeekNo" LIKE %s', (f"{BENCH_WEEK_PREFIX}%",))
+    conn.commit()
+
+
+# -----------------------------------------------------------------------------
+# Modes
+# -----------------------------------------------------------------------------
+def run_client(app, scenarios, capture, iterations, warmup):
+    client = app.test_client()
+    results = {}
+    offset = 0
+    for name, method, path, form, expected in scenarios:
+        for i in range(warmup if method == 'GET' else 0):
+            client.open(path, method=method)
+        capture.reset()
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for i in range(iterations):
+            data = form(offset + i + 1) if form else None
+            t0 = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code != expected:
+                errors += 1
+        elapsed = time.perf_counter() - started
+        if form and path in ('/rh/', '/voh/'):
+            offset += iterations
+        results[name] = summarize(latencies, elapsed, errors, capture.reset())
+    return results
+
+
+def run_http(app, scenarios, capture, requests, concurrency, warmup):
+    from werkzeug.serving import make_server
+
+    from bench.async_vs_sync import load
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    results = {}
+    try:
+        for name, method, path, form, expected in scenarios:
+            if method != 'GET':
+                continue
+            capture.reset()
+            r = asyncio.run(load(base_url, path, concurrency, requests, warmup))
+            queries = capture.reset()[warmup:]
+            results[name] = {
+                'requests': requests,
+                'rps': round(r['rps'], 1),
+                'p50': round(r['p50'], 2),
+                'p95': round(r['p95'], 2),
+                'p99': round(r['p99'], 2),
+                'errors': r['errors'],
+                'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+            }
+    finally:
+        server.shutdown()
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Rapport / comparaison
+# -----------------------------------------------------------------------------
+def print_table(results):
+    print(f"{'mode':<7} {'scénario':<18} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'SQL/req':>8} {'erreurs':>8}")
+    for mode, scenarios in results.items():
+        for name, r in scenarios.items():
+            q = '-' if r['queries_per_request'] is None else r['queries_per_request']
+            print(f"{mode:<7} {name:<18} {r['rps']:>8} {r['p50']:>8} {r['p95']:>8} {r['p99']:>8} "
+                  f"{q:>8} {r['errors']:>8}")
+
+
+def compare(current, baseline, threshold):
+    """Liste des régressions (p95 ou req/s dégradés de plus de `threshold` %, SQL/req en hausse)."""
+    regressions = []
+    for mode, scenarios in current.items():
+        for name, r in scenarios.items():
+            base = baseline.get(mode, {}).get(name)
+            if not base:
+                continue
+            if base['p95'] and (r['p95'] - base['p95']) / base['p95'] * 100 > threshold:
+                regressions.append(f"{mode}/{name} : p95 {base['p95']} -> {r['p95']} ms")
+            if base['rps'] and (base['rps'] - r['rps']) / base['rps'] * 100 > threshold:
+                regressions.append(f"{mode}/{name} : req/s {base['rps']} -> {r['rps']}")
+            if (base.get('queries_per_request') is not None and r['queries_per_request'] is not None
+                    and r['queries_per_request'] > base['queries_per_request']):
+                regressions.append(f"{mode}/{name} : SQL/req {base['queries_per_request']} -> "
+                                   f"{r['queries_per_request']}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de charge reproductible (PostgreSQL local jetable).")
+    parser.add_argument('--pg-bin', help="binaires PostgreSQL pour une instance privée (initdb/pg_ctl)")
+    parser.add_argument('--host', help="serveur existant : une base temporaire y est créée puis supprimée")
+    parser.add_argument('--port', type=int, default=5432)
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--years', type=int, default=5, help="années pleines de données synthétiques")
+    parser.add_argument('--iterations', type=int, default=50, help="requêtes par scénario (mode client, max 999 pour les POST)")
+    parser.add_argument('--requests', type=int, default=500, help="requêtes par scénario GET (mode http)")
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--modes', default='client,http')
+    parser.add_argument('--output', default=RESULTS_DIR)
+    parser.add_argument('--compare', help="fichier de résultats de référence")
+    parser.add_argument('--threshold', type=float, default=20.0, help="tolérance de régression (%%)")
+    args = parser.parse_args(argv)
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+
+    database = (ScratchDatabase(args.host, args.port, args.user, args.password) if args.host
+                else LocalPostgres(args.pg_bin))
+    with database:
+        for key, value in database.settings().items():
+            setattr(Config, key, value)
+        Config.DB_STARTUP_CHECK = False
+        Config.KPI_REFRESH_POLL = 0  # pas de rafraîchissement de fond pendant les mesures
+        Config.JOB_WORKERS = 0  # travaux de fond laissés en file : pas de thread concurrent des mesures
+        Config.WRITE_RATE_PER_MINUTE = 0  # POST répétés depuis une même adresse : pas de limiteur
+        Config.SLOW_QUERY_MS = 0
+        Config.DB_POOL_MAX = max(Config.DB_POOL_MAX, args.concurrency)
+
+        capture = QueryCapture()
+        requests_logger = logging.getLogger('metrics.requests')
+        requests_logger.addHandler(capture)
+        requests_logger.setLevel(logging.INFO)
+        requests_logger.propagate = False
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+        from run import create_app  # après la configuration de la base
+        from registry import registry
+        from bench.seed import seed
+
+        app = create_app()
+        db_pool = app.extensions['db_pool']
+        with db_pool.connection() as conn:
+            counts = seed(conn, years=args.years)
+            registry.invalidate()  # préchargé avant la migration : relire la table
+            cur = conn.cursor()
+            cur.execute("SHOW server_version")
+            server_version = cur.fetchone()[0]
+            conn.rollback()
+        scenarios = build_scenarios(db_pool)
+
+        results = {}
+        try:
+            if 'client' in modes:
+                results['client'] = run_client(app, scenarios, capture, min(args.iterations, 999), args.warmup)
+            if 'http' in modes:
+                results['http'] = run_http(app, scenarios, capture, args.requests, args.concurrency, args.warmup)
+        finally:
+            with db_pool.connection() as conn:
+                cleanup(conn)
+            db_pool.closeall()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'postgres': server_version,
+            'seed_rows': counts,
+            'args': {k: v for k, v in vars(args).items() if k != 'password'},
+        },
+        'results': results,
+    }
+    print_table(results)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{datetime.now():%Y%m%d-%H%M%S}_{report['meta']['git_revision']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats : {path}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"RÉGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"Aucune régression par rapport à {args.compare} (tolérance {args.threshold} %).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
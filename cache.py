@@ -0,0 +1,221 @@
+# cache.py
+"""
+Caches en mémoire du processus, avec durée de vie (TTL) et compteurs hit/miss.
+
+Chaque cache est enregistré par nom pour que /health puisse exposer ses
+statistiques. Les écritures des blueprints invalident (ou mettent à jour)
+les entrées concernées après COMMIT ; le TTL borne l'écart entre workers.
+
+FragmentCache : blocs JSON colonnaires des semaines closes de la grille
+(pagination.year_columns ; LRU sans TTL, persistance disque optionnelle).
+Chaque bloc est stocké avec sa signature, les versions de ses semaines
+(http_cache.week_versions) : une écriture faite par un autre worker, un
+import ou du SQL manuel change la signature, et le bloc périmé est
+simplement reconstruit. La semaine modifiable n'est jamais mise en cache.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+_caches = {}
+
+
+class TTLCache:
+    """Dictionnaire thread-safe à expiration, borné en taille (les plus anciennes entrées sortent)."""
+
+    def __init__(self, name, ttl, maxsize=1024):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        _caches[name] = self
+
+    def get(self, key):
+        """Retourne (trouvé, valeur)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._data[key]
+            self._misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        found, value = self.get(key)
+        if found:
+            return value
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._invalidations += 1
+
+    def invalidate_prefix(self, prefix):
+        """Supprime toutes les clés (tuples) commençant par `prefix`."""
+        n = len(prefix)
+        with self._lock:
+            for key in [k for k in self._data if k[:n] == prefix]:
+                del self._data[key]
+                self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 3) if lookups else 0.0,
+                'invalidations': self._invalidations,
+                'size': len(self._data),
+                'ttl': self.ttl,
+            }
+
+
+class FragmentCache:
+    """LRU thread-safe de fragments (JSON, texte) validés par signature ; copie sur disque si `directory`."""
+
+    def __init__(self, name, maxsize=512, directory=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.directory = directory
+        self._data = OrderedDict()  # key -> (signature, payload)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _caches[name] = self
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.frag')
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                stored_key, signature, payload = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, ValueError):
+            return None
+        return (signature, payload) if stored_key == key else None
+
+    def _write_disk(self, key, signature, payload):
+        # écriture atomique : les autres workers ne lisent jamais un fichier partiel
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, signature, payload), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def get(self, key, signature):
+        """Fragment s'il a été construit pour cette signature, sinon None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == signature:
+                self._data.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+        entry = self._read_disk(key) if self.directory else None
+        if entry is not None and entry[0] == signature:
+            self._store(key, entry)
+            with self._lock:
+                self._hits += 1
+            return entry[1]
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def set(self, key, signature, payload):
+        self._store(key, (signature, payload))
+        if self.directory:
+            self._write_disk(key, signature, payload)
+
+    def invalidate(self, key):
+        with self._lock:
+            found = self._data.pop(key, None) is not None
+        if self.directory:
+            try:
+                os.unlink(self._path(key))
+                found = True
+            except OSError:
+                pass
+        if found:
+            with self._lock:
+                self._invalidations += 1
+
+    def invalidate_prefix(self, prefix):
+        """Supprime les fragments en mémoire dont la clé commence par `prefix` (sur disque : la signature tranche)."""
+        n = len(prefix)
+        with self._lock:
+            for key in [k for k in self._data if k[:n] == prefix]:
+                del self._data[key]
+                self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 3) if lookups else 0.0,
+                'invalidations': self._invalidations,
+                'size': len(self._data),
+                'ttl': None,
+                'directory': self.directory,
+            }
+
+
+def all_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+# -----------------------------------------------------------------------------
+# Caches partagés
+# -----------------------------------------------------------------------------
+# Bannière "semaine déjà saisie" : (table, année, 'Wn') -> bool
+filled_weeks = TTLCache('filled_weeks', ttl=Config.FILLED_WEEK_CACHE_TTL)
+# Bloc JSON des semaines closes de la grille : (table, année) -> (versions des semaines, json)
+fragments = FragmentCache('fragments', maxsize=Config.FRAGMENT_CACHE_SIZE, directory=Config.FRAGMENT_CACHE_DIR)
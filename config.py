@@ -1,6 +1,7 @@
 # config.py
 
 import os
+import tempfile
 
 class Config:
     # Informations de connexion
@@ -14,5 +15,75 @@ class Config:
     # Changez à 'disable' si vous avez une erreur de connexion, pour débogage seulement.
     SSL_MODE = 'require' 
 
+    # Pool de connexions partagé (voir db.py)
+    DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+    DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))                 # attente max d'une connexion (s)
+    DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))     # recyclage (s)
+    DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))              # fermeture si inactive (s, asyncpg)
+    DB_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30))  # ping si inactive (s)
+
+    # Réplique en lecture (voir db.ReplicaRouter) : DSN libpq, ex "host=replica port=5432" (paramètres absents =
+    # ceux du primaire ; vide = pas de réplique), lecture sur le primaire après une écriture (s), mise à l'écart
+    # après une erreur (s), retard de réplication toléré (s, 0 = pas de contrôle) et intervalle de sa mesure (s)
+    DB_REPLICA_DSN = os.environ.get('DB_REPLICA_DSN', '')
+    DB_REPLICA_STICKY_SECONDS = float(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+    DB_REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', 30))
+    DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 10))
+    DB_REPLICA_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_HEALTH_CHECK_INTERVAL', 5))
+
+    # Auto-contrôle du schéma au démarrage (index manquants, plans EXPLAIN ; voir migrations.py)
+    DB_STARTUP_CHECK = os.environ.get('DB_STARTUP_CHECK', '1') == '1'
+
+    # Cache de la bannière "semaine déjà saisie" (s) ; invalidé par les insert/update
+    FILLED_WEEK_CACHE_TTL = float(os.environ.get('FILLED_WEEK_CACHE_TTL', 300))
+
+    # JSON colonnaire des semaines closes de la grille (voir cache.FragmentCache) : entrées en mémoire, répertoire de persistance (optionnel)
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 512))
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR') or None
+
+    # Référentiel des lignes / fonctions (voir registry.py) : revalidation de la version (s)
+    REGISTRY_TTL = float(os.environ.get('REGISTRY_TTL', 60))
+
+    # Instrumentation (voir instrumentation.py) : en-tête Server-Timing, seuil du log des requêtes lentes (ms, 0 = désactivé)
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+
+    # Compression gzip / brotli des réponses texte et JSON (voir http_cache.py) : taille minimale (octets)
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+
+    # Analyses de tendance (voir analytics.py) : fenêtre des moyennes glissantes (semaines), durée de vie des rapports mémorisés (s)
+    ANALYTICS_ROLLING_WEEKS = int(os.environ.get('ANALYTICS_ROLLING_WEEKS', 4))
+    ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 3600))
+
+    # Vue matérialisée du ratio indirects / directs (voir kpi.py) : détection des écritures (s, 0 = pas de thread), rafraîchissement forcé (s)
+    KPI_REFRESH_POLL = float(os.environ.get('KPI_REFRESH_POLL', 5))
+    KPI_REFRESH_INTERVAL = float(os.environ.get('KPI_REFRESH_INTERVAL', 3600))
+
+    # Travaux de fond (voir jobs.py) : threads par processus (0 = aucun), attente entre deux passages (s),
+    # tentatives, délai de base des reprises (s, doublé à chaque échec), bail d'un travail en cours (s), rétention (jours)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_BACKOFF_BASE = float(os.environ.get('JOB_BACKOFF_BASE', 5))
+    JOB_LEASE = float(os.environ.get('JOB_LEASE', 300))
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+
+    # Allocation des ID courts (voir ids.py) : 'random' ou 'sequence' (séquence short_id_seq, migration 10)
+    ID_ALLOCATION = os.environ.get('ID_ALLOCATION', 'random')
+
+    # Routes d'écriture (voir write_guard.py) : POST par minute et par client (0 = pas de limite), rafale tolérée,
+    # durée de mémorisation d'une soumission (s), attente d'une soumission identique en cours (s), adresse client
+    # lue dans X-Forwarded-For (derrière un proxy de confiance), état partagé dans PostgreSQL (migration 11)
+    WRITE_RATE_PER_MINUTE = float(os.environ.get('WRITE_RATE_PER_MINUTE', 30))
+    WRITE_RATE_BURST = int(os.environ.get('WRITE_RATE_BURST', 10))
+    IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 600))
+    IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 10))
+    WRITE_GUARD_TRUST_FORWARDED = os.environ.get('WRITE_GUARD_TRUST_FORWARDED', '0') == '1'
+    WRITE_GUARD_SHARED = os.environ.get('WRITE_GUARD_SHARED', '0') == '1'
+
+    # Cache de bytecode des templates Jinja (voir run.py) : répertoire, vide = désactivé
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'vo_rh_app-jinja'))
+
     # Clé secrète pour les sessions Flask
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'votre_cle_secrete_tres_tres_securisee'
\ No newline at end of file
@@ -0,0 +1,122 @@
+# dashboard_app/routes.py
+
+from flask import Blueprint, render_template, request, flash, jsonify
+import psycopg2  # type: ignore
+import psycopg2.extras  # type: ignore
+from datetime import datetime
+from db import get_read_connection
+from rollups import ROLLUP_TABLE
+from analytics import DL_TABLE, VOH_TABLE, analytics_available, year_report
+from http_cache import conditional
+
+# -----------------------------------------------------------------------------
+# Flask blueprint : tableau de bord (lit uniquement la table d'agrégats)
+# -----------------------------------------------------------------------------
+dashboard_bp = Blueprint('dashboard', __name__, template_folder='templates')
+
+WEEKLY_SQL = f"""
+    SELECT "Source", "WeekNo", "BU", "Type", "Lines", "DL_Headcount",
+           "H100", "H125", "H150", "H200", "Raw_hours", "Weighted_hours"
+    FROM public.{ROLLUP_TABLE}
+    WHERE "Year" = %s
+    ORDER BY substring("WeekNo" from 2)::int DESC, "Source", "BU", "Type"
+"""
+
+# Totaux de l'année par Source/Type ; effectif = moyenne hebdomadaire
+TOTALS_SQL = f"""
+    SELECT "Source", "Type",
+           count(DISTINCT "WeekNo") AS weeks,
+           sum("DL_Headcount")::float / NULLIF(count(DISTINCT "WeekNo"), 0) AS avg_headcount,
+           sum("Raw_hours") AS raw_hours,
+           sum("Weighted_hours") AS weighted_hours
+    FROM public.{ROLLUP_TABLE}
+    WHERE "Year" = %s
+    GROUP BY "Source", "Type"
+    ORDER BY "Source", "Type"
+"""
+
+YEARS_SQL = f'SELECT DISTINCT "Year" FROM public.{ROLLUP_TABLE} ORDER BY 1 DESC'
+
+
+def load_dashboard(cur, year: int):
+    cur.execute(WEEKLY_SQL, (year,))
+    weekly = [dict(r) for r in cur.fetchall()]
+    cur.execute(TOTALS_SQL, (year,))
+    totals = [dict(r) for r in cur.fetchall()]
+    return weekly, totals
+
+
+# -----------------------------------------------------------------------------
+# Routes
+# -----------------------------------------------------------------------------
+@dashboard_bp.route('/')
+def index():
+    year = request.args.get('year', type=int) or datetime.now().year
+    weekly, totals, years = [], [], []
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        weekly, totals = load_dashboard(cur, year)
+        cur.execute(YEARS_SQL)
+        years = [r[0] for r in cur.fetchall()]
+    except psycopg2.Error as db_error:
+        flash(f"❌ Erreur de base de données : {db_error}", 'danger')
+
+    if year not in years:
+        years = sorted(set(years) | {year}, reverse=True)
+    return render_template('dashboard/index.html', year=year, years=years, weekly=weekly, totals=totals)
+
+
+@dashboard_bp.route('/api/rollup')
+def api_rollup():
+    """Agrégats hebdomadaires + totaux de l'année (JSON)."""
+    year = request.args.get('year', type=int) or datetime.now().year
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        weekly, totals = load_dashboard(cur, year)
+    except psycopg2.Error as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+    return jsonify(year=year, weekly=weekly, totals=totals)
+
+
+# -----------------------------------------------------------------------------
+# Analyses de tendance (tables brutes, calcul vectorisé ; voir analytics.py)
+# -----------------------------------------------------------------------------
+def requested_year() -> int:
+    return request.args.get('year', type=int) or datetime.now().year
+
+
+@dashboard_bp.route('/analytics')
+@conditional(DL_TABLE, VOH_TABLE, key=lambda: (requested_year(),))
+def analytics():
+    year = requested_year()
+    report, years = None, []
+    if not analytics_available():
+        flash("❌ Analyses indisponibles (numpy non installé).", 'danger')
+    else:
+        try:
+            conn = get_read_connection()
+            report = year_report(conn, year)
+            with conn.cursor() as cur:
+                cur.execute(YEARS_SQL)
+                years = [r[0] for r in cur.fetchall()]
+        except psycopg2.Error as db_error:
+            flash(f"❌ Erreur de base de données : {db_error}", 'danger')
+
+    if year not in years:
+        years = sorted(set(years) | {year}, reverse=True)
+    return render_template('dashboard/analytics.html', year=year, years=years, report=report)
+
+
+@dashboard_bp.route('/api/analytics')
+@conditional(DL_TABLE, VOH_TABLE, key=lambda: (requested_year(),))
+def api_analytics():
+    """Part des heures supplémentaires, dérive de l'effectif, répartition VOH / FOH / ADMIN (JSON)."""
+    if not analytics_available():
+        return jsonify(error="Analyses indisponibles (numpy non installé)."), 501
+    try:
+        report = year_report(get_read_connection(), requested_year())
+    except psycopg2.Error as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+    return jsonify(report)
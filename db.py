@@ -0,0 +1,504 @@
+# db.py
+"""
+Couche d'accès PostgreSQL partagée par les blueprints RH et VOH.
+
+Un seul pool de connexions borné et thread-safe est créé au démarrage (run.py).
+Chaque requête Flask emprunte au plus une connexion (mise en cache dans `g`)
+et la rend au pool à la fin du contexte applicatif (teardown).
+
+Réplique en lecture optionnelle (DB_REPLICA_DSN) : les lectures lourdes
+(listings, bannière, exports, rapports) passent par get_read_connection(),
+les écritures et les lectures qui les préparent (versions des lignes
+modifiées) par get_db_connection(). Voir ReplicaRouter pour le repli sur le
+primaire.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2  # type: ignore
+import psycopg2.extensions  # type: ignore
+import psycopg2.extras  # type: ignore
+import psycopg2.pool  # type: ignore
+from flask import current_app, g, request, session
+
+from ids import allocate
+from instrumentation import InstrumentedConnection, record_acquire
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """Aucune connexion libre n'a pu être obtenue dans le délai imparti."""
+
+
+# -----------------------------------------------------------------------------
+# Pool de connexions
+# -----------------------------------------------------------------------------
+class ConnectionPool:
+    """
+    Pool de connexions psycopg2 borné et thread-safe.
+    - au plus `maxconn` connexions ouvertes; au-delà, getconn() attend (timeout)
+    - contrôle de santé à l'emprunt (connexion fermée, ping si inactive trop longtemps)
+    - recyclage des connexions plus vieilles que `max_lifetime` secondes
+    - statistiques de taille et de temps d'attente (stats())
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=10.0, max_lifetime=1800.0,
+                 health_check_interval=30.0, **connect_kwargs):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("Paramètres de pool invalides (minconn/maxconn).")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, created_at, last_used)
+        self._born = {}        # id(conn) -> created_at, pour les connexions empruntées
+        self._size = 0         # connexions ouvertes (inactives + empruntées)
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+            'created': 0,
+            'recycled': 0,
+            'discarded': 0,
+        }
+
+    # -- ouverture / fermeture -------------------------------------------------
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def _drop(self, conn, reason):
+        """Ferme une connexion et libère sa place dans le pool."""
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats[reason] += 1
+            self._cond.notify()
+
+    def warm(self):
+        """Ouvre `minconn` connexions à l'avance (les erreurs sont seulement journalisées)."""
+        conns = []
+        try:
+            for _ in range(self.minconn):
+                conns.append(self.getconn())
+        except psycopg2.Error as e:
+            logger.warning("Préchauffage du pool incomplet : %s", e)
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+        self.reset()
+
+    def reset(self):
+        """
+        Ferme les connexions inactives sans fermer le pool. À appeler dans le processus
+        maître avant un fork (gunicorn --preload) : une connexion ne se partage pas entre processus.
+        """
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    # -- santé -----------------------------------------------------------------
+    def _is_healthy(self, conn, created_at, last_used, now):
+        if conn.closed:
+            return False, 'discarded'
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False, 'recycled'
+        if self.health_check_interval is not None and now - last_used > self.health_check_interval:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False, 'discarded'
+        return True, None
+
+    # -- emprunt / restitution -------------------------------------------------
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("Le pool de connexions est fermé.")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"Aucune connexion disponible après {self.timeout:.1f}s "
+                            f"({self.maxconn} connexions déjà utilisées)."
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, created_at, last_used = self._idle.pop()
+                else:
+                    conn, created_at, last_used = None, None, None
+                    self._size += 1
+
+            now = time.monotonic()
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = now
+            else:
+                healthy, reason = self._is_healthy(conn, created_at, last_used, now)
+                if not healthy:
+                    self._drop(conn, reason)
+                    continue
+
+            wait_ms = (time.monotonic() - start) * 1000
+            with self._cond:
+                self._born[id(conn)] = created_at
+                self._stats['checkouts'] += 1
+                self._stats['wait_time_total_ms'] += wait_ms
+                self._stats['wait_time_max_ms'] = max(self._stats['wait_time_max_ms'], wait_ms)
+                if waited:
+                    self._stats['waits'] += 1
+            return conn
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            created_at = self._born.pop(id(conn), None)
+        if created_at is None:
+            raise psycopg2.pool.PoolError("Connexion inconnue de ce pool.")
+
+        if discard or conn.closed or self._closed:
+            self._drop(conn, 'discarded')
+            return
+
+        status = conn.info.transaction_status
+        if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            self._drop(conn, 'discarded')
+            return
+        if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Transaction laissée ouverte par l'appelant : on l'annule
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._drop(conn, 'discarded')
+                return
+
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            self._drop(conn, 'recycled')
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Emprunt hors requête Flask (CLI, threads de fond)."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min': self.minconn,
+                'max': self.maxconn,
+            })
+        s['wait_time_avg_ms'] = round(s['wait_time_total_ms'] / s['checkouts'], 3) if s['checkouts'] else 0.0
+        s['wait_time_total_ms'] = round(s['wait_time_total_ms'], 3)
+        s['wait_time_max_ms'] = round(s['wait_time_max_ms'], 3)
+        return s
+
+
+# -----------------------------------------------------------------------------
+# Réplique en lecture
+# -----------------------------------------------------------------------------
+# Retard de la réplique (s) : 0 si tout le WAL reçu est rejoué, NULL -> 0 sur un serveur primaire
+REPLICA_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+"""
+
+
+class ReplicaRouter:
+    """
+    Pool de la réplique en lecture + état de santé.
+    - une erreur de connexion (ou un pool saturé) écarte la réplique `retry_after` secondes :
+      les lectures repartent sur le primaire en attendant
+    - toutes les `check_interval` secondes, le retard de réplication est mesuré à l'emprunt ;
+      au-delà de `max_lag` secondes (0 = pas de contrôle) sur deux mesures consécutives, la
+      réplique est écartée de même (une mesure isolée peut tomber entre la réception et le
+      rejeu d'un enregistrement WAL qui n'est pas une transaction, et dater du dernier COMMIT)
+    """
+
+    def __init__(self, pool, retry_after=30.0, max_lag=10.0, check_interval=5.0):
+        self.pool = pool
+        self.retry_after = retry_after
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self._checked_at = 0.0
+        self._last_error = None
+        self._lag = None
+        self._lagging = False
+        self._stats = {'reads': 0, 'fallbacks': 0, 'failovers': 0}
+
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def mark_down(self, reason):
+        with self._lock:
+            if time.monotonic() >= self._down_until:
+                self._stats['failovers'] += 1
+                logger.warning("Réplique écartée %.0f s, lectures sur le primaire : %s", self.retry_after, reason)
+            self._down_until = time.monotonic() + self.retry_after
+            self._last_error = str(reason)
+
+    def _lag_ok(self, conn):
+        now = time.monotonic()
+        if not self.max_lag or now - self._checked_at < self.check_interval:
+            return True
+        with conn.cursor() as cur:
+            cur.execute(REPLICA_LAG_SQL)
+            self._lag = float(cur.fetchone()[0])
+        conn.rollback()
+        self._checked_at = now
+        lagging, self._lagging = self._lagging, self._lag > self.max_lag
+        return not (lagging and self._lagging)
+
+    def getconn(self):
+        """Connexion de la réplique, ou None si elle est écartée (l'appelant lit alors sur le primaire)."""
+        if not self.available():
+            with self._lock:
+                self._stats['fallbacks'] += 1
+            return None
+        try:
+            conn = self.pool.getconn()
+        except psycopg2.Error as e:  # injoignable, pool saturé (PoolTimeout)...
+            self.mark_down(e)
+            return None
+        try:
+            healthy = self._lag_ok(conn)
+        except psycopg2.Error as e:
+            self.pool.putconn(conn, discard=True)
+            self.mark_down(e)
+            return None
+        if not healthy:
+            self.pool.putconn(conn)
+            self.mark_down(f"retard de réplication {self._lag:.1f} s > {self.max_lag:.0f} s")
+            return None
+        with self._lock:
+            self._stats['reads'] += 1
+        return conn
+
+    def putconn(self, conn):
+        self.pool.putconn(conn)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s.update({
+            'available': self.available(),
+            'lag_seconds': self._lag,
+            'last_error': self._last_error,
+            'pool': self.pool.stats(),
+        })
+        return s
+
+
+def replica_connect_kwargs(primary_kwargs, dsn):
+    """Paramètres de connexion de la réplique : ceux du DSN, complétés par ceux du primaire."""
+    params = psycopg2.extensions.parse_dsn(dsn)
+    if 'dbname' in params:
+        params['database'] = params.pop('dbname')
+    return {**primary_kwargs, **params}
+
+
+# -----------------------------------------------------------------------------
+# Intégration Flask
+# -----------------------------------------------------------------------------
+def init_pool(app):
+    """Crée le pool (et celui de la réplique si DB_REPLICA_DSN) et branche la restitution par requête."""
+    cfg = app.config
+    connect_kwargs = dict(
+        host=cfg['DB_HOST'],
+        port=cfg['DB_PORT'],
+        database=cfg['DB_DATABASE'],
+        user=cfg['DB_LOGIN'],
+        password=cfg['DB_PASSWORD'],
+        sslmode=cfg['SSL_MODE'],
+    )
+    pool_kwargs = dict(
+        minconn=cfg['DB_POOL_MIN'],
+        maxconn=cfg['DB_POOL_MAX'],
+        timeout=cfg['DB_POOL_TIMEOUT'],
+        max_lifetime=cfg['DB_POOL_MAX_LIFETIME'],
+        health_check_interval=cfg['DB_POOL_HEALTH_CHECK_INTERVAL'],
+        connection_factory=InstrumentedConnection,  # curseurs chronométrés (instrumentation.py)
+    )
+    pool = ConnectionPool(**pool_kwargs, **connect_kwargs)
+    app.extensions['db_pool'] = pool
+    app.teardown_appcontext(release_db_connection)
+
+    if cfg['DB_REPLICA_DSN']:
+        replica_pool = ConnectionPool(**pool_kwargs, **replica_connect_kwargs(connect_kwargs, cfg['DB_REPLICA_DSN']))
+        app.extensions['db_replica'] = ReplicaRouter(
+            replica_pool,
+            retry_after=cfg['DB_REPLICA_RETRY_SECONDS'],
+            max_lag=cfg['DB_REPLICA_MAX_LAG'],
+            check_interval=cfg['DB_REPLICA_HEALTH_CHECK_INTERVAL'],
+        )
+        app.after_request(pin_primary_after_write)
+    return pool
+
+
+def get_pool():
+    return current_app.extensions['db_pool']
+
+
+def get_replica():
+    """Routeur de la réplique, ou None si aucune n'est configurée."""
+    return current_app.extensions.get('db_replica')
+
+
+def get_db_connection():
+    """Connexion de la requête courante au primaire (empruntée au pool au premier appel)."""
+    if 'db_conn' not in g:
+        started = time.perf_counter()
+        g.db_conn = get_pool().getconn()
+        record_acquire(time.perf_counter() - started)
+    return g.db_conn
+
+
+def get_read_connection():
+    """
+    Connexion de lecture de la requête courante (listings, bannière, exports, rapports) :
+    la réplique si elle est configurée, saine et que la session n'est pas épinglée au
+    primaire après une écriture ; sinon la connexion du primaire.
+    """
+    if 'db_read_conn' not in g:
+        replica = get_replica()
+        conn = None
+        if replica is not None and not primary_pinned():
+            started = time.perf_counter()
+            conn = replica.getconn()
+            record_acquire(time.perf_counter() - started)
+        g.db_read_conn = conn
+    return g.db_read_conn if g.db_read_conn is not None else get_db_connection()
+
+
+def primary_pinned():
+    return session.get('db_primary_until', 0) > time.time()
+
+
+def pin_primary_after_write(response):
+    """
+    Lecture de ses propres écritures : après une requête d'écriture réussie (y compris la
+    redirection qui suit un POST), la session lit sur le primaire DB_REPLICA_STICKY_SECONDS secondes.
+    """
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        session['db_primary_until'] = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
+    return response
+
+
+def release_db_connection(exc=None):
+    """Rend les connexions de la requête à leur pool (appelé au teardown)."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().putconn(conn)
+    read_conn = g.pop('db_read_conn', None)
+    if read_conn is not None:
+        if read_conn.closed:  # coupée pendant la requête : les suivantes lisent sur le primaire
+            get_replica().mark_down("connexion à la réplique perdue")
+        get_replica().putconn(read_conn)
+
+
+# -----------------------------------------------------------------------------
+# Insertion groupée avec IDs courts
+# -----------------------------------------------------------------------------
+def bulk_insert_with_short_ids(cur, insert_sql, rows, year, max_tries: int = 5):
+    """
+    Insère toutes les lignes en un seul INSERT multi-lignes (execute_values).
+    - `insert_sql` doit contenir `VALUES %s ... ON CONFLICT ("ID") DO NOTHING RETURNING "ID"`
+    - `rows` : tuples de valeurs SANS l'ID (il est ajouté en première colonne)
+    - `year` : année du préfixe des ID, alloués en lot par ids.allocate()
+    Seules les lignes dont l'ID est entré en collision sont réessayées avec un nouvel ID.
+    Toute autre contrainte (ex: clé métier) remonte via psycopg2.errors.UniqueViolation.
+    Retourne les IDs insérés, dans l'ordre de `rows`.
+    """
+    rows = [tuple(r) for r in rows]
+    ids = [None] * len(rows)
+    pending = list(range(len(rows)))
+
+    for _ in range(max_tries):
+        if not pending:
+            break
+        used = set(i for i in ids if i is not None)
+        # un lot d'ID distincts, sans doublon avec ceux déjà attribués
+        for idx, rid in zip(pending, allocate(cur, year, len(pending), exclude=used)):
+            ids[idx] = rid
+        batch = [(ids[idx],) + rows[idx] for idx in pending]
+
+        returned = psycopg2.extras.execute_values(cur, insert_sql, batch, page_size=len(batch), fetch=True)
+        inserted = {r[0] for r in returned}
+        pending = [idx for idx in pending if ids[idx] not in inserted]
+
+    if pending:
+        raise RuntimeError("Impossible de générer un ID court unique après plusieurs tentatives.")
+    return ids
+
+
+def bulk_update(cur, update_sql, rows, template=None):
+    """
+    Met à jour toutes les lignes en un seul UPDATE ... FROM (VALUES %s) (execute_values, une page).
+    - `update_sql` doit se terminer par `RETURNING m."ID"` (lignes effectivement écrites)
+    - `template` : gabarit d'une ligne VALUES, avec les casts nécessaires (ex: `%s::integer`)
+    Retourne l'ensemble des IDs écrits ; l'appelant compare avec `rows` pour détecter les conflits.
+    """
+    rows = [tuple(r) for r in rows]
+    if not rows:
+        return set()
+    returned = psycopg2.extras.execute_values(cur, update_sql, rows, template=template,
+                                              page_size=len(rows), fetch=True)
+    return {r[0] for r in returned}
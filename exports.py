@@ -0,0 +1,107 @@
+# exports.py
+"""
+Export CSV / XLSX des métriques en flux continu.
+
+Les lignes sont lues par un curseur nommé (côté serveur) par paquets de
+`EXPORT_ITERSIZE`, puis écrites dans la réponse au fil de l'eau : la mémoire
+reste constante quel que soit le nombre d'années dans la table.
+"""
+
+import csv
+import io
+import tempfile
+from datetime import date
+
+import psycopg2.extras  # type: ignore
+from flask import Response, stream_with_context
+
+from db import get_read_connection
+from pagination import ORDER_BY
+
+try:  # dépendance optionnelle (export XLSX)
+    from openpyxl import Workbook  # type: ignore
+except ImportError:  # pragma: no cover
+    Workbook = None
+
+EXPORT_ITERSIZE = 2000      # lignes rapatriées par aller-retour du curseur serveur
+CSV_FLUSH_ROWS = 500        # lignes CSV par morceau envoyé au client
+XLSX_CHUNK_SIZE = 64 * 1024
+CSV_DELIMITER = ';'         # séparateur attendu par Excel en français
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def xlsx_available() -> bool:
+    return Workbook is not None
+
+
+def iter_rows(select_sql, clauses, params):
+    """Parcourt le résultat filtré avec un curseur nommé (jamais de fetchall)."""
+    sql = select_sql
+    if clauses:
+        sql += "\nWHERE " + " AND ".join(clauses)
+    sql += f"\n{ORDER_BY}"
+
+    conn = get_read_connection()
+    cur = conn.cursor(name='metrics_export', cursor_factory=psycopg2.extras.DictCursor)
+    cur.itersize = EXPORT_ITERSIZE
+    try:
+        cur.execute(sql, params)
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+        conn.rollback()
+
+
+def _cell(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def csv_response(filename, columns, rows):
+    """Réponse CSV générée morceau par morceau (BOM UTF-8 pour Excel)."""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=CSV_DELIMITER)
+        buffer.write('\ufeff')
+        writer.writerow(columns)
+        for i, row in enumerate(rows, start=1):
+            writer.writerow([_cell(row[c]) for c in columns])
+            if i % CSV_FLUSH_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+def xlsx_response(filename, columns, rows):
+    """
+    Réponse XLSX : classeur en mode write_only (lignes écrites sur disque au fil
+    de l'eau), puis fichier renvoyé par morceaux de XLSX_CHUNK_SIZE octets.
+    """
+    def generate():
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title='metrics')
+        ws.append(list(columns))
+        for row in rows:
+            ws.append([row[c] for c in columns])
+        with tempfile.TemporaryFile() as tmp:
+            wb.save(tmp)
+            tmp.seek(0)
+            while True:
+                chunk = tmp.read(XLSX_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=XLSX_MIMETYPE,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,29 @@
+# gunicorn.conf.py
+"""
+Réglages gunicorn (lus automatiquement depuis le répertoire courant) :
+
+    gunicorn wsgi:app
+
+Variables d'environnement : GUNICORN_BIND, WEB_CONCURRENCY (workers),
+GUNICORN_THREADS, GUNICORN_TIMEOUT, GUNICORN_PRELOAD (1 = application chargée
+une fois dans le maître puis forkée, voir wsgi.py).
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))  # à garder <= DB_POOL_MAX
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    """Dans chaque worker : connexions du pool et threads de fond (jamais hérités du maître)."""
+    from run import start_background
+    from wsgi import app
+    app.extensions['db_pool'].warm()
+    start_background(app)
+    worker.log.info("Worker %s prêt (démarrage de l'application : %.0f ms)",
+                    worker.pid, app.extensions['startup']['total'] * 1000)
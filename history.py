@@ -0,0 +1,355 @@
+# history.py
+"""
+Journal des modifications des tables de métriques (table `metrics_history`).
+
+Chaque INSERT / UPDATE / DELETE sur weekly_dl_metrics ou weekly_voh_metrics
+ajoute, dans la même transaction, une ligne d'historique par ligne touchée :
+triggers par instruction (tables de transition), donc une seule insertion
+dans le journal pour une saisie hebdomadaire, une correction de semaine ou
+un import complet. Quel que soit le chemin d'écriture (routes WSGI, variante
+asyncio, import, psql), rien ne peut être écrit sans être journalisé, et rien
+n'est journalisé pour une écriture annulée.
+
+Contenu d'une ligne :
+- "Changes" : {colonne: [avant, après]} ; seules les colonnes modifiées pour
+  un UPDATE (un UPDATE sans changement réel n'est pas journalisé), toutes les
+  colonnes pour un INSERT (avant = null) ou un DELETE (après = null) ;
+- "Context" : métadonnées de la requête (route, méthode, chemin, adresse du
+  client, navigateur), posées par annotate() dans la transaction de
+  l'écriture ; null pour une écriture faite hors de l'application ;
+- "Db_user", "Txid", "Changed_at" : rôle PostgreSQL, transaction et date.
+L'application n'a pas d'authentification : l'adresse du client
+(write_guard.client_key) est la seule identité disponible.
+
+Ajout seul : UPDATE, DELETE et TRUNCATE du journal sont refusés par trigger.
+Stockage partitionné par année ("Year" de la ligne de métriques) : une
+partition par année, créée d'avance (migration 12, démarrage, import), plus
+une partition par défaut qui recueille une année imprévue (déplacée dans sa
+partition quand celle-ci est créée). Purge : détachement puis suppression des
+partitions anciennes (`flask history-prune`), sans DELETE ligne à ligne.
+
+Lectures (pages d'historique d'une ligne et d'une semaine) : index
+("Table", "ID", "Seq") et ("Table", "Year", "WeekNo", "Seq"), du plus
+récent au plus ancien, pagination par "Seq".
+"""
+
+import json
+import logging
+import re
+from datetime import datetime
+
+import click
+import psycopg2  # type: ignore
+from flask import has_request_context, request
+
+from write_guard import client_key
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TABLE = "metrics_history"
+DEFAULT_PARTITION = f"{HISTORY_TABLE}_default"
+AUDITED_TABLES = ("weekly_dl_metrics", "weekly_voh_metrics")
+CONTEXT_SETTING = "vo_rh.history_context"          # métadonnées de la requête (transaction courante)
+MAINTENANCE_SETTING = "vo_rh.history_maintenance"  # 'on' : déplacement / purge autorisés (partitions)
+DEFAULT_LIMIT = 100
+
+_PARTITION_YEAR = re.compile(rf'^{HISTORY_TABLE}_(\d{{4}})$')
+
+CREATE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS public.{HISTORY_TABLE} (
+        "Seq"        bigserial,
+        "Table"      text        NOT NULL,
+        "Operation"  text        NOT NULL,
+        "ID"         varchar(16) NOT NULL,
+        "Year"       integer     NOT NULL,
+        "WeekNo"     varchar(4)  NOT NULL,
+        "BU"         varchar(20) NOT NULL,
+        "Changes"    jsonb       NOT NULL,
+        "Context"    jsonb,
+        "Db_user"    text        NOT NULL DEFAULT session_user,
+        "Txid"       bigint      NOT NULL DEFAULT txid_current(),
+        "Changed_at" timestamptz NOT NULL DEFAULT now()
+    ) PARTITION BY RANGE ("Year")
+"""
+
+CREATE_DEFAULT_SQL = f"""
+    CREATE TABLE IF NOT EXISTS public.{DEFAULT_PARTITION} PARTITION OF public.{HISTORY_TABLE} DEFAULT
+"""
+
+# Index du parent : créés sur chaque partition, y compris les partitions futures
+CREATE_INDEXES_SQL = [
+    f'CREATE INDEX IF NOT EXISTS ix_{HISTORY_TABLE}_id ON public.{HISTORY_TABLE} ("Table", "ID", "Seq")',
+    f'CREATE INDEX IF NOT EXISTS ix_{HISTORY_TABLE}_week ON public.{HISTORY_TABLE} ("Table", "Year", "WeekNo", "Seq")',
+]
+
+_INSERT_HISTORY = f"""
+    INSERT INTO public.{HISTORY_TABLE} ("Table", "Operation", "ID", "Year", "WeekNo", "BU", "Changes", "Context")
+"""
+
+# Un trigger par opération (tables de transition new_rows / old_rows), une seule fonction
+LOG_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION public.log_metrics_history() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        ctx jsonb := NULLIF(current_setting('{CONTEXT_SETTING}', true), '')::jsonb;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {_INSERT_HISTORY}
+            SELECT TG_TABLE_NAME, TG_OP, n."ID", n."Year", n."WeekNo", n."BU",
+                   (SELECT jsonb_object_agg(e.key, jsonb_build_array(NULL, e.value))
+                    FROM jsonb_each(to_jsonb(n) - 'ID' - 'Version') e),
+                   ctx
+            FROM new_rows n;
+        ELSIF TG_OP = 'UPDATE' THEN
+            {_INSERT_HISTORY}
+            SELECT TG_TABLE_NAME, TG_OP, n."ID", n."Year", n."WeekNo", n."BU", d.changes, ctx
+            FROM new_rows n
+            JOIN old_rows o ON o."ID" = n."ID"
+            CROSS JOIN LATERAL (
+                SELECT jsonb_object_agg(e.key, jsonb_build_array(to_jsonb(o) -> e.key, e.value)) AS changes
+                FROM jsonb_each(to_jsonb(n) - 'ID' - 'Version') e
+                WHERE to_jsonb(o) -> e.key IS DISTINCT FROM e.value
+            ) d
+            WHERE d.changes IS NOT NULL;
+        ELSE
+            {_INSERT_HISTORY}
+            SELECT TG_TABLE_NAME, TG_OP, o."ID", o."Year", o."WeekNo", o."BU",
+                   (SELECT jsonb_object_agg(e.key, jsonb_build_array(e.value, NULL))
+                    FROM jsonb_each(to_jsonb(o) - 'ID' - 'Version') e),
+                   ctx
+            FROM old_rows o;
+        END IF;
+        RETURN NULL;
+    END $$
+"""
+
+APPEND_ONLY_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION public.metrics_history_append_only() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF current_setting('{MAINTENANCE_SETTING}', true) IS DISTINCT FROM 'on' THEN
+            RAISE EXCEPTION '{HISTORY_TABLE} est en ajout seul (% refusé)', TG_OP;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            RETURN OLD;
+        END IF;
+        RETURN NEW;
+    END $$
+"""
+
+TRIGGERS = [
+    ('insert', 'INSERT', 'NEW TABLE AS new_rows'),
+    ('update', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+    ('delete', 'DELETE', 'OLD TABLE AS old_rows'),
+]
+
+CONTEXT_SQL = f"SELECT set_config('{CONTEXT_SETTING}', %s, true)"
+MAINTENANCE_SQL = f"SELECT set_config('{MAINTENANCE_SETTING}', %s, true)"
+
+PARTITIONS_SQL = f"""
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.{HISTORY_TABLE}'::regclass
+"""
+
+ID_CONDITION = 'h."ID" = %(id)s'
+WEEK_CONDITION = 'h."Year" = %(year)s AND h."WeekNo" = %(weekno)s'
+
+
+def install(cur):
+    """Journal partitionné, triggers des tables de métriques, partitions des années présentes (migration 12)."""
+    cur.execute(CREATE_SQL)
+    cur.execute(CREATE_DEFAULT_SQL)
+    for sql in CREATE_INDEXES_SQL:
+        cur.execute(sql)
+    cur.execute(LOG_FUNCTION_SQL)
+    cur.execute(APPEND_ONLY_FUNCTION_SQL)
+    cur.execute(f"DROP TRIGGER IF EXISTS trg_{HISTORY_TABLE}_append_only ON public.{HISTORY_TABLE}")
+    cur.execute(f"""
+        CREATE TRIGGER trg_{HISTORY_TABLE}_append_only
+        BEFORE UPDATE OR DELETE ON public.{HISTORY_TABLE}
+        FOR EACH ROW EXECUTE FUNCTION public.metrics_history_append_only()
+    """)
+    cur.execute(f"DROP TRIGGER IF EXISTS trg_{HISTORY_TABLE}_no_truncate ON public.{HISTORY_TABLE}")
+    cur.execute(f"""
+        CREATE TRIGGER trg_{HISTORY_TABLE}_no_truncate
+        BEFORE TRUNCATE ON public.{HISTORY_TABLE}
+        FOR EACH STATEMENT EXECUTE FUNCTION public.metrics_history_append_only()
+    """)
+
+    years = {datetime.now().year, datetime.now().year + 1}
+    for table in AUDITED_TABLES:
+        for name, operation, transition in TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_history_{name} ON public.{table}")
+            cur.execute(f"""
+                CREATE TRIGGER trg_{table}_history_{name}
+                AFTER {operation} ON public.{table}
+                REFERENCING {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION public.log_metrics_history()
+            """)
+        cur.execute(f'SELECT DISTINCT "Year" FROM public.{table}')
+        years.update(year for year, in cur.fetchall())
+    for year in sorted(years):
+        create_partition(cur, year)
+
+
+# -----------------------------------------------------------------------------
+# Partitions
+# -----------------------------------------------------------------------------
+def partition_name(year: int) -> str:
+    return f"{HISTORY_TABLE}_{int(year)}"
+
+
+def create_partition(cur, year):
+    """
+    Crée la partition de `year` si elle n'existe pas ; les lignes de cette année
+    recueillies entre-temps par la partition par défaut y sont déplacées.
+    """
+    name = partition_name(year)
+    cur.execute("SELECT to_regclass(%s)", (f"public.{name}",))
+    if cur.fetchone()[0] is not None:
+        return False
+    cur.execute(MAINTENANCE_SQL, ('on',))
+    cur.execute(f"CREATE TABLE public.{name} (LIKE public.{HISTORY_TABLE})")
+    cur.execute(f"""
+        WITH moved AS (DELETE FROM public.{DEFAULT_PARTITION} WHERE "Year" = %s RETURNING *)
+        INSERT INTO public.{name} SELECT * FROM moved
+    """, (year,))
+    cur.execute(f"ALTER TABLE public.{HISTORY_TABLE} ATTACH PARTITION public.{name} "
+                "FOR VALUES FROM (%s) TO (%s)", (int(year), int(year) + 1))
+    cur.execute(MAINTENANCE_SQL, ('off',))
+    return True
+
+
+def ensure_partitions(conn, years):
+    """Partitions des années `years` (transaction dédiée, sérialisée entre processus) ; retourne les années créées."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (f"public.{HISTORY_TABLE}",))
+            if cur.fetchone()[0] is None:  # migration 12 non appliquée
+                conn.rollback()
+                return []
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (HISTORY_TABLE,))
+            created = [year for year in sorted(set(years)) if create_partition(cur, year)]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if created:
+        logger.info("Partitions de %s créées : %s", HISTORY_TABLE, created)
+    return created
+
+
+def partition_years(cur):
+    cur.execute(PARTITIONS_SQL)
+    return sorted(int(m.group(1)) for name, in cur.fetchall() if (m := _PARTITION_YEAR.match(name)))
+
+
+def prune(cur, before):
+    """Supprime l'historique des années < `before` (partitions détachées puis supprimées) ; retourne ces années."""
+    dropped = [year for year in partition_years(cur) if year < before]
+    for year in dropped:
+        cur.execute(f"ALTER TABLE public.{HISTORY_TABLE} DETACH PARTITION public.{partition_name(year)}")
+        cur.execute(f"DROP TABLE public.{partition_name(year)}")
+    cur.execute(MAINTENANCE_SQL, ('on',))
+    cur.execute(f'DELETE FROM public.{DEFAULT_PARTITION} WHERE "Year" < %s', (before,))
+    cur.execute(MAINTENANCE_SQL, ('off',))
+    return dropped
+
+
+# -----------------------------------------------------------------------------
+# Écriture : métadonnées de la requête
+# -----------------------------------------------------------------------------
+def request_context(req, **extra):
+    """Métadonnées d'une requête Flask ou Quart (mêmes attributs)."""
+    context = {
+        'route': req.endpoint,
+        'method': req.method,
+        'path': req.path,
+        'client': client_key(req),
+        'user_agent': req.headers.get('User-Agent', '')[:200],
+    }
+    context.update(extra)
+    return context
+
+
+def annotate(cur, context=None):
+    """
+    Métadonnées des lignes d'historique écrites par la transaction en cours
+    (par défaut : la requête Flask courante). À appeler avant l'écriture.
+    """
+    if context is None:
+        if not has_request_context():
+            return
+        context = request_context(request)
+    cur.execute(CONTEXT_SQL, (json.dumps(context, default=str),))
+
+
+# -----------------------------------------------------------------------------
+# Lecture : historique d'une ligne, d'une semaine
+# -----------------------------------------------------------------------------
+def select_sql(table, line_column, condition, before=None):
+    """Entrées du journal de `table`, de la plus récente à la plus ancienne ; `line` : ligne / fonction actuelle."""
+    keyset = 'AND h."Seq" < %(before)s' if before is not None else ''
+    return f"""
+        SELECT h."Seq", h."Operation", h."ID", h."Year", h."WeekNo", h."BU",
+               COALESCE(m."{line_column}", h."Changes" -> '{line_column}' ->> 1,
+                        h."Changes" -> '{line_column}' ->> 0) AS line,
+               h."Changes", h."Context", h."Db_user", h."Changed_at"
+        FROM public.{HISTORY_TABLE} h
+        LEFT JOIN public.{table} m ON m."ID" = h."ID"
+        WHERE h."Table" = %(table)s AND {condition} {keyset}
+        ORDER BY h."Seq" DESC
+        LIMIT %(limit)s
+    """
+
+
+def _fetch(cur, table, line_column, condition, params, before, limit):
+    cur.execute(select_sql(table, line_column, condition, before),
+                dict(params, table=table, before=before, limit=limit + 1))
+    rows = cur.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1]['Seq'] if more and rows else None)
+
+
+def row_history(cur, table, line_column, rid, before=None, limit=DEFAULT_LIMIT):
+    """(entrées, curseur de la page suivante ou None) pour la ligne `rid`."""
+    return _fetch(cur, table, line_column, ID_CONDITION, {'id': rid}, before, limit)
+
+
+def week_history(cur, table, line_column, year, weekno, bu=None, before=None, limit=DEFAULT_LIMIT):
+    """(entrées, curseur de la page suivante ou None) pour une semaine, éventuellement une seule BU."""
+    condition = WEEK_CONDITION + (' AND h."BU" = %(bu)s' if bu else '')
+    return _fetch(cur, table, line_column, condition, {'year': year, 'weekno': weekno, 'bu': bu}, before, limit)
+
+
+# -----------------------------------------------------------------------------
+# CLI : flask history-partitions [ANNÉE...], flask history-prune --before ANNÉE
+# -----------------------------------------------------------------------------
+def register_cli(app):
+    @app.cli.command('history-partitions')
+    @click.argument('years', nargs=-1, type=int)
+    def history_partitions(years):
+        """Crée les partitions du journal (par défaut : année courante et suivante)."""
+        years = years or (datetime.now().year, datetime.now().year + 1)
+        with app.extensions['db_pool'].connection() as conn:
+            created = ensure_partitions(conn, years)
+            with conn.cursor() as cur:
+                existing = partition_years(cur)
+            conn.rollback()
+        click.echo(f"Partitions créées : {created or 'aucune'} ; partitions existantes : {existing}")
+
+    @app.cli.command('history-prune')
+    @click.option('--before', type=int, required=True, help="Première année conservée.")
+    @click.confirmation_option(prompt="Supprimer définitivement l'historique des années antérieures ?")
+    def history_prune(before):
+        """Supprime l'historique des années antérieures à --before."""
+        with app.extensions['db_pool'].connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    dropped = prune(cur, before)
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+        click.echo(f"Partitions supprimées : {dropped or 'aucune'}")
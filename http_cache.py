@@ -0,0 +1,313 @@
+# http_cache.py
+"""
+Cache HTTP des pages de listing : validateurs ETag / Last-Modified, réponses
+304 et compression gzip / brotli.
+
+Version des tables : `table_versions` ("Table", "Version", "Updated_at"),
+incrémentée par un trigger (niveau instruction) à chaque INSERT / UPDATE /
+DELETE / TRUNCATE des tables de métriques et du référentiel, quel que soit
+le chemin d'écriture (routes, import, CLI, SQL manuel). `week_versions`
+("Table", "Year", "WeekNo", "Version") fait de même, semaine par semaine,
+pour les tables de métriques (triggers avec tables de transition) : le cache
+des semaines closes de la grille (pagination.year_columns) n'est pas
+invalidé par une saisie de la semaine modifiable.
+
+Une GET décorée par @conditional lit ces versions (une requête sur clé
+primaire) : si le navigateur présente encore le même ETag, la réponse est
+un 304, sans les SELECT de la page ni le rendu du template. L'ETag combine
+les versions, les éléments de la page qui ne dépendent pas des tables
+(année, semaine modifiable, instantané du référentiel...) et l'empreinte du
+code déployé : un déploiement invalide les pages déjà en cache.
+
+Compression (init_http_cache) : brotli si le paquet est installé et accepté
+par le client, sinon gzip ; réponses texte / JSON complètes uniquement (les
+exports en flux ne sont pas touchés).
+"""
+
+import gzip
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import psycopg2  # type: ignore
+from flask import g, get_flashed_messages, make_response, request, session
+
+from db import get_db_connection, get_read_connection
+
+try:  # dépendance optionnelle (compression brotli)
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+VERSIONS_TABLE = "table_versions"
+VERSIONED_TABLES = ("weekly_dl_metrics", "weekly_voh_metrics", "reference_lines", "weekly_hours_rollup")
+WEEK_VERSIONS_TABLE = "week_versions"
+
+# DDL des migrations 5, 9 et 13 (voir install*) : une modification passe par une nouvelle migration
+CREATE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS public.{VERSIONS_TABLE} (
+        "Table"      text        PRIMARY KEY,
+        "Version"    bigint      NOT NULL DEFAULT 0,
+        "Updated_at" timestamptz NOT NULL DEFAULT now()
+    )
+"""
+
+# clock_timestamp() plutôt que now() : Last-Modified suit l'instant de l'écriture
+BUMP_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION public.bump_table_version() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO public.{VERSIONS_TABLE} AS v ("Table", "Version", "Updated_at")
+        VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+        ON CONFLICT ("Table") DO UPDATE
+            SET "Version" = v."Version" + 1, "Updated_at" = clock_timestamp();
+        RETURN NULL;
+    END
+    $$
+"""
+
+CREATE_WEEK_SQL = f"""
+    CREATE TABLE IF NOT EXISTS public.{WEEK_VERSIONS_TABLE} (
+        "Table"      text        NOT NULL,
+        "Year"       integer     NOT NULL,
+        "WeekNo"     varchar(4)  NOT NULL,
+        "Version"    bigint      NOT NULL DEFAULT 0,
+        "Updated_at" timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY ("Table", "Year", "WeekNo")
+    )
+"""
+
+# Les lignes ne sont jamais supprimées (un DELETE incrémente la version de sa semaine) : une
+# version ne revient jamais en arrière. ORDER BY : verrous pris dans le même ordre par tous.
+_BUMP_WEEKS = f"""
+        INSERT INTO public.{WEEK_VERSIONS_TABLE} AS v ("Table", "Year", "WeekNo", "Version", "Updated_at")
+        SELECT TG_TABLE_NAME, w."Year", w."WeekNo", 1, clock_timestamp()
+        FROM (SELECT DISTINCT "Year", "WeekNo" FROM (%s) AS t) AS w
+        ORDER BY w."Year", w."WeekNo"
+        ON CONFLICT ("Table", "Year", "WeekNo") DO UPDATE
+            SET "Version" = v."Version" + 1, "Updated_at" = clock_timestamp();
+"""
+
+BUMP_WEEK_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION public.bump_week_versions() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {_BUMP_WEEKS % 'SELECT "Year", "WeekNo" FROM new_rows'}
+        ELSIF TG_OP = 'UPDATE' THEN
+            {_BUMP_WEEKS % 'SELECT "Year", "WeekNo" FROM old_rows UNION SELECT "Year", "WeekNo" FROM new_rows'}
+        ELSIF TG_OP = 'DELETE' THEN
+            {_BUMP_WEEKS % 'SELECT "Year", "WeekNo" FROM old_rows'}
+        ELSE  -- TRUNCATE : pas de table de transition, toutes les semaines connues changent
+            UPDATE public.{WEEK_VERSIONS_TABLE}
+            SET "Version" = "Version" + 1, "Updated_at" = clock_timestamp()
+            WHERE "Table" = TG_TABLE_NAME;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+"""
+
+WEEK_TRIGGERS = [
+    ('insert', 'INSERT', 'REFERENCING NEW TABLE AS new_rows'),
+    ('update', 'UPDATE', 'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+    ('delete', 'DELETE', 'REFERENCING OLD TABLE AS old_rows'),
+    ('truncate', 'TRUNCATE', ''),
+]
+
+WEEK_VERSION_SQL = f"""
+    SELECT "WeekNo", "Version"
+    FROM public.{WEEK_VERSIONS_TABLE}
+    WHERE "Table" = %s AND "Year" = %s
+    ORDER BY "WeekNo"
+"""
+
+VERSION_SQL = f"""
+    SELECT "Table", "Version", "Updated_at"
+    FROM public.{VERSIONS_TABLE}
+    WHERE "Table" = ANY(%s)
+    ORDER BY "Table"
+"""
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # au-delà, le gain de taille ne compense plus le temps CPU sur des pages dynamiques
+
+
+def install(cur, tables):
+    """Table des versions, fonction d'incrément et triggers de `tables` (migration 5)."""
+    cur.execute(CREATE_SQL)
+    cur.execute(BUMP_FUNCTION_SQL)
+    install_triggers(cur, tables)
+
+
+def install_triggers(cur, tables):
+    """Ligne de version et trigger de chacune des `tables` (migration 5 ; migration 9 : weekly_hours_rollup)."""
+    for table in tables:
+        cur.execute(
+            f'INSERT INTO public.{VERSIONS_TABLE} ("Table") VALUES (%s) ON CONFLICT DO NOTHING',
+            (table,)
+        )
+        cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_version ON public.{table}")
+        cur.execute(f"""
+            CREATE TRIGGER trg_{table}_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.{table}
+            FOR EACH STATEMENT EXECUTE FUNCTION public.bump_table_version()
+        """)
+
+
+def install_week_versions(cur, tables):
+    """Versions par semaine : table, fonction, lignes initiales et triggers de `tables` (migration 13)."""
+    cur.execute(CREATE_WEEK_SQL)
+    cur.execute(BUMP_WEEK_FUNCTION_SQL)
+    for table in tables:
+        cur.execute(f"""
+            INSERT INTO public.{WEEK_VERSIONS_TABLE} ("Table", "Year", "WeekNo")
+            SELECT DISTINCT %s, "Year", "WeekNo" FROM public.{table}
+            ON CONFLICT DO NOTHING
+        """, (table,))
+        for name, operation, transition in WEEK_TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_week_version_{name} ON public.{table}")
+            cur.execute(f"""
+                CREATE TRIGGER trg_{table}_week_version_{name}
+                AFTER {operation} ON public.{table} {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION public.bump_week_versions()
+            """)
+
+
+# -----------------------------------------------------------------------------
+# Validateurs
+# -----------------------------------------------------------------------------
+_fingerprint = None
+
+
+def code_fingerprint():
+    """(empreinte, date de modification) des modules et templates déployés, calculée une fois."""
+    global _fingerprint
+    if _fingerprint is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+        digest, latest = hashlib.sha1(), 0.0
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(('.', '__')) and d not in ('bench', 'venv'))
+            for name in sorted(filenames):
+                if name.endswith(('.py', '.html')):
+                    path = os.path.join(dirpath, name)
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+                    latest = max(latest, os.path.getmtime(path))
+        _fingerprint = (digest.hexdigest()[:12], datetime.fromtimestamp(int(latest), timezone.utc))
+    return _fingerprint
+
+
+def week_start():
+    """Lundi 00:00 UTC de la semaine courante : la semaine modifiable change à cet instant."""
+    today = datetime.now(timezone.utc).date()
+    monday = today - timedelta(days=today.weekday())
+    return datetime(monday.year, monday.month, monday.day, tzinfo=timezone.utc)
+
+
+def validators(rows, key=()):
+    """rows : (Table, Version, Updated_at) -> (ETag, Last-Modified)."""
+    fingerprint, deployed_at = code_fingerprint()
+    payload = repr(([(t, v) for t, v, _ in rows], tuple(key), fingerprint))
+    etag = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+    last_modified = max([u for _, _, u in rows] + [deployed_at, week_start()])
+    return etag, last_modified.replace(microsecond=0)
+
+
+def is_fresh(req, etag, last_modified):
+    """Le client possède déjà cette représentation (If-None-Match prioritaire sur If-Modified-Since)."""
+    if req.if_none_match:
+        return req.if_none_match.contains_weak(etag)
+    if req.if_modified_since:
+        return last_modified <= req.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    # ETag faible : reste valable quel que soit l'encodage (gzip, brotli, identité)
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    # toujours revalider : la page change à la prochaine saisie
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional(*tables, key=None, primary=False):
+    """
+    GET conditionnelle : 304 tant que les versions de `tables` et key() (éléments
+    de la page indépendants des tables) correspondent à l'ETag du client.
+    Les pages porteuses d'un message flash ne sont jamais validées.
+    `primary` : la vue lit le primaire (versions lues sur le même serveur).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+            try:
+                # même connexion que les lectures de la vue : un ETag ne décrit jamais une
+                # version plus récente que les données d'une réplique en retard
+                conn = get_db_connection() if primary else get_read_connection()
+                with conn.cursor() as cur:
+                    cur.execute(VERSION_SQL, (list(tables),))
+                    rows = cur.fetchall()
+                etag, last_modified = validators(rows, key() if key else ())
+            except psycopg2.Error:
+                # table absente (migration 5 non appliquée), base injoignable... : la vue
+                # répond sans validateurs et signale elle-même les erreurs
+                for name in ('db_read_conn', 'db_conn'):
+                    if g.get(name) is not None:
+                        g.get(name).rollback()
+                return view(*args, **kwargs)
+
+            if is_fresh(request, etag, last_modified):
+                return set_validators(make_response('', 304), etag, last_modified)
+            # une écriture validée entre la lecture des versions et les SELECT de la vue ne
+            # fait qu'associer une page plus récente à l'ancien ETag (revalidée au prochain passage)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or get_flashed_messages():
+                return response
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+# -----------------------------------------------------------------------------
+# Compression
+# -----------------------------------------------------------------------------
+def choose_encoding(accept_encodings):
+    return accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compressible(response):
+    return (
+        response.status_code == 200
+        and 'Content-Encoding' not in response.headers
+        and (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+    )
+
+
+def init_http_cache(app):
+    """Compression des réponses texte / JSON complètes."""
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+
+    @app.after_request
+    def _compress(response):
+        if not compressible(response) or response.direct_passthrough or response.is_streamed:
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None or len(data) < min_size:
+            return response
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
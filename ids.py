@@ -0,0 +1,111 @@
+# ids.py
+"""
+Identifiants courts et lisibles, préfixés par l'année : '25-8FK2Z91P'.
+
+Partagés par les blueprints RH et VOH, la variante asyncio et l'import
+historique. Deux modes d'allocation (ID_ALLOCATION) :
+
+- 'random' (défaut) : tous les ID d'un lot sont tirés d'un seul tampon
+  secrets.token_bytes(), converti en une passe (bytes.translate) ; 32 divise
+  256, chaque octet donne donc un caractère de ALPHABET sans biais. Les
+  doublons du lot sont écartés et remplacés avant de partir en base ;
+- 'sequence' : les ID sont réservés en un aller-retour sur la séquence
+  `short_id_seq` (migration 10), puis chaque valeur est permutée (réseau de
+  Feistel sur 40 bits, bijectif) et écrite en base 32 avec le même ALPHABET.
+  Deux valeurs de séquence distinctes donnent toujours deux ID distincts ;
+  seule une collision avec un ID aléatoire plus ancien reste possible, d'où
+  le ON CONFLICT conservé dans db.bulk_insert_with_short_ids().
+
+La permutation évite des ID consécutifs (prévisibles, et qui se ressemblent
+à l'écran) ; ce n'est pas un chiffrement.
+"""
+
+import secrets
+
+from config import Config
+
+ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # lisible: pas de 0/O/I/l
+CORE_LEN = 8                                    # 8 caractères x 5 bits = 40 bits
+SEQUENCE = "short_id_seq"
+
+# octet -> caractère (5 bits de poids faible)
+_BYTE_TO_CHAR = bytes(ord(ALPHABET[b % len(ALPHABET)]) for b in range(256))
+
+_HALF_BITS = CORE_LEN * 5 // 2
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_FEISTEL_KEYS = (0x5A3C1, 0xB7E15, 0x3F9A7, 0xC2D4B)
+
+RESERVE_SQL = f"SELECT nextval('public.{SEQUENCE}') FROM generate_series(1, %s)"
+
+
+def install(cur):
+    """Séquence des ID réservés (migration 10) : 2^40 valeurs, autant que d'ID de 8 caractères."""
+    cur.execute(f"CREATE SEQUENCE IF NOT EXISTS public.{SEQUENCE} MAXVALUE {(1 << CORE_LEN * 5) - 1} NO CYCLE")
+
+
+def year_prefix(year: int) -> str:
+    """Retourne un préfixe année sur 2 chiffres + tiret, ex: 2025 -> '25-'"""
+    return f"{str(year)[-2:]}-"
+
+
+# -----------------------------------------------------------------------------
+# Mode aléatoire
+# -----------------------------------------------------------------------------
+def random_ids(year: int, count: int, core_len: int = CORE_LEN, exclude=()) -> list:
+    """`count` ID distincts (et absents de `exclude`) tirés d'un seul tampon aléatoire par passe."""
+    prefix = year_prefix(year)
+    ids = {}
+    while len(ids) < count:
+        missing = count - len(ids)
+        chars = secrets.token_bytes(missing * core_len).translate(_BYTE_TO_CHAR).decode('ascii')
+        for i in range(0, len(chars), core_len):
+            rid = prefix + chars[i:i + core_len]
+            if rid not in exclude:
+                ids[rid] = None
+    return list(ids)
+
+
+def new_id_year_prefixed(year: int, core_len: int = CORE_LEN) -> str:
+    """
+    Génère un identifiant lisible, court et préfixé par l'année (2 chiffres).
+    Exemple: '25-8FK2Z91P'
+    """
+    return random_ids(year, 1, core_len)[0]
+
+
+# -----------------------------------------------------------------------------
+# Mode séquence
+# -----------------------------------------------------------------------------
+def _permute(value: int) -> int:
+    """Permutation bijective de [0, 2^40) (Feistel, 4 tours)."""
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for key in _FEISTEL_KEYS:
+        left, right = right, left ^ (((right * 0x9E3779B1) ^ key) >> 7 & _HALF_MASK)
+    return (left << _HALF_BITS) | right
+
+
+def encode(year: int, value: int) -> str:
+    """Valeur de séquence -> ID préfixé (base 32, ALPHABET)."""
+    value = _permute(value)
+    chars = []
+    for _ in range(CORE_LEN):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return year_prefix(year) + "".join(reversed(chars))
+
+
+def sequence_ids(cur, year: int, count: int, exclude=()) -> list:
+    """`count` ID réservés sur la séquence en un seul aller-retour."""
+    cur.execute(RESERVE_SQL, (count,))
+    ids = [encode(year, value) for value, in cur.fetchall()]
+    ids = [rid for rid in ids if rid not in exclude]
+    if len(ids) < count:  # ID déjà utilisé dans le lot (improbable) : compléter
+        ids += sequence_ids(cur, year, count - len(ids), exclude)
+    return ids
+
+
+def allocate(cur, year: int, count: int, exclude=()) -> list:
+    """`count` ID distincts pour l'année, selon ID_ALLOCATION."""
+    if Config.ID_ALLOCATION == 'sequence':
+        return sequence_ids(cur, year, count, exclude)
+    return random_ids(year, count, exclude=exclude)
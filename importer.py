@@ -0,0 +1,335 @@
+# importer.py
+"""
+Import en masse de semaines historiques (CSV / XLSX) dans weekly_dl_metrics
+ou weekly_voh_metrics.
+
+Chaîne de traitement :
+1. lecture du fichier (CSV ';' ou ',', BOM toléré ; XLSX en lecture seule) ;
+2. validation ligne à ligne contre le référentiel des lignes / fonctions
+   (registry.py, lignes retirées comprises) et leur type, avec les mêmes coefficients que le formulaire
+   (H125 x1.25, H150 x0.5, H200 x2) ;
+3. génération des ID préfixés par l'année en bloc ;
+4. COPY vers une table temporaire, puis une seule requête de fusion
+   (les couples BU/ligne/semaine/année déjà présents sont ignorés) ;
+5. recalcul des agrégats des semaines touchées, dans la même transaction.
+
+Le fichier attendu reprend les colonnes de l'export (/rh/export.csv,
+/voh/export.csv) : heures saisies, sans coefficient. "ID" et "Import_Date"
+sont facultatifs.
+"""
+
+import csv
+import io
+import json
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+import click
+
+from history import annotate, ensure_partitions
+from ids import allocate
+from registry import catalog
+from rollups import refresh_rollup
+
+try:  # dépendance optionnelle (import XLSX)
+    from openpyxl import load_workbook  # type: ignore
+except ImportError:  # pragma: no cover
+    load_workbook = None
+
+MAX_ID_TRIES = 5
+HOUR_WEIGHTS = {'H100': 1, 'H125': 1.25, 'H150': 0.5, 'H200': 2}
+
+
+class _SemicolonDialect(csv.excel):
+    delimiter = ';'  # séparateur des exports (Excel en français)
+
+
+class ImportErrors(ValueError):
+    """Le fichier contient des lignes invalides (rien n'a été chargé)."""
+
+    def __init__(self, report):
+        super().__init__(f"{len(report['errors'])} ligne(s) invalide(s)")
+        self.report = report
+
+
+# -----------------------------------------------------------------------------
+# Lecture du fichier
+# -----------------------------------------------------------------------------
+def read_rows(filename, stream):
+    """Retourne (en-têtes, itérable de lignes) pour un fichier CSV ou XLSX."""
+    if filename.lower().endswith('.xlsx'):
+        if load_workbook is None:
+            raise ValueError("Import XLSX indisponible (openpyxl non installé).")
+        wb = load_workbook(stream, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        return [str(h or '').strip() for h in header], rows
+
+    raw = stream.read()
+    text = raw.decode('utf-8-sig') if isinstance(raw, bytes) else raw.lstrip('\ufeff')
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=';,')
+    except csv.Error:
+        dialect = _SemicolonDialect
+    reader = csv.reader(io.StringIO(text), dialect)
+    header = next(reader, [])
+    return [h.strip() for h in header], reader
+
+
+# -----------------------------------------------------------------------------
+# Validation
+# -----------------------------------------------------------------------------
+MIN_YEAR = 2000  # borne basse des années importées (la borne haute suit l'année courante + 1)
+
+def _number(value, cast):
+    if value is None or str(value).strip() == '':
+        return cast(0)
+    number = value if isinstance(value, (int, float)) else float(str(value).strip().replace(',', '.'))
+    if cast is int and not float(number).is_integer():
+        raise ValueError(f"nombre entier attendu : {value}")  # 12,7 n'est pas tronqué en 12
+    return cast(number)
+
+
+def _weekno(value):
+    n = int(str(value).strip().upper().lstrip('W'))
+    if not 1 <= n <= 53:
+        raise ValueError(f"semaine hors bornes : {value}")
+    return f"W{n}"
+
+
+def _year(value):
+    year = _number(value, int)
+    if not MIN_YEAR <= year <= date.today().year + 1:
+        raise ValueError(f"année hors bornes ({MIN_YEAR}-{date.today().year + 1}) : {value}")
+    return year
+
+
+def _date(value):
+    if value is None or str(value).strip() == '':
+        return date.today()
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"date invalide : {value}")
+
+
+def validate(spec, header, rows, lines):
+    """
+    Valide et convertit les lignes du fichier (`lines` : instantané du référentiel).
+    Retourne (lignes valides, erreurs) ; chaque erreur = {'line', 'error'}.
+    """
+    line_column = spec['line_column']
+    typed = spec['typed']
+    index = {h.lower(): i for i, h in enumerate(header)}
+    required = ['BU', line_column, 'DL_Headcount', *HOUR_WEIGHTS, 'WeekNo', 'Year']
+    missing = [c for c in required if c.lower() not in index]
+    if missing:
+        raise ValueError(f"Colonnes manquantes : {', '.join(missing)}")
+
+    def cell(row, name):
+        i = index.get(name.lower())
+        return row[i] if i is not None and i < len(row) else None
+
+    valid, errors, seen = [], [], {}
+    for n, row in enumerate(rows, start=2):  # ligne 1 = en-têtes
+        if not any(v not in (None, '') for v in row):
+            continue
+        try:
+            bu = str(cell(row, 'BU') or '').strip().upper()
+            line = str(cell(row, line_column) or '').strip()
+            if bu not in lines.known:
+                raise ValueError(f"BU inconnue : {bu or '(vide)'}")
+            if line not in lines.known[bu]:
+                raise ValueError(f"{line_column} inconnu(e) pour {bu} : {line or '(vide)'}")
+
+            record = {
+                'BU': bu,
+                line_column: line,
+                'DL_Headcount': _number(cell(row, 'DL_Headcount'), int),
+                'WeekNo': _weekno(cell(row, 'WeekNo')),
+                'Import_Date': _date(cell(row, 'Import_Date')),
+                'Year': _year(cell(row, 'Year')),
+            }
+            for col, weight in HOUR_WEIGHTS.items():
+                record[col] = _number(cell(row, col), float) * weight
+
+            if typed:
+                expected = lines.type_map[line]
+                given = str(cell(row, 'Type') or '').strip().upper()
+                if given and given != expected:
+                    raise ValueError(f"Type {given} incohérent pour {line} (attendu : {expected})")
+                record['Type'] = expected
+
+            key = (bu, line, record['WeekNo'], record['Year'])
+            if key in seen:
+                raise ValueError(f"doublon de la ligne {seen[key]} ({bu} / {line} / {key[2]} / {key[3]})")
+            seen[key] = n
+            valid.append(record)
+        except (TypeError, ValueError) as e:
+            errors.append({'line': n, 'error': str(e)})
+    return valid, errors
+
+
+# -----------------------------------------------------------------------------
+# Chargement : COPY -> table temporaire -> fusion
+# -----------------------------------------------------------------------------
+def _columns(spec):
+    cols = ['ID', 'BU', spec['line_column']]
+    if spec['typed']:
+        cols.append('Type')
+    return cols + ['DL_Headcount', *HOUR_WEIGHTS, 'WeekNo', 'Import_Date', 'Year']
+
+
+def load(cur, spec, records):
+    """
+    Charge `records` (déjà validés) dans la table du blueprint.
+    Retourne la liste des (ID, Year, WeekNo) réellement insérés.
+    """
+    table = spec['table']
+    cols = _columns(spec)
+    col_list = ", ".join(f'"{c}"' for c in cols)
+
+    cur.execute(f"""
+        CREATE TEMP TABLE import_staging
+        (LIKE public.{table} INCLUDING DEFAULTS) ON COMMIT DROP
+    """)
+
+    # ID générés en bloc, un lot par année (sans doublon dans le fichier)
+    ids = set()
+    by_year = defaultdict(list)
+    for record in records:
+        by_year[record['Year']].append(record)
+    for year, group in by_year.items():
+        for record, rid in zip(group, allocate(cur, year, len(group), exclude=ids)):
+            record['ID'] = rid
+            ids.add(rid)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow(['' if record[c] is None else record[c] for c in cols])
+    buffer.seek(0)
+    cur.copy_expert(f"COPY import_staging ({col_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    # Régénère les ID qui existent déjà dans la table cible
+    for _ in range(MAX_ID_TRIES):
+        cur.execute(f'SELECT s."ID", s."Year" FROM import_staging s JOIN public.{table} t USING ("ID")')
+        collisions = cur.fetchall()
+        if not collisions:
+            break
+        by_year = defaultdict(list)
+        for old_id, year in collisions:
+            by_year[year].append(old_id)
+        for year, old_ids in by_year.items():
+            for old_id, fresh in zip(old_ids, allocate(cur, year, len(old_ids), exclude=ids)):
+                ids.add(fresh)
+                cur.execute('UPDATE import_staging SET "ID" = %s WHERE "ID" = %s', (fresh, old_id))
+    else:
+        raise RuntimeError("Impossible de générer des ID uniques pour l'import.")
+
+    line_column = spec['line_column']
+    cur.execute(f"""
+        INSERT INTO public.{table} ({col_list})
+        SELECT {col_list} FROM import_staging s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM public.{table} t
+            WHERE t."BU" = s."BU" AND t."{line_column}" = s."{line_column}"
+              AND t."WeekNo" = s."WeekNo" AND t."Year" = s."Year"
+        )
+        ON CONFLICT DO NOTHING
+        RETURNING "ID", "Year", "WeekNo"
+    """)
+    return cur.fetchall()
+
+
+def run_import(conn, spec, filename, stream, skip_invalid=False, context=None):
+    """
+    Importe un fichier complet dans une transaction.
+
+    Par défaut, tout ou rien : la moindre ligne invalide lève ImportErrors
+    (avec le rapport). Avec skip_invalid=True, seules les lignes valides sont
+    chargées et les erreurs figurent dans le rapport.
+    Retourne le rapport : lignes lues, valides, insérées, ignorées, erreurs, débit.
+    `context` : métadonnées du journal des modifications (par défaut : la requête courante).
+    """
+    started = time.perf_counter()
+    header, rows = read_rows(filename, stream)
+    valid, errors = validate(spec, header, rows, catalog(spec['source'], conn))
+    report = {
+        'rows_read': len(valid) + len(errors),
+        'valid': len(valid),
+        'inserted': 0,
+        'skipped_existing': 0,
+        'errors': errors,
+    }
+    if errors and not skip_invalid:
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        raise ImportErrors(report)
+
+    # partitions du journal des années importées, avant la transaction de l'import
+    ensure_partitions(conn, {record['Year'] for record in valid})
+
+    cur = conn.cursor()
+    try:
+        annotate(cur, context)
+        inserted = load(cur, spec, valid) if valid else []
+        touched = {}
+        for _id, year, weekno in inserted:
+            touched.setdefault(year, set()).add(weekno)
+        for year, weeks in touched.items():
+            refresh_rollup(cur, spec['source'], year, weeks)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    seconds = time.perf_counter() - started
+    report.update(
+        inserted=len(inserted),
+        skipped_existing=len(valid) - len(inserted),
+        weeks=sorted((y, w) for y, weeks in touched.items() for w in weeks),
+        seconds=round(seconds, 3),
+        rows_per_second=round(len(inserted) / seconds, 1) if seconds else None,
+    )
+    return report
+
+
+# -----------------------------------------------------------------------------
+# CLI : flask import-weeks {rh|voh} FICHIER [--skip-invalid]
+# -----------------------------------------------------------------------------
+def import_specs():
+    """Spécifications d'import des blueprints (import tardif : pas de cycle)."""
+    from rh_app.routes import IMPORT_SPEC as rh_spec
+    from voh_app.routes import IMPORT_SPEC as voh_spec
+    return {'rh': rh_spec, 'voh': voh_spec}
+
+
+def register_cli(app):
+    @app.cli.command('import-weeks')
+    @click.argument('target', type=click.Choice(['rh', 'voh']))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--skip-invalid', is_flag=True, help="Charge les lignes valides malgré les erreurs.")
+    def import_weeks(target, path, skip_invalid):
+        """Importe des semaines historiques (CSV / XLSX) dans la table RH ou VOH."""
+        from cache import filled_weeks
+
+        spec = import_specs()[target]
+        with open(path, 'rb') as stream, app.extensions['db_pool'].connection() as conn:
+            try:
+                report = run_import(conn, spec, path, stream, skip_invalid=skip_invalid,
+                                    context={'route': 'import-weeks', 'method': 'CLI', 'path': path})
+            except ImportErrors as e:
+                click.echo(json.dumps(e.report, indent=2, ensure_ascii=False))
+                raise click.ClickException(f"{e} : aucune donnée chargée (--skip-invalid pour ignorer).")
+        filled_weeks.invalidate_prefix((spec['table'],))
+        click.echo(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,336 @@
+# instrumentation.py
+"""
+Instrumentation transversale des requêtes HTTP et des accès PostgreSQL.
+
+Pour chaque requête Flask sont mesurés :
+- la durée totale (before_request -> after_request) ;
+- l'attente d'une connexion du pool (db.get_db_connection) ;
+- chaque execute / fetch* / COPY (durée, nombre de lignes) ;
+- le rendu des templates Jinja (signaux before_render_template / template_rendered).
+
+Restitution :
+- en-tête Server-Timing (visible dans l'onglet Réseau du navigateur) ;
+- une ligne de log JSON par requête (logger 'metrics.requests'), et un
+  avertissement par requête SQL plus lente que SLOW_QUERY_MS ;
+- /metrics au format texte Prometheus (histogrammes par route et par type
+  de requête SQL, jauges du pool et des caches).
+
+Les connexions du pool sont créées avec InstrumentedConnection (db.init_pool) :
+les curseurs demandés par les routes (DictCursor, curseurs nommés...) sont
+enveloppés sans changer leur type apparent.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import psycopg2.extensions  # type: ignore
+from flask import g, has_request_context, request, before_render_template, template_rendered
+
+logger = logging.getLogger('metrics.requests')
+query_logger = logging.getLogger('metrics.queries')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+_slow_query_seconds = None  # fixé par init_instrumentation (None = pas de log)
+
+
+# -----------------------------------------------------------------------------
+# Métriques Prometheus (sans dépendance externe)
+# -----------------------------------------------------------------------------
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for n, v in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Histogram:
+    """Histogramme cumulatif thread-safe, une série par combinaison de labels."""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [compteurs par borne..., somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        names = self.labelnames + ('le',)
+        for labels, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (repr(bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', "Durée des requêtes HTTP par route.",
+    ('endpoint', 'method', 'status'))
+QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', "Durée des appels PostgreSQL par type d'instruction.",
+    ('statement',), QUERY_BUCKETS)
+ACQUIRE_LATENCY = Histogram(
+    'db_pool_acquire_duration_seconds', "Attente d'une connexion du pool.",
+    (), QUERY_BUCKETS)
+RENDER_LATENCY = Histogram(
+    'template_render_duration_seconds', "Durée de rendu des templates Jinja.",
+    ('template',), QUERY_BUCKETS)
+
+
+def _gauge(name, help, samples, type_='gauge'):
+    """samples : liste de (dict de labels, valeur)."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {type_}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return lines
+
+
+def render_metrics(pool_stats=None, cache_stats=None, startup=None, guard_stats=None):
+    """Corps de /metrics (format texte Prometheus 0.0.4)."""
+    lines = []
+    for histogram in (REQUEST_LATENCY, QUERY_LATENCY, ACQUIRE_LATENCY, RENDER_LATENCY):
+        lines += histogram.render()
+    if startup:
+        lines += _gauge("app_startup_seconds", "Durée du démarrage par phase (voir run.create_app).",
+                        [({'phase': name}, seconds) for name, seconds in startup['phases'].items()]
+                        + [({'phase': 'total'}, startup['total'])])
+    if pool_stats:
+        for key in ('size', 'idle', 'in_use', 'max'):
+            lines += _gauge(f"db_pool_{key}", f"Pool de connexions : {key}.", [({}, pool_stats[key])])
+        for key in ('checkouts', 'waits', 'timeouts', 'created', 'recycled', 'discarded'):
+            lines += _gauge(f"db_pool_{key}_total", f"Pool de connexions : {key}.",
+                            [({}, pool_stats[key])], 'counter')
+    if cache_stats:
+        for key in ('hits', 'misses', 'invalidations'):
+            lines += _gauge(f"cache_{key}_total", f"Caches en mémoire : {key}.",
+                            [({'cache': name}, s[key]) for name, s in cache_stats.items()], 'counter')
+        lines += _gauge("cache_size", "Caches en mémoire : entrées.",
+                        [({'cache': name}, s['size']) for name, s in cache_stats.items()])
+    if guard_stats:
+        lines += _gauge("write_guard_requests_total", "Routes d'écriture : POST admis, refusés (débit), rejoués, en cours.",
+                        [({'outcome': key}, guard_stats[key]) for key in ('allowed', 'rejected', 'replayed', 'in_flight')],
+                        'counter')
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------------------------------------------------------
+# Mesures par requête (stockées dans g)
+# -----------------------------------------------------------------------------
+def _timings():
+    if not has_request_context():
+        return None
+    t = g.get('_timings')
+    if t is None:
+        t = g._timings = {'db': 0.0, 'queries': 0, 'rows': 0, 'acquire': 0.0, 'render': 0.0}
+    return t
+
+
+def _statement(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    if not isinstance(query, str):  # psycopg2.sql.Composed
+        return 'OTHER', str(query)
+    words = query.split(None, 1)
+    return (words[0].upper() if words else 'OTHER'), query
+
+
+def record_query(query, seconds, rows=None):
+    kind, text = _statement(query)
+    QUERY_LATENCY.observe(seconds, kind)
+    t = _timings()
+    if t is not None:
+        t['db'] += seconds
+        t['queries'] += 1
+        if rows is not None and rows > 0:
+            t['rows'] += rows
+    if _slow_query_seconds is not None and seconds >= _slow_query_seconds:
+        query_logger.warning(json.dumps({
+            'event': 'slow_query',
+            'statement': kind,
+            'duration_ms': round(seconds * 1000, 2),
+            'rows': rows,
+            'endpoint': request.endpoint if has_request_context() else None,
+            'sql': " ".join(text.split())[:500],
+        }, ensure_ascii=False))
+
+
+def record_fetch(seconds, rows):
+    t = _timings()
+    if t is not None:
+        t['db'] += seconds
+        t['rows'] += rows
+
+
+def record_acquire(seconds):
+    """Appelé par db.get_db_connection (attente d'une connexion du pool)."""
+    ACQUIRE_LATENCY.observe(seconds)
+    t = _timings()
+    if t is not None:
+        t['acquire'] += seconds
+
+
+# -----------------------------------------------------------------------------
+# Connexions / curseurs instrumentés
+# -----------------------------------------------------------------------------
+class _TimedCursorMixin:
+    def _affected(self):
+        # lignes écrites ; les lignes lues sont comptées par fetch*
+        return self.rowcount if self.description is None else None
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started, self._affected())
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - started, self._affected())
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_query(sql, time.perf_counter() - started, self._affected())
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        record_fetch(time.perf_counter() - started, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        record_fetch(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        record_fetch(time.perf_counter() - started, len(rows))
+        return rows
+
+
+_timed_classes = {}
+_timed_lock = threading.Lock()
+
+
+def _timed_cursor_class(base):
+    cls = _timed_classes.get(base)
+    if cls is None:
+        with _timed_lock:
+            cls = _timed_classes.get(base)
+            if cls is None:
+                cls = type(base.__name__, (_TimedCursorMixin, base), {})
+                _timed_classes[base] = cls
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connexion dont tous les curseurs (quelle que soit leur fabrique) sont chronométrés."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _timed_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+# -----------------------------------------------------------------------------
+# Branchement Flask
+# -----------------------------------------------------------------------------
+def _server_timing(t, total):
+    parts = [f'app;dur={total * 1000:.1f}']
+    if t['acquire']:
+        parts.append(f'acquire;dur={t["acquire"] * 1000:.1f}')
+    if t['queries']:
+        # en-tête HTTP : ASCII uniquement
+        parts.append(f'db;dur={t["db"] * 1000:.1f};desc="{t["queries"]} queries, {t["rows"]} rows"')
+    if t['render']:
+        parts.append(f'tpl;dur={t["render"] * 1000:.1f}')
+    return ", ".join(parts)
+
+
+def init_instrumentation(app):
+    """Branche les hooks de requête et de rendu ; à appeler avant l'enregistrement des routes."""
+    global _slow_query_seconds
+    slow_ms = app.config.get('SLOW_QUERY_MS')
+    _slow_query_seconds = slow_ms / 1000 if slow_ms else None
+    server_timing = app.config.get('SERVER_TIMING', True)
+
+    @app.before_request
+    def _start_timer():
+        g._request_started = time.perf_counter()
+        _timings()
+
+    @app.after_request
+    def _emit_timings(response):
+        started = g.pop('_request_started', None)
+        t = g.get('_timings')
+        if started is None or t is None:
+            return response
+        total = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint != 'metrics':
+            REQUEST_LATENCY.observe(total, endpoint, request.method, str(response.status_code))
+        if server_timing:
+            response.headers['Server-Timing'] = _server_timing(t, total)
+        logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 2),
+            'acquire_ms': round(t['acquire'] * 1000, 2),
+            'db_ms': round(t['db'] * 1000, 2),
+            'db_queries': t['queries'],
+            'db_rows': t['rows'],
+            'render_ms': round(t['render'] * 1000, 2),
+            'streamed': response.is_streamed,
+        }, ensure_ascii=False))
+        return response
+
+    @before_render_template.connect_via(app)
+    def _render_started(sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('_render_stack', []).append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def _render_finished(sender, template, context, **extra):
+        stack = g.get('_render_stack') if has_request_context() else None
+        if not stack:
+            return
+        seconds = time.perf_counter() - stack.pop()
+        RENDER_LATENCY.observe(seconds, template.name or 'inline')
+        t = _timings()
+        if t is not None:
+            t['render'] += seconds
@@ -0,0 +1,325 @@
+# jobs.py
+"""
+File de travaux de fond persistante (table `jobs`) et workers en threads.
+
+Une route enregistre le travail à faire après la réponse avec enqueue(),
+dans la transaction de son écriture : le travail n'existe que si l'écriture
+est validée, et survit à un redémarrage. Les workers (start_workers, un
+thread par worker et par processus) réservent les travaux avec
+FOR UPDATE SKIP LOCKED : plusieurs workers, y compris dans d'autres
+processus, ne prennent jamais le même travail.
+
+Cycle de vie : queued -> running -> done, ou retour à queued avec un délai
+exponentiel (JOB_BACKOFF_BASE x 2^(tentative-1), plafonné) tant que
+JOB_MAX_ATTEMPTS n'est pas atteint, puis failed. Un travail "running" dont le
+bail (JOB_LEASE) a expiré (worker arrêté en cours de route) est repris.
+
+Le gestionnaire d'un travail et son passage à "done" partagent la même
+transaction : une écriture en base faite par un travail n'est jamais validée
+deux fois.
+
+Types de travaux : fonctions décorées par @handler('nom'), appelées avec
+(curseur, payload).
+"""
+
+import json
+import logging
+import threading
+import time
+
+import click
+import psycopg2  # type: ignore
+import psycopg2.errors  # type: ignore
+
+from rollups import refresh_rollup
+
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE = "jobs"
+MAX_BACKOFF = 3600  # délai maximal entre deux tentatives (s)
+PURGE_EVERY = 3600  # purge des travaux terminés anciens (s)
+
+CREATE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS public.{JOBS_TABLE} (
+        "ID"           bigserial   PRIMARY KEY,
+        "Kind"         text        NOT NULL,
+        "Payload"      jsonb       NOT NULL DEFAULT '{{}}',
+        "Status"       text        NOT NULL DEFAULT 'queued',
+        "Attempts"     integer     NOT NULL DEFAULT 0,
+        "Max_attempts" integer     NOT NULL,
+        "Run_at"       timestamptz NOT NULL DEFAULT now(),
+        "Locked_until" timestamptz,
+        "Created_at"   timestamptz NOT NULL DEFAULT now(),
+        "Started_at"   timestamptz,
+        "Finished_at"  timestamptz,
+        "Last_error"   text
+    )
+"""
+
+# File d'attente : seuls les travaux à prendre sont indexés (l'historique "done" n'alourdit pas la réservation)
+CREATE_INDEX_SQL = f"""
+    CREATE INDEX IF NOT EXISTS ix_{JOBS_TABLE}_pending ON public.{JOBS_TABLE} ("Run_at", "ID")
+    WHERE "Status" IN ('queued', 'running')
+"""
+
+ENQUEUE_SQL = f"""
+    INSERT INTO public.{JOBS_TABLE} ("Kind", "Payload", "Max_attempts")
+    VALUES (%s, %s::jsonb, %s)
+    RETURNING "ID"
+"""
+
+# Réservation : le plus ancien travail dû, ou un travail dont le worker a disparu (bail expiré)
+CLAIM_SQL = f"""
+    UPDATE public.{JOBS_TABLE} AS j SET
+        "Status" = 'running',
+        "Attempts" = j."Attempts" + 1,
+        "Started_at" = now(),
+        "Locked_until" = now() + make_interval(secs => %s)
+    FROM (
+        SELECT "ID" FROM public.{JOBS_TABLE}
+        WHERE ("Status" = 'queued' AND "Run_at" <= now())
+           OR ("Status" = 'running' AND "Locked_until" < now())
+        ORDER BY "Run_at", "ID"
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    ) AS next
+    WHERE j."ID" = next."ID"
+    RETURNING j."ID", j."Kind", j."Payload", j."Attempts", j."Max_attempts"
+"""
+
+DONE_SQL = f"""
+    UPDATE public.{JOBS_TABLE}
+    SET "Status" = 'done', "Finished_at" = now(), "Locked_until" = NULL, "Last_error" = NULL
+    WHERE "ID" = %s
+"""
+
+RETRY_SQL = f"""
+    UPDATE public.{JOBS_TABLE} SET
+        "Status" = CASE WHEN "Attempts" >= "Max_attempts" THEN 'failed' ELSE 'queued' END,
+        "Run_at" = now() + make_interval(secs => %s),
+        "Finished_at" = CASE WHEN "Attempts" >= "Max_attempts" THEN now() END,
+        "Locked_until" = NULL,
+        "Last_error" = %s
+    WHERE "ID" = %s
+    RETURNING "Status"
+"""
+
+PURGE_SQL = f"""
+    DELETE FROM public.{JOBS_TABLE}
+    WHERE "Status" = 'done' AND "Finished_at" < now() - make_interval(days => %s)
+"""
+
+# Page d'état : profondeur de la file par type, latences de l'heure écoulée, derniers échecs
+DEPTH_SQL = f"""
+    SELECT "Kind", "Status", count(*) AS jobs, min("Run_at") AS oldest
+    FROM public.{JOBS_TABLE}
+    WHERE "Status" <> 'done'
+    GROUP BY "Kind", "Status"
+    ORDER BY "Kind", "Status"
+"""
+
+LATENCY_SQL = f"""
+    SELECT "Kind", count(*) AS jobs,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY extract(epoch FROM "Started_at" - "Created_at")) * 1000
+             AS wait_p50_ms,
+           percentile_cont(0.95) WITHIN GROUP (ORDER BY extract(epoch FROM "Started_at" - "Created_at")) * 1000
+             AS wait_p95_ms,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY extract(epoch FROM "Finished_at" - "Started_at")) * 1000
+             AS run_p50_ms,
+           percentile_cont(0.95) WITHIN GROUP (ORDER BY extract(epoch FROM "Finished_at" - "Started_at")) * 1000
+             AS run_p95_ms,
+           avg("Attempts")::float8 AS avg_attempts
+    FROM public.{JOBS_TABLE}
+    WHERE "Status" = 'done' AND "Finished_at" > now() - interval '1 hour'
+    GROUP BY "Kind"
+    ORDER BY "Kind"
+"""
+
+FAILURES_SQL = f"""
+    SELECT "ID", "Kind", "Payload", "Status", "Attempts", "Max_attempts", "Run_at", "Last_error"
+    FROM public.{JOBS_TABLE}
+    WHERE "Last_error" IS NOT NULL AND "Status" IN ('queued', 'failed')
+    ORDER BY "Run_at" DESC
+    LIMIT 20
+"""
+
+RETRY_FAILED_SQL = f"""
+    UPDATE public.{JOBS_TABLE}
+    SET "Status" = 'queued', "Attempts" = 0, "Run_at" = now(), "Finished_at" = NULL
+    WHERE "Status" = 'failed'
+"""
+
+_handlers = {}
+# wake() incrémente le compteur : un worker compare au compteur lu avant de vider la file,
+# un réveil arrivé pendant qu'il travaille n'est donc jamais perdu
+_wakeup = threading.Condition()
+_wakeups = 0
+_settings = {'max_attempts': 5, 'backoff_base': 5.0, 'lease': 300.0}
+
+
+def install(cur):
+    """Table des travaux et index de la file (migration 8)."""
+    cur.execute(CREATE_SQL)
+    cur.execute(CREATE_INDEX_SQL)
+
+
+def handler(kind):
+    """Déclare le gestionnaire des travaux `kind` : fn(cur, payload)."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue_query(kind, payload, max_attempts=None):
+    """(SQL, paramètres) de l'ajout d'un travail (partagé avec la variante asyncio)."""
+    if kind not in _handlers:
+        raise ValueError(f"Type de travail inconnu : {kind}")
+    return ENQUEUE_SQL, (kind, json.dumps(payload), max_attempts or _settings['max_attempts'])
+
+
+def enqueue(cur, kind, payload, max_attempts=None):
+    """Ajoute un travail dans la transaction de l'appelant ; appeler wake() après le COMMIT."""
+    cur.execute(*enqueue_query(kind, payload, max_attempts))
+    return cur.fetchone()[0]
+
+
+def wake():
+    """Réveille les workers de ce processus (les autres le seront à leur prochain passage)."""
+    global _wakeups
+    with _wakeup:
+        _wakeups += 1
+        _wakeup.notify_all()
+
+
+def _wake_count():
+    with _wakeup:
+        return _wakeups
+
+
+def _wait_wake(seen, timeout):
+    """Attend un wake() postérieur à la lecture `seen` de _wake_count(), au plus `timeout` secondes."""
+    with _wakeup:
+        _wakeup.wait_for(lambda: _wakeups != seen, timeout)
+
+
+def backoff(attempts):
+    return min(_settings['backoff_base'] * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+# -----------------------------------------------------------------------------
+# Exécution
+# -----------------------------------------------------------------------------
+def run_next(conn):
+    """Réserve et exécute un travail ; retourne (ID, statut final) ou None si la file est vide."""
+    with conn.cursor() as cur:
+        cur.execute(CLAIM_SQL, (_settings['lease'],))
+        job = cur.fetchone()
+    conn.commit()
+    if job is None:
+        return None
+
+    job_id, kind, payload, attempts, max_attempts = job
+    try:
+        fn = _handlers.get(kind)
+        if fn is None:
+            raise LookupError(f"Aucun gestionnaire pour le type {kind}")
+        with conn.cursor() as cur:
+            fn(cur, payload)
+            cur.execute(DONE_SQL, (job_id,))
+        conn.commit()
+        return job_id, 'done'
+    except Exception as e:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(RETRY_SQL, (backoff(attempts), f"{type(e).__name__}: {e}", job_id))
+            status = cur.fetchone()[0]
+        conn.commit()
+        log = logger.error if status == 'failed' else logger.warning
+        log("Travail %s (%s) en échec, tentative %s/%s : %s", job_id, kind, attempts, max_attempts, e)
+        return job_id, status
+
+
+def drain(conn, limit=None):
+    """Exécute les travaux dus jusqu'à vider la file (CLI, tests) ; retourne le nombre traité."""
+    count = 0
+    while limit is None or count < limit:
+        if run_next(conn) is None:
+            break
+        count += 1
+    return count
+
+
+def start_workers(pool, workers, poll, retention_days=7, **settings):
+    """Lance `workers` threads de fond ; `settings` : max_attempts, backoff_base, lease."""
+    _settings.update({k: v for k, v in settings.items() if v is not None})
+
+    def run(index):
+        purged_at = 0.0
+        while True:
+            seen = _wake_count()  # lu avant de réserver : un wake() pendant le passage relance aussitôt
+            try:
+                with pool.connection() as conn:
+                    while run_next(conn) is not None:
+                        pass
+                    if index == 0 and time.monotonic() - purged_at >= PURGE_EVERY:
+                        with conn.cursor() as cur:
+                            cur.execute(PURGE_SQL, (retention_days,))
+                        conn.commit()
+                        purged_at = time.monotonic()
+            except psycopg2.errors.UndefinedTable:
+                logger.warning("Table %s absente : travaux de fond suspendus (lancer `flask db-upgrade`).", JOBS_TABLE)
+                _wait_wake(seen, 60)
+            except Exception as e:  # base injoignable... : nouvel essai au prochain passage
+                logger.warning("Worker de travaux de fond : %s", e)
+            _wait_wake(seen, poll)
+
+    threads = []
+    for i in range(workers):
+        thread = threading.Thread(target=run, args=(i,), name=f"jobs-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def queue_stats(cur):
+    """Profondeur de la file, latences (attente, exécution) de l'heure écoulée, derniers échecs."""
+    cur.execute(DEPTH_SQL)
+    depth = [dict(r) for r in cur.fetchall()]
+    cur.execute(LATENCY_SQL)
+    latency = [dict(r) for r in cur.fetchall()]
+    cur.execute(FAILURES_SQL)
+    failures = [dict(r) for r in cur.fetchall()]
+    return {'depth': depth, 'latency': latency, 'failures': failures}
+
+
+# -----------------------------------------------------------------------------
+# Travaux
+# -----------------------------------------------------------------------------
+@handler('refresh_rollup')
+def _refresh_rollup(cur, payload):
+    """Agrégats des semaines saisies (rollups.py), hors de la requête de saisie."""
+    refresh_rollup(cur, payload['source'], payload['year'], payload['weeks'])
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+def register_cli(app):
+    @app.cli.command('jobs-run')
+    @click.option('--limit', type=int, default=None, help="Nombre maximal de travaux à exécuter.")
+    def jobs_run(limit):
+        """Exécute les travaux dus au premier plan (sans attendre les workers)."""
+        with app.extensions['db_pool'].connection() as conn:
+            count = drain(conn, limit)
+        click.echo(f"{count} travail(aux) exécuté(s).")
+
+    @app.cli.command('jobs-retry')
+    def jobs_retry():
+        """Remet en file les travaux en échec définitif."""
+        with app.extensions['db_pool'].connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(RETRY_FAILED_SQL)
+                count = cur.rowcount
+            conn.commit()
+        click.echo(f"{count} travail(aux) remis en file.")
@@ -0,0 +1,45 @@
+# jobs_app/routes.py
+
+from flask import Blueprint, render_template, flash, jsonify
+import psycopg2  # type: ignore
+import psycopg2.extras  # type: ignore
+from db import get_db_connection
+from jobs import queue_stats
+
+# -----------------------------------------------------------------------------
+# Flask blueprint : état de la file de travaux de fond (lecture seule)
+# -----------------------------------------------------------------------------
+jobs_bp = Blueprint('jobs', __name__, template_folder='templates')
+
+
+def load_stats():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    return queue_stats(cur)
+
+
+# -----------------------------------------------------------------------------
+# Routes
+# -----------------------------------------------------------------------------
+@jobs_bp.route('/')
+def index():
+    stats = {'depth': [], 'latency': [], 'failures': []}
+    try:
+        stats = load_stats()
+    except psycopg2.Error as db_error:
+        flash(f"❌ Erreur de base de données : {db_error}", 'danger')
+    return render_template('jobs/index.html', **stats)
+
+
+@jobs_bp.route('/api/stats')
+def api_stats():
+    """Profondeur de la file, latences et derniers échecs (JSON)."""
+    try:
+        stats = load_stats()
+    except psycopg2.Error as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+    for row in stats['depth']:
+        row['oldest'] = row['oldest'].isoformat()
+    for row in stats['failures']:
+        row['Run_at'] = row['Run_at'].isoformat()
+    return jsonify(stats)
@@ -0,0 +1,192 @@
+# kpi.py
+"""
+Ratio heures indirectes / heures directes par BU et par semaine.
+
+Vue matérialisée `kpi_indirect_ratio` : une ligne par (Year, WeekNo, BU)
+joignant la partie DL (heures directes) et la partie VOH (heures indirectes
+par type VOH / FOH / ADMIN). Elle est calculée depuis weekly_hours_rollup
+(rollups.py), déjà agrégée par semaine et tenue à jour à chaque écriture : le
+rafraîchissement ne relit jamais les tables brutes.
+
+Rafraîchissement : REFRESH MATERIALIZED VIEW CONCURRENTLY (les lectures ne
+sont pas bloquées ; index unique requis), déclenché
+- par le thread de fond (start_refresh_scheduler) dès que la version de
+  weekly_hours_rollup (table_versions, voir http_cache.py) change, c'est-à-dire
+  après chaque saisie, modification ou import une fois les agrégats recalculés
+  (y compris par un travail de fond, jobs.py), quel que soit le worker ;
+- toutes les KPI_REFRESH_INTERVAL secondes même sans écriture ;
+- à la demande : `flask kpi-refresh`.
+
+La table `materialized_view_refreshes` garde, par vue, les versions sources du
+dernier rafraîchissement : verrouillée FOR UPDATE pendant le rafraîchissement,
+elle évite que plusieurs workers refassent le même travail. Chaque
+rafraîchissement incrémente aussi la version de la vue dans table_versions
+(ETag de la page KPI).
+"""
+
+import logging
+import threading
+import time
+
+import click
+
+from http_cache import VERSIONS_TABLE, VERSION_SQL
+from rollups import ROLLUP_TABLE
+
+logger = logging.getLogger(__name__)
+
+KPI_VIEW = "kpi_indirect_ratio"
+REFRESH_TABLE = "materialized_view_refreshes"
+SOURCE_TABLES = (ROLLUP_TABLE,)
+INDIRECT_TYPES = ("VOH", "FOH", "ADMIN")
+
+_indirect = "\n".join(
+    f"""           COALESCE(sum("Weighted_hours") FILTER (WHERE "Source" = 'VOH' AND "Type" = '{t}'), 0) AS "{t}_hours","""
+    for t in INDIRECT_TYPES
+)
+
+CREATE_VIEW_SQL = f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS public.{KPI_VIEW} AS
+    SELECT "Year", "WeekNo", "BU",
+           CASE WHEN "WeekNo" ~ '^W[0-9]+$' THEN substring("WeekNo" from 2)::int END AS "Week",
+           COALESCE(sum("DL_Headcount") FILTER (WHERE "Source" = 'DL'), 0) AS "Direct_headcount",
+           COALESCE(sum("Weighted_hours") FILTER (WHERE "Source" = 'DL'), 0) AS "Direct_hours",
+           COALESCE(sum("DL_Headcount") FILTER (WHERE "Source" = 'VOH'), 0) AS "Indirect_headcount",
+{_indirect}
+           COALESCE(sum("Weighted_hours") FILTER (WHERE "Source" = 'VOH'), 0) AS "Indirect_hours",
+           sum("Weighted_hours") FILTER (WHERE "Source" = 'VOH')
+             / NULLIF(sum("Weighted_hours") FILTER (WHERE "Source" = 'DL'), 0) AS "Indirect_ratio"
+    FROM public.{ROLLUP_TABLE}
+    GROUP BY "Year", "WeekNo", "BU"
+    WITH DATA
+"""
+
+CREATE_REFRESH_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS public.{REFRESH_TABLE} (
+        "View"            text        PRIMARY KEY,
+        "Source_versions" text,
+        "Refreshed_at"    timestamptz NOT NULL DEFAULT now(),
+        "Duration_ms"     double precision
+    )
+"""
+
+LOCK_STATE_SQL = f'SELECT "Source_versions" FROM public.{REFRESH_TABLE} WHERE "View" = %s FOR UPDATE'
+
+SAVE_STATE_SQL = f"""
+    UPDATE public.{REFRESH_TABLE}
+    SET "Source_versions" = %s, "Refreshed_at" = now(), "Duration_ms" = %s
+    WHERE "View" = %s
+"""
+
+STATE_SQL = f'SELECT "Refreshed_at", "Duration_ms" FROM public.{REFRESH_TABLE} WHERE "View" = %s'
+
+# Même effet que le trigger bump_table_version() (une vue matérialisée n'a pas de trigger)
+BUMP_VIEW_VERSION_SQL = f"""
+    INSERT INTO public.{VERSIONS_TABLE} AS v ("Table", "Version", "Updated_at")
+    VALUES (%s, 1, clock_timestamp())
+    ON CONFLICT ("Table") DO UPDATE SET "Version" = v."Version" + 1, "Updated_at" = clock_timestamp()
+"""
+
+# Lecture de la page / de l'API : une année, semaines dans l'ordre
+SELECT_SQL = f"""
+    SELECT "Year", "WeekNo", "BU", "Direct_headcount", "Direct_hours", "Indirect_headcount",
+           {", ".join(f'"{t}_hours"' for t in INDIRECT_TYPES)}, "Indirect_hours", "Indirect_ratio"
+    FROM public.{KPI_VIEW}
+    WHERE "Year" = %s
+    ORDER BY "Week" NULLS LAST, "WeekNo", "BU"
+"""
+
+YEARS_SQL = f'SELECT DISTINCT "Year" FROM public.{KPI_VIEW} ORDER BY 1 DESC'
+
+
+def install(cur):
+    """Vue matérialisée, index unique (REFRESH CONCURRENTLY) et état des rafraîchissements (migration 7)."""
+    cur.execute(CREATE_VIEW_SQL)
+    cur.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS ux_{KPI_VIEW} ON public.{KPI_VIEW} ("Year", "WeekNo", "BU")')
+    cur.execute(CREATE_REFRESH_TABLE_SQL)
+    cur.execute(f'INSERT INTO public.{REFRESH_TABLE} ("View") VALUES (%s) ON CONFLICT DO NOTHING', (KPI_VIEW,))
+    cur.execute(BUMP_VIEW_VERSION_SQL, (KPI_VIEW,))
+
+
+# -----------------------------------------------------------------------------
+# Rafraîchissement
+# -----------------------------------------------------------------------------
+def source_versions(cur):
+    cur.execute(VERSION_SQL, (list(SOURCE_TABLES),))
+    return repr([(table, version) for table, version, _ in cur.fetchall()])
+
+
+def refresh(conn, force=False):
+    """
+    Rafraîchit la vue si les tables sources ont changé depuis le dernier rafraîchissement
+    (tous workers confondus), ou toujours si `force`. Retourne la durée en ms, ou None si rien à faire.
+    """
+    with conn.cursor() as cur:
+        cur.execute(LOCK_STATE_SQL, (KPI_VIEW,))
+        row = cur.fetchone()
+        # version lue avant le REFRESH : une écriture concurrente déclenchera simplement le suivant
+        versions = source_versions(cur)
+        if row is not None and row[0] == versions and not force:
+            conn.rollback()
+            return None
+        started = time.perf_counter()
+        cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY public.{KPI_VIEW}")
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        cur.execute(SAVE_STATE_SQL, (versions, duration_ms, KPI_VIEW))
+        cur.execute(BUMP_VIEW_VERSION_SQL, (KPI_VIEW,))
+    conn.commit()
+    logger.info("Vue %s rafraîchie en %.1f ms", KPI_VIEW, duration_ms)
+    return duration_ms
+
+
+def view_installed(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (f"public.{REFRESH_TABLE}",))
+        installed = cur.fetchone()[0] is not None
+    conn.rollback()
+    return installed
+
+
+def start_refresh_scheduler(pool, poll, interval):
+    """
+    Thread de fond : toutes les `poll` secondes, rafraîchit la vue si une écriture a eu lieu ;
+    toutes les `interval` secondes, la rafraîchit quoi qu'il arrive. Ne fait jamais échouer l'app.
+    """
+    def run():
+        forced_at = time.monotonic()
+        warned = False
+        while True:
+            time.sleep(poll)
+            force = time.monotonic() - forced_at >= interval
+            try:
+                with pool.connection() as conn:
+                    if not view_installed(conn):
+                        if not warned:
+                            logger.warning("Vue %s absente : rafraîchissement suspendu (lancer `flask db-upgrade`).",
+                                           KPI_VIEW)
+                            warned = True
+                        continue
+                    refresh(conn, force=force)
+                warned = False
+                if force:
+                    forced_at = time.monotonic()
+            except Exception as e:  # base injoignable, verrou... : nouvel essai au prochain passage
+                logger.warning("Rafraîchissement de %s impossible : %s", KPI_VIEW, e)
+
+    thread = threading.Thread(target=run, name="kpi-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+def register_cli(app):
+    @app.cli.command('kpi-refresh')
+    @click.option('--force', is_flag=True, help="Rafraîchir même si les tables sources n'ont pas changé.")
+    def kpi_refresh(force):
+        """Rafraîchit la vue matérialisée du ratio indirects / directs."""
+        with app.extensions['db_pool'].connection() as conn:
+            duration_ms = refresh(conn, force=force)
+        click.echo(f"{KPI_VIEW} rafraîchie en {duration_ms} ms." if duration_ms is not None
+                   else f"{KPI_VIEW} déjà à jour.")
@@ -0,0 +1,77 @@
+# kpi_app/routes.py
+
+from flask import Blueprint, render_template, request, flash, jsonify
+import psycopg2  # type: ignore
+import psycopg2.extras  # type: ignore
+from datetime import datetime
+from db import get_read_connection
+from http_cache import conditional
+from kpi import KPI_VIEW, INDIRECT_TYPES, SELECT_SQL, STATE_SQL, YEARS_SQL
+
+# -----------------------------------------------------------------------------
+# Flask blueprint : ratio heures indirectes / directes (lit uniquement la vue matérialisée)
+# -----------------------------------------------------------------------------
+kpi_bp = Blueprint('kpi', __name__, template_folder='templates')
+
+
+def requested_year() -> int:
+    return request.args.get('year', type=int) or datetime.now().year
+
+
+def load_kpi(cur, year: int):
+    """Lignes (semaine, BU) de l'année + date du dernier rafraîchissement."""
+    cur.execute(SELECT_SQL, (year,))
+    rows = [dict(r) for r in cur.fetchall()]
+    cur.execute(STATE_SQL, (KPI_VIEW,))
+    state = cur.fetchone()
+    return rows, (dict(state) if state else None)
+
+
+def totals_by_bu(rows):
+    """Cumul de l'année par BU (ratio recalculé sur les cumuls, pas moyenne des ratios)."""
+    totals = {}
+    for r in rows:
+        t = totals.setdefault(r['BU'], {'BU': r['BU'], 'Direct_hours': 0.0, 'Indirect_hours': 0.0})
+        t['Direct_hours'] += r['Direct_hours']
+        t['Indirect_hours'] += r['Indirect_hours']
+    for t in totals.values():
+        t['Indirect_ratio'] = t['Indirect_hours'] / t['Direct_hours'] if t['Direct_hours'] else None
+    return list(totals.values())
+
+
+# -----------------------------------------------------------------------------
+# Routes
+# -----------------------------------------------------------------------------
+@kpi_bp.route('/')
+@conditional(KPI_VIEW, key=lambda: (requested_year(),))
+def index():
+    year = requested_year()
+    rows, state, years = [], None, []
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        rows, state = load_kpi(cur, year)
+        cur.execute(YEARS_SQL)
+        years = [r[0] for r in cur.fetchall()]
+    except psycopg2.Error as db_error:
+        flash(f"❌ Erreur de base de données : {db_error}", 'danger')
+
+    if year not in years:
+        years = sorted(set(years) | {year}, reverse=True)
+    return render_template('kpi/index.html', year=year, years=years, rows=rows, state=state,
+                           totals=totals_by_bu(rows), types=INDIRECT_TYPES)
+
+
+@kpi_bp.route('/api/indirect')
+@conditional(KPI_VIEW, key=lambda: (requested_year(),))
+def api_indirect():
+    """Ratio heures indirectes / directes par BU et semaine (JSON)."""
+    year = requested_year()
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        rows, state = load_kpi(cur, year)
+    except psycopg2.Error as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+    return jsonify(year=year, rows=rows, totals=totals_by_bu(rows),
+                   refreshed_at=state['Refreshed_at'].isoformat() if state else None)
@@ -0,0 +1,415 @@
+# migrations.py
+"""
+Schéma versionné des tables de métriques et auto-contrôle au démarrage.
+
+- MIGRATIONS : liste ordonnée (version, description, fonction(cur)) ; chaque
+  version appliquée est enregistrée dans `schema_migrations`.
+- EXPECTED_INDEXES : index dont dépendent les routes (ID unique, clé métier,
+  tri de la page d'accueil, sonde de la bannière).
+- self_check() : signale les index manquants et les plans EXPLAIN suspects
+  (Seq Scan sur une table volumineuse, coût estimé élevé) pour chaque requête
+  des routes.
+
+Commandes : `flask db-upgrade` et `flask db-check`.
+"""
+
+import json
+import logging
+import threading
+
+import click
+import psycopg2  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_TABLE = "schema_migrations"
+
+# Seuils du contrôle EXPLAIN
+SEQ_SCAN_ROW_THRESHOLD = 5000     # Seq Scan toléré en dessous (petite table)
+PLAN_COST_THRESHOLD = 10000.0     # coût total estimé au-delà duquel le plan est signalé
+
+
+# -----------------------------------------------------------------------------
+# Index attendus : (nom, colonnes, unique)
+# -----------------------------------------------------------------------------
+EXPECTED_INDEXES = {
+    'weekly_dl_metrics': [
+        ('uq_weekly_dl_metrics_id', ('ID',), True),
+        ('uq_weekly_dl_metrics_business_key', ('BU', 'Production_line', 'WeekNo', 'Year'), True),
+        ('ix_weekly_dl_metrics_listing', ('Year', 'Import_Date', 'WeekNo', 'ID'), False),
+        ('ix_weekly_dl_metrics_year_week', ('Year', 'WeekNo'), False),
+    ],
+    'weekly_voh_metrics': [
+        ('uq_weekly_voh_metrics_id', ('ID',), True),
+        ('uq_weekly_voh_metrics_business_key', ('BU', 'Department_function', 'WeekNo', 'Year'), True),
+        ('ix_weekly_voh_metrics_listing', ('Year', 'Import_Date', 'WeekNo', 'ID'), False),
+        ('ix_weekly_voh_metrics_listing_all_years', ('Import_Date', 'WeekNo', 'ID'), False),
+        ('ix_weekly_voh_metrics_year_week', ('Year', 'WeekNo'), False),
+    ],
+}
+
+
+def existing_indexes(cur, table):
+    """Retourne {(colonnes clés), unique} -> nom pour les index de `table`."""
+    cur.execute("""
+        SELECT i.relname,
+               ix.indisunique,
+               array_agg(a.attname::text ORDER BY k.ord)
+        FROM pg_index ix
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        JOIN pg_class t ON t.oid = ix.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        JOIN LATERAL unnest(ix.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord) ON true
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+        WHERE n.nspname = 'public' AND t.relname = %s AND k.ord <= ix.indnkeyatts
+        GROUP BY i.relname, ix.indisunique
+    """, (table,))
+    return {(tuple(cols), unique): name for name, unique, cols in cur.fetchall()}
+
+
+def ensure_index(cur, table, name, columns, unique=False):
+    """Crée l'index s'il n'existe pas déjà un index équivalent (mêmes colonnes, même unicité)."""
+    found = existing_indexes(cur, table)
+    if (tuple(columns), unique) in found or (unique is False and (tuple(columns), True) in found):
+        return False
+    cols = ", ".join(f'"{c}"' for c in columns)
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    cur.execute(f'CREATE {kind} IF NOT EXISTS {name} ON public.{table} ({cols})')
+    return True
+
+
+def missing_indexes(cur):
+    """Liste des index attendus absents : [(table, nom, colonnes, unique)]."""
+    missing = []
+    for table, indexes in EXPECTED_INDEXES.items():
+        found = existing_indexes(cur, table)
+        for name, columns, unique in indexes:
+            if (tuple(columns), unique) in found:
+                continue
+            if not unique and (tuple(columns), True) in found:
+                continue
+            missing.append((table, name, columns, unique))
+    return missing
+
+
+# -----------------------------------------------------------------------------
+# Migrations
+# -----------------------------------------------------------------------------
+def _m001_create_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS public.weekly_dl_metrics (
+            "ID"              varchar(16) PRIMARY KEY,
+            "BU"              varchar(20) NOT NULL,
+            "Production_line" varchar(50) NOT NULL,
+            "DL_Headcount"    integer NOT NULL DEFAULT 0,
+            "H100"            double precision NOT NULL DEFAULT 0,
+            "H125"            double precision NOT NULL DEFAULT 0,
+            "H150"            double precision NOT NULL DEFAULT 0,
+            "H200"            double precision NOT NULL DEFAULT 0,
+            "WeekNo"          varchar(4) NOT NULL,
+            "Import_Date"     date NOT NULL DEFAULT CURRENT_DATE,
+            "Year"            integer NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS public.weekly_voh_metrics (
+            "ID"                  varchar(16) PRIMARY KEY,
+            "BU"                  varchar(20) NOT NULL,
+            "Department_function" varchar(50) NOT NULL,
+            "Type"                varchar(10) NOT NULL DEFAULT 'VOH',
+            "DL_Headcount"        integer NOT NULL DEFAULT 0,
+            "H100"                double precision NOT NULL DEFAULT 0,
+            "H125"                double precision NOT NULL DEFAULT 0,
+            "H150"                double precision NOT NULL DEFAULT 0,
+            "H200"                double precision NOT NULL DEFAULT 0,
+            "WeekNo"              varchar(4) NOT NULL,
+            "Import_Date"         date NOT NULL DEFAULT CURRENT_DATE,
+            "Year"                integer NOT NULL
+        )
+    """)
+
+
+def _m002_indexes(cur):
+    for table, indexes in EXPECTED_INDEXES.items():
+        for name, columns, unique in indexes:
+            ensure_index(cur, table, name, columns, unique)
+
+
+def _m003_hours_rollup(cur):
+    from rollups import CREATE_SQL, rebuild_all
+
+    cur.execute(CREATE_SQL)
+    rebuild_all(cur)
+
+
+def _m004_reference_lines(cur):
+    from registry import CREATE_SQL, seed
+
+    cur.execute(CREATE_SQL)
+    seed(cur)
+
+
+def _m005_table_versions(cur):
+    from http_cache import install
+
+    # liste figée : les tables versionnées plus tard ont leur propre migration
+    install(cur, ('weekly_dl_metrics', 'weekly_voh_metrics', 'reference_lines'))
+
+
+def _m006_row_versions(cur):
+    # défaut constant : ajout instantané, sans réécriture de la table (PostgreSQL >= 11)
+    for table in EXPECTED_INDEXES:
+        cur.execute(f'ALTER TABLE public.{table} ADD COLUMN IF NOT EXISTS "Version" integer NOT NULL DEFAULT 1')
+
+
+def _m007_kpi_indirect_ratio(cur):
+    from kpi import install
+
+    install(cur)
+
+
+def _m008_jobs(cur):
+    from jobs import install
+
+    install(cur)
+
+
+def _m009_rollup_version(cur):
+    from http_cache import install_triggers
+
+    install_triggers(cur, ('weekly_hours_rollup',))
+
+
+def _m010_short_id_sequence(cur):
+    from ids import install
+
+    install(cur)
+
+
+def _m011_write_guard(cur):
+    from write_guard import install
+
+    install(cur)
+
+
+def _m012_metrics_history(cur):
+    from history import install
+
+    install(cur)
+
+
+def _m013_week_versions(cur):
+    from http_cache import install_week_versions
+
+    install_week_versions(cur, ('weekly_dl_metrics', 'weekly_voh_metrics'))
+
+
+MIGRATIONS = [
+    (1, "Tables weekly_dl_metrics et weekly_voh_metrics", _m001_create_tables),
+    (2, "ID unique, clé métier unique, index de tri et de la bannière", _m002_indexes),
+    (3, "Agrégats hebdomadaires weekly_hours_rollup (initialisés depuis les tables brutes)", _m003_hours_rollup),
+    (4, "Référentiel des lignes / fonctions reference_lines (listes historiques)", _m004_reference_lines),
+    (5, "Versions des tables table_versions (triggers) pour les ETag des pages de listing", _m005_table_versions),
+    (6, "Colonne \"Version\" des lignes de métriques (concurrence optimiste des modifications)", _m006_row_versions),
+    (7, "Vue matérialisée kpi_indirect_ratio (heures indirectes / directes par BU et semaine)", _m007_kpi_indirect_ratio),
+    (8, "File de travaux de fond jobs (agrégats après saisie, reprises avec délai)", _m008_jobs),
+    (9, "Version de weekly_hours_rollup (rafraîchissement de la vue KPI après les travaux de fond)", _m009_rollup_version),
+    (10, "Séquence short_id_seq (allocation des ID courts sans collision, ID_ALLOCATION=sequence)", _m010_short_id_sequence),
+    (11, "Seaux du limiteur et clés d'idempotence partagés (tables UNLOGGED, WRITE_GUARD_SHARED)", _m011_write_guard),
+    (12, "Journal des modifications metrics_history (ajout seul, partitionné par année, triggers des tables de métriques)",
+     _m012_metrics_history),
+    (13, "Versions par semaine week_versions (triggers) pour le cache des semaines closes de la grille",
+     _m013_week_versions),
+]
+
+
+def applied_versions(cur):
+    """Versions déjà appliquées (ensemble vide si la table de suivi n'existe pas encore)."""
+    cur.execute("SELECT to_regclass(%s)", (f"public.{SCHEMA_TABLE}",))
+    if cur.fetchone()[0] is None:
+        return set()
+    cur.execute(f"SELECT version FROM public.{SCHEMA_TABLE}")
+    return {r[0] for r in cur.fetchall()}
+
+
+def pending_migrations(conn):
+    with conn.cursor() as cur:
+        done = applied_versions(cur)
+    conn.rollback()
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def migrate(conn):
+    """
+    Applique les migrations manquantes, chacune dans sa propre transaction.
+    Un verrou consultatif évite que plusieurs workers migrent en même temps.
+    Retourne la liste des versions appliquées.
+    """
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (SCHEMA_TABLE,))
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS public.{SCHEMA_TABLE} (
+                    version     integer PRIMARY KEY,
+                    description text NOT NULL,
+                    applied_at  timestamptz NOT NULL DEFAULT now()
+                )
+            """)
+            if version in applied_versions(cur):
+                conn.commit()
+                continue
+            try:
+                fn(cur)
+                cur.execute(
+                    f"INSERT INTO public.{SCHEMA_TABLE} (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                logger.exception("Échec de la migration %s (%s)", version, description)
+                raise
+        logger.info("Migration %s appliquée : %s", version, description)
+        applied.append(version)
+    return applied
+
+
+# -----------------------------------------------------------------------------
+# Auto-contrôle : index manquants et plans EXPLAIN des requêtes des routes
+# -----------------------------------------------------------------------------
+def route_queries():
+    """Requêtes exécutées par les routes, avec des paramètres représentatifs."""
+    from datetime import date, datetime
+
+    from pagination import CLOSED_CONDITION, KEYSET_CONDITION, LIVE_CONDITION, ORDER_BY, YEAR_CONDITION
+    from http_cache import VERSION_SQL as HTTP_VERSION_SQL, VERSIONED_TABLES, WEEK_VERSION_SQL
+    from history import ID_CONDITION, WEEK_CONDITION, select_sql as history_sql
+    from kpi import SELECT_SQL as KPI_SELECT_SQL
+    from registry import LOAD_SQL as REGISTRY_LOAD_SQL, VERSION_SQL as REGISTRY_VERSION_SQL
+    from rh_app import routes as rh
+    from voh_app import routes as voh
+
+    year = datetime.now().year
+    week = f"W{max(datetime.now().isocalendar()[1] - 1, 1)}"
+    cursor = (date.today(), week, f"{str(year)[-2:]}-ZZZZZZZZ")
+
+    return [
+        ('rh.index:banner', rh.FILLED_WEEK_SQL, (year, week)),
+        ('rh.update:select', rh.SELECT_BY_ID_SQL, ('00-AAAAAAAA',)),
+        ('rh.api_metrics:first_page',
+         f'{rh.SELECT_SQL} WHERE "Year" = %s {ORDER_BY} LIMIT 51', (year,)),
+        ('rh.api_metrics:next_page',
+         f'{rh.SELECT_SQL} WHERE "Year" = %s AND {KEYSET_CONDITION} {ORDER_BY} LIMIT 51', (year,) + cursor),
+        ('rh.api_columns:versions', WEEK_VERSION_SQL, (rh.TABLE, year)),
+        ('rh.api_columns:weeks',
+         f'SELECT DISTINCT "WeekNo" FROM public.{rh.TABLE} WHERE {YEAR_CONDITION}', (year,)),
+        ('rh.api_columns:closed', f'{rh.SELECT_SQL} WHERE {CLOSED_CONDITION} {ORDER_BY}', (year, week)),
+        ('rh.api_columns:live', f'{rh.SELECT_SQL} WHERE {LIVE_CONDITION} {ORDER_BY}', (year, week)),
+        ('voh.index:years', voh.YEARS_SQL, ()),
+        ('voh.index:banner', voh.FILLED_WEEK_SQL, (year, week)),
+        ('voh.update:select', voh.SELECT_BY_ID_SQL, ('00-AAAAAAAA',)),
+        ('voh.api_metrics:first_page',
+         f'{voh.SELECT_SQL} WHERE "Year" = %s {ORDER_BY} LIMIT 51', (year,)),
+        ('voh.api_metrics:all_years',
+         f'{voh.SELECT_SQL} {ORDER_BY} LIMIT 51', ()),
+        ('voh.api_columns:functions',
+         f'SELECT DISTINCT "Department_function" FROM public.{voh.TABLE} WHERE {CLOSED_CONDITION}', (year, week)),
+        ('voh.api_columns:closed', f'{voh.SELECT_SQL} WHERE {CLOSED_CONDITION} {ORDER_BY}', (year, week)),
+        ('rh.history', history_sql(rh.TABLE, 'Production_line', ID_CONDITION),
+         {'table': rh.TABLE, 'id': '00-AAAAAAAA', 'limit': 101}),
+        ('rh.week_history', history_sql(rh.TABLE, 'Production_line', WEEK_CONDITION),
+         {'table': rh.TABLE, 'year': year, 'weekno': week, 'limit': 101}),
+        ('voh.week_history:next_page', history_sql(voh.TABLE, 'Department_function', WEEK_CONDITION, before=0),
+         {'table': voh.TABLE, 'year': year, 'weekno': week, 'before': 10 ** 9, 'limit': 101}),
+        ('registry:version', REGISTRY_VERSION_SQL, ('VOH',)),
+        ('registry:load', REGISTRY_LOAD_SQL, ('VOH',)),
+        ('http_cache:versions', HTTP_VERSION_SQL, (list(VERSIONED_TABLES),)),
+        ('kpi.index:year', KPI_SELECT_SQL, (year,)),
+    ]
+
+
+def _walk_plan(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _walk_plan(child)
+
+
+def explain_route_queries(cur):
+    """EXPLAIN (sans exécution) de chaque requête des routes ; signale les plans suspects."""
+    report = []
+    for name, sql, params in route_queries():
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        raw = cur.fetchone()[0]
+        plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]['Plan']
+        warnings = []
+        for node in _walk_plan(plan):
+            if node.get('Node Type') == 'Seq Scan' and node.get('Plan Rows', 0) >= SEQ_SCAN_ROW_THRESHOLD:
+                warnings.append(f"Seq Scan sur {node.get('Relation Name')} (~{node.get('Plan Rows')} lignes)")
+        if plan.get('Total Cost', 0) >= PLAN_COST_THRESHOLD:
+            warnings.append(f"coût estimé élevé ({plan['Total Cost']:.0f})")
+        report.append({
+            'query': name,
+            'node': plan.get('Node Type'),
+            'total_cost': plan.get('Total Cost'),
+            'warnings': warnings,
+        })
+    return report
+
+
+def self_check(conn):
+    """Rapport complet : migrations en attente, index manquants, plans des requêtes."""
+    pending = [v for v, _, _ in pending_migrations(conn)]
+    with conn.cursor() as cur:
+        missing = missing_indexes(cur)
+        plans = explain_route_queries(cur) if not pending else []
+    conn.rollback()
+
+    if pending:
+        logger.warning("Migrations en attente : %s (lancer `flask db-upgrade`)", pending)
+    for table, name, columns, unique in missing:
+        logger.warning("Index manquant sur %s : %s %s%s", table, name, columns, " (UNIQUE)" if unique else "")
+    for entry in plans:
+        for w in entry['warnings']:
+            logger.warning("Plan suspect pour %s : %s", entry['query'], w)
+
+    return {
+        'pending_migrations': pending,
+        'missing_indexes': [
+            {'table': t, 'name': n, 'columns': list(c), 'unique': u} for t, n, c, u in missing
+        ],
+        'query_plans': plans,
+    }
+
+
+def start_self_check(pool):
+    """Lance self_check() en tâche de fond au démarrage (ne bloque pas et n'échoue jamais)."""
+    def run():
+        try:
+            with pool.connection() as conn:
+                self_check(conn)
+        except Exception as e:  # l'app doit démarrer même si la base est injoignable
+            logger.warning("Auto-contrôle du schéma impossible : %s", e)
+
+    thread = threading.Thread(target=run, name="schema-self-check", daemon=True)
+    thread.start()
+    return thread
+
+
+# -----------------------------------------------------------------------------
+# Commandes Flask
+# -----------------------------------------------------------------------------
+def register_cli(app):
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        """Applique les migrations de schéma manquantes."""
+        with app.extensions['db_pool'].connection() as conn:
+            applied = migrate(conn)
+        click.echo(f"Migrations appliquées : {applied}" if applied else "Schéma déjà à jour.")
+
+    @app.cli.command('db-check')
+    def db_check():
+        """Affiche les index manquants et les plans EXPLAIN des requêtes des routes."""
+        with app.extensions['db_pool'].connection() as conn:
+            report = self_check(conn)
+        click.echo(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,202 @@
+# pagination.py
+"""
+Pagination par clé (keyset) et filtres côté serveur pour les tables de métriques.
+
+L'ordre d'affichage est ("Import_Date" DESC, "WeekNo" DESC, "ID" DESC) ; la page
+suivante est obtenue avec une comparaison de tuple sur ces trois colonnes, ce
+qui évite les OFFSET coûteux quand les semaines s'accumulent.
+
+La grille des pages d'accueil charge une année à la fois au format colonnaire
+(year_columns) : les semaines closes forment un bloc JSON mis en cache
+(cache.fragments) et revalidé par les versions de leurs semaines
+(http_cache.week_versions) ; la semaine modifiable est lue à chaque appel.
+Les filtres et le tri sont faits par le navigateur.
+"""
+
+import base64
+import json
+from datetime import date
+
+from cache import fragments
+from http_cache import WEEK_VERSION_SQL
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+ORDER_BY = 'ORDER BY "Import_Date" DESC, "WeekNo" DESC, "ID" DESC'
+KEYSET_CONDITION = '("Import_Date", "WeekNo", "ID") < (%s, %s, %s)'
+
+
+def encode_cursor(row) -> str:
+    """Curseur opaque à partir de la dernière ligne d'une page."""
+    payload = [row['Import_Date'].isoformat(), row['WeekNo'], row['ID']]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(token: str):
+    """Inverse de encode_cursor(). Lève ValueError si le curseur est invalide."""
+    try:
+        import_date, weekno, rid = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return date.fromisoformat(import_date), str(weekno), str(rid)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Curseur de pagination invalide : {token!r}") from e
+
+
+def parse_limit(value) -> int:
+    if value in (None, ''):
+        return DEFAULT_LIMIT
+    return max(1, min(int(value), MAX_LIMIT))
+
+
+def build_filters(args, columns):
+    """
+    Construit la clause WHERE à partir des paramètres de requête.
+    `columns` associe un nom de paramètre à une colonne SQL, ex:
+        {'line': '"Production_line"', 'bu': '"BU"', 'week': '"WeekNo"', 'year': '"Year"'}
+    Le paramètre 'year' est converti en entier (ValueError si invalide).
+    """
+    clauses, params = [], []
+    for name, column in columns.items():
+        value = args.get(name)
+        if value in (None, ''):
+            continue
+        if name == 'year':
+            value = int(value)
+        clauses.append(f'{column} = %s')
+        params.append(value)
+    return clauses, params
+
+
+def page_query(select_sql, clauses, params, cursor_token=None, limit=DEFAULT_LIMIT):
+    """
+    SQL + paramètres d'une page de `select_sql` (SELECT ... FROM table, sans WHERE
+    ni ORDER BY) ; une ligne de plus que `limit` est demandée pour savoir s'il y a une suite.
+    """
+    clauses, params = list(clauses), list(params)
+    if cursor_token:
+        clauses.append(KEYSET_CONDITION)
+        params.extend(decode_cursor(cursor_token))
+
+    sql = select_sql
+    if clauses:
+        sql += "\nWHERE " + " AND ".join(clauses)
+    sql += f"\n{ORDER_BY}\nLIMIT %s"
+    return sql, params + [limit + 1]
+
+
+def split_page(rows, limit):
+    """Retourne (lignes de la page, curseur_suivant) ; curseur_suivant vaut None en fin de liste."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+
+def fetch_page(cur, select_sql, clauses, params, cursor_token=None, limit=DEFAULT_LIMIT):
+    """
+    Exécute `select_sql` (SELECT ... FROM table, sans WHERE ni ORDER BY) pour une page.
+    Retourne (lignes, curseur_suivant) ; curseur_suivant vaut None en fin de liste.
+    """
+    sql, params = page_query(select_sql, clauses, params, cursor_token, limit)
+    cur.execute(sql, params)
+    return split_page(cur.fetchall(), limit)
+
+
+def serialize_row(row) -> dict:
+    """DictRow (ou asyncpg Record) -> dict JSON (dates au format ISO)."""
+    out = {}
+    for key, value in dict(row).items():
+        out[key] = value.isoformat() if isinstance(value, date) else value
+    return out
+
+
+# -----------------------------------------------------------------------------
+# Colonnes d'une année (grille virtualisée)
+# -----------------------------------------------------------------------------
+YEAR_CONDITION = '"Year" = %s'
+CLOSED_CONDITION = '"Year" = %s AND "WeekNo" <> %s'
+LIVE_CONDITION = '"Year" = %s AND "WeekNo" = %s'
+
+# Versions, valeurs distinctes et lignes d'une année lues dans un même instantané
+SNAPSHOT_SQL = "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"
+
+
+def week_versions(cur, table, year):
+    """((semaine, version), ...) de l'année, lues dans http_cache.week_versions (clé primaire, sans parcours)."""
+    cur.execute(WEEK_VERSION_SQL, (table, year))
+    return tuple((weekno, version) for weekno, version in cur.fetchall())
+
+
+def columns_chunk(cur, table, select_sql, condition, params, columns, encoded=None, decimals=2):
+    """
+    Lignes de `select_sql` WHERE `condition` au format colonnaire (JSON, sans l'année).
+    Les valeurs distinctes des colonnes codées viennent d'un SELECT DISTINCT sur la table
+    (index ("Year", "WeekNo")), lu dans l'instantané des lignes (voir year_columns).
+    """
+    encoded = encoded or {}
+    values = {}
+    for name, sort_key in encoded.items():
+        cur.execute(f'SELECT DISTINCT "{name}" FROM public.{table} WHERE {condition}', params)
+        values[name] = sorted((r[0] for r in cur.fetchall()), key=sort_key)
+
+    names = ", ".join(f'"{name}"' for name in columns)
+    cur.execute(f"SELECT {names} FROM ({select_sql} WHERE {condition}) AS t {ORDER_BY}", params)
+    rows = cur.fetchall()
+
+    arrays = {}
+    for name, column in zip(columns, zip(*rows) if rows else [()] * len(columns)):
+        if name in values:
+            codes = {value: i for i, value in enumerate(values[name])}
+            arrays[name] = [codes[value] for value in column]
+        else:
+            arrays[name] = [round(value, decimals) if isinstance(value, float) else value for value in column]
+
+    return json.dumps({'count': len(rows), 'values': values, 'columns': arrays},
+                      separators=(',', ':'), default=str)
+
+
+def year_columns(cur, table, select_sql, year, columns, encoded=None, live_week=None, decimals=2):
+    """
+    Lignes de l'année au format colonnaire (JSON) et provenance des semaines closes : 'hit' ou 'miss'.
+
+        {"year": 2025, "chunks": [
+            {"count": 2,
+             "values": {"WeekNo": ["W1", "W2"]},
+             "columns": {"ID": ["25-...", "25-..."], "WeekNo": [1, 0], "H100": [37.5, 40.0]}}]}
+
+    `columns` : colonnes de `select_sql` envoyées, dans l'ordre ORDER_BY des lignes.
+    `encoded` : {colonne: clé de tri ou None} des colonnes codées par dictionnaire ;
+    leurs valeurs distinctes (SELECT DISTINCT, triées) vont dans "values" et chaque
+    ligne ne porte que l'indice de sa valeur. Les flottants sont arrondis à
+    `decimals` décimales.
+
+    `live_week` : semaine modifiable ('Wn', année courante), lue à chaque appel dans
+    son propre bloc. Les autres semaines (closes) forment un bloc mis en cache
+    (cache.fragments, clé (table, année)) avec les versions de leurs semaines :
+    une saisie de la semaine modifiable ne l'invalide pas.
+
+    `cur` : curseur d'une connexion sans transaction en cours (le primaire). Versions,
+    valeurs distinctes et lignes sont lues dans une transaction REPEATABLE READ : une
+    écriture validée pendant la requête n'y apparaît pas à moitié (chaque valeur a son
+    code, la signature décrit exactement le bloc mis en cache).
+    """
+    cur.execute(SNAPSHOT_SQL)
+    signature = tuple(v for v in week_versions(cur, table, year) if v[0] != live_week)
+    key = (table, year)
+    closed, source = fragments.get(key, signature), 'hit'
+    if closed is None:
+        if live_week is None:
+            closed = columns_chunk(cur, table, select_sql, YEAR_CONDITION, (year,), columns, encoded, decimals)
+        else:
+            closed = columns_chunk(cur, table, select_sql, CLOSED_CONDITION, (year, live_week),
+                                   columns, encoded, decimals)
+        fragments.set(key, signature, closed)
+        source = 'miss'
+
+    chunks = [closed]
+    if live_week is not None:
+        live = columns_chunk(cur, table, select_sql, LIVE_CONDITION, (year, live_week),
+                             columns, encoded, decimals)
+        chunks.insert(0, live)  # semaine la plus récente : en tête, comme dans ORDER_BY
+    return '{"year":%d,"chunks":[%s]}' % (year, ','.join(chunks)), source
@@ -0,0 +1,296 @@
+# registry.py
+"""
+Référentiel des lignes de production (DL) et des fonctions (VOH).
+
+Source unique pour le formulaire hebdomadaire, l'insertion, l'import et les
+listes de filtres : table `reference_lines`, une ligne par (Source, Line)
+avec la BU, le type (DL / VOH / FOH / ADMIN), l'ordre d'affichage et un
+indicateur "Active" (une ligne retirée reste connue pour l'historique et les
+filtres, mais disparaît du formulaire).
+
+Chaque processus garde en mémoire un instantané immuable par source, chargé
+au démarrage (run.py). Passé REGISTRY_TTL, une requête légère compare la
+version (nombre de lignes + dernière modification) et ne recharge que si la
+table a changé : ajouter une ligne ne demande ni redéploiement ni
+redémarrage.
+
+Commandes : `flask lines-list`, `flask lines-add`, `flask lines-disable`.
+"""
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+import click
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_TABLE = "reference_lines"
+
+CREATE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS public.{REGISTRY_TABLE} (
+        "Source"     varchar(3)  NOT NULL,
+        "BU"         varchar(20) NOT NULL,
+        "Line"       varchar(50) NOT NULL,
+        "Type"       varchar(10) NOT NULL,
+        "Position"   integer     NOT NULL DEFAULT 0,
+        "Active"     boolean     NOT NULL DEFAULT true,
+        "Updated_at" timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY ("Source", "Line")
+    )
+"""
+
+LOAD_SQL = f"""
+    SELECT "BU", "Line", "Type", "Active"
+    FROM public.{REGISTRY_TABLE}
+    WHERE "Source" = %s
+    ORDER BY "Position", "Line"
+"""
+
+VERSION_SQL = f"""
+    SELECT count(*), max("Updated_at")
+    FROM public.{REGISTRY_TABLE}
+    WHERE "Source" = %s
+"""
+
+# Contenu initial (migration 4) : les listes historiquement codées en dur
+_VOH_TYPES = {
+    "SUPERVISOR": "VOH", "AQC": "VOH", "REG": "VOH", "SPC": "VOH",
+    "TRAINER": "ADMIN", "METHODS": "FOH", "TEAM LEADER": "FOH", "CSL": "VOH",
+}
+SEED = {
+    'DL': [
+        ("VALEO", [(line, "DL") for line in ["FLEX", "MNG2", "FP", "GENII R", "GENII C", "BUA", "VM4"]]),
+        ("NIDEC", [(line, "DL") for line in ["NEM2", "SIM AS", "SKP42", "NGMAP", "POWERTOOLS", "10T",
+                                             "11TA", "DCK", "CM3", "CM4", "FAIX"]]),
+    ],
+    'VOH': [
+        ("VALEO", [(f"{f} VALEO", t) for f, t in _VOH_TYPES.items()]),
+        ("NIDEC", [(f"{f} NIDEC", t) for f, t in _VOH_TYPES.items()]),
+        ("OTHER", [
+            ("MAINTENANCE", "VOH"), ("AQF", "VOH"), ("WAREHOUSE", "VOH"), ("SCRAP", "VOH"),
+            ("QUALITY", "FOH"), ("LOGISTICS", "FOH"), ("FINANCE", "ADMIN"), ("INDUS/CIP", "FOH"),
+            ("HR", "ADMIN"), ("PURCHASING", "ADMIN"), ("EXECUTIVE ASSISTANT", "ADMIN"),
+            ("IT", "ADMIN"), ("PROJECT", "FOH"),
+        ]),
+    ],
+}
+
+TYPES = {'DL': ("DL",), 'VOH': ("VOH", "FOH", "ADMIN")}
+
+# Instantané immuable d'une source :
+# - bus       : BU dans l'ordre d'affichage
+# - lines     : BU -> lignes actives (formulaire, insertion)
+# - known     : BU -> toutes les lignes, y compris retirées (import, validation)
+# - all_lines : toutes les lignes, à plat (listes de filtres)
+# - type_map  : ligne -> type
+Catalog = namedtuple('Catalog', 'source version bus lines known all_lines type_map')
+
+
+def seed(cur):
+    """Insère le contenu initial (sans écraser les lignes déjà présentes)."""
+    position = 0
+    for source, groups in SEED.items():
+        for bu, lines in groups:
+            for line, type_ in lines:
+                position += 10
+                cur.execute(
+                    f'INSERT INTO public.{REGISTRY_TABLE} ("Source", "BU", "Line", "Type", "Position") '
+                    'VALUES (%s, %s, %s, %s, %s) ON CONFLICT DO NOTHING',
+                    (source, bu, line, type_, position)
+                )
+
+
+def build_catalog(source, version, rows):
+    """rows : (BU, Line, Type, Active) triés par position."""
+    bus, lines, known, type_map = [], {}, {}, {}
+    for bu, line, type_, active in rows:
+        if bu not in known:
+            bus.append(bu)
+            known[bu] = []
+            lines[bu] = []
+        known[bu].append(line)
+        if active:
+            lines[bu].append(line)
+        type_map[line] = type_
+    return Catalog(
+        source=source,
+        version=version,
+        bus=tuple(bus),
+        lines=MappingProxyType({bu: tuple(v) for bu, v in lines.items()}),
+        known=MappingProxyType({bu: tuple(v) for bu, v in known.items()}),
+        all_lines=tuple(type_map),
+        type_map=MappingProxyType(type_map),
+    )
+
+
+def _version(count, updated_at):
+    return (count, updated_at.isoformat() if updated_at else None)
+
+
+def _seed_catalog(source):
+    """Repli tant que la migration 4 n'est pas appliquée."""
+    rows = [(bu, line, type_, True) for bu, lines in SEED[source] for line, type_ in lines]
+    return build_catalog(source, None, rows)
+
+
+# -----------------------------------------------------------------------------
+# Instantanés en mémoire
+# -----------------------------------------------------------------------------
+class Registry:
+    """Instantanés par source, revalidés par version après `ttl` secondes."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._catalogs = {}  # source -> (catalog, revalidate_at)
+        self._lock = threading.Lock()
+        self._reloads = 0
+        self._revalidations = 0
+
+    def _cached(self, source):
+        entry = self._catalogs.get(source)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0], entry
+        return None, entry
+
+    def _store(self, source, entry, version, load):
+        """Garde l'instantané courant si la version n'a pas bougé, sinon recharge via load()."""
+        if entry is not None and version is not None and entry[0].version == version:
+            self._revalidations += 1
+            catalog = entry[0]
+        else:
+            self._reloads += 1
+            if version is None:
+                logger.warning("Table %s absente : listes par défaut (lancer `flask db-upgrade`).", REGISTRY_TABLE)
+                catalog = _seed_catalog(source)
+            else:
+                catalog = build_catalog(source, version, load())
+        self._catalogs[source] = (catalog, time.monotonic() + self.ttl)
+        return catalog
+
+    def get(self, source, conn):
+        """Instantané de `source` ('DL' ou 'VOH') ; `conn` ne sert que si une revalidation est due."""
+        catalog, _ = self._cached(source)
+        if catalog is not None:
+            return catalog
+
+        with self._lock:
+            catalog, entry = self._cached(source)
+            if catalog is not None:
+                return catalog
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s)", (f"public.{REGISTRY_TABLE}",))
+                version = None
+                if cur.fetchone()[0] is not None:
+                    cur.execute(VERSION_SQL, (source,))
+                    version = _version(*cur.fetchone())
+
+                def load():
+                    cur.execute(LOAD_SQL, (source,))
+                    return cur.fetchall()
+                return self._store(source, entry, version, load)
+
+    async def get_async(self, source, pool):
+        """Variante asyncio de get() (`pool` : pool asyncpg, sollicité seulement si une revalidation est due)."""
+        catalog, entry = self._cached(source)
+        if catalog is not None:
+            return catalog
+        # pas de verrou : deux revalidations concurrentes produisent le même instantané
+        async with pool.acquire() as conn:
+            version = None
+            if await conn.fetchval("SELECT to_regclass($1)::text", f"public.{REGISTRY_TABLE}") is not None:
+                version = _version(*await conn.fetchrow(VERSION_SQL.replace('%s', '$1'), source))
+            rows = None
+            if version is not None and (entry is None or entry[0].version != version):
+                rows = [tuple(r) for r in await conn.fetch(LOAD_SQL.replace('%s', '$1'), source)]
+        return self._store(source, entry, version, lambda: rows)
+
+    def preload(self, pool):
+        """Chargement au démarrage ; en cas d'échec, chargement différé à la première requête."""
+        try:
+            with pool.connection() as conn:
+                for source in TYPES:
+                    self.get(source, conn)
+        except Exception as e:
+            logger.warning("Préchargement du référentiel impossible : %s", e)
+
+    def invalidate(self):
+        with self._lock:
+            self._catalogs.clear()
+
+    def stats(self):
+        return {
+            'reloads': self._reloads,
+            'revalidations': self._revalidations,
+            'ttl': self.ttl,
+            'versions': {s: c.version for s, (c, _) in self._catalogs.items()},
+        }
+
+
+registry = Registry(ttl=Config.REGISTRY_TTL)
+
+
+def catalog(source, conn):
+    return registry.get(source, conn)
+
+
+# -----------------------------------------------------------------------------
+# CLI : gestion du référentiel sans redéploiement
+# -----------------------------------------------------------------------------
+def register_cli(app):
+    source_arg = click.argument('source', type=click.Choice(list(TYPES)))
+
+    @app.cli.command('lines-list')
+    @source_arg
+    def lines_list(source):
+        """Affiche les lignes / fonctions d'une source (DL ou VOH)."""
+        with app.extensions['db_pool'].connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(LOAD_SQL, (source,))
+                for bu, line, type_, active in cur.fetchall():
+                    click.echo(f"{bu:<8} {line:<24} {type_:<6} {'' if active else '(retirée)'}")
+
+    @app.cli.command('lines-add')
+    @source_arg
+    @click.argument('bu')
+    @click.argument('line')
+    @click.option('--type', 'type_', default=None, help="VOH / FOH / ADMIN (source VOH).")
+    def lines_add(source, bu, line, type_):
+        """Ajoute (ou réactive) une ligne ; visible par tous les workers après REGISTRY_TTL."""
+        type_ = (type_ or TYPES[source][0]).upper()
+        if type_ not in TYPES[source]:
+            raise click.BadParameter(f"type attendu parmi {', '.join(TYPES[source])}", param_hint='--type')
+        with app.extensions['db_pool'].connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    INSERT INTO public.{REGISTRY_TABLE} ("Source", "BU", "Line", "Type", "Position")
+                    SELECT %s, %s, %s, %s, COALESCE(max("Position"), 0) + 10
+                    FROM public.{REGISTRY_TABLE} WHERE "Source" = %s AND "BU" = %s
+                    ON CONFLICT ("Source", "Line") DO UPDATE SET
+                        "BU" = EXCLUDED."BU", "Type" = EXCLUDED."Type",
+                        "Active" = true, "Updated_at" = now()
+                """, (source, bu.upper(), line, type_, source, bu.upper()))
+            conn.commit()
+        click.echo(f"{source} / {bu.upper()} / {line} ({type_}) ajoutée.")
+
+    @app.cli.command('lines-disable')
+    @source_arg
+    @click.argument('line')
+    def lines_disable(source, line):
+        """Retire une ligne du formulaire (l'historique et les filtres la conservent)."""
+        with app.extensions['db_pool'].connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f'UPDATE public.{REGISTRY_TABLE} SET "Active" = false, "Updated_at" = now() '
+                    'WHERE "Source" = %s AND "Line" = %s',
+                    (source, line)
+                )
+                found = cur.rowcount
+            conn.commit()
+        if not found:
+            raise click.ClickException(f"Ligne inconnue : {source} / {line}")
+        click.echo(f"{source} / {line} retirée du formulaire.")
@@ -1,63 +1,50 @@
 # rh_app/route.py
 
-from flask import Flask, render_template, request, redirect, url_for, flash, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, jsonify, make_response
 import psycopg2  # type: ignore
 import psycopg2.extras  # type: ignore
 import psycopg2.errors  # type: ignore
 from datetime import datetime
-from config import Config
+from db import get_db_connection, get_read_connection, bulk_insert_with_short_ids, bulk_update
+from cache import filled_weeks, fragments
+from rollups import refresh_rollup
+from jobs import enqueue, wake as wake_jobs
+from exports import iter_rows, csv_response, xlsx_response, xlsx_available
+from pagination import build_filters, fetch_page, parse_limit, serialize_row, year_columns
+from importer import run_import, ImportErrors
+from registry import REGISTRY_TABLE, catalog
+from http_cache import conditional
+from write_guard import guarded_write
+from history import annotate, row_history, week_history as week_history_entries
 from flask import Blueprint
-import secrets
 
 # -----------------------------------------------------------------------------
 # Flask blueprint
 # -----------------------------------------------------------------------------
 rh_bp = Blueprint('rh', __name__, template_folder='templates')
 
-# -----------------------------------------------------------------------------
-# DB connection
-# -----------------------------------------------------------------------------
-def get_db_connection():
-    """Établit la connexion à PostgreSQL en utilisant les paramètres de config.py."""
-    try:
-        conn = psycopg2.connect(
-            host=Config.DB_HOST,
-            port=Config.DB_PORT,
-            database=Config.DB_DATABASE,
-            user=Config.DB_LOGIN,
-            password=Config.DB_PASSWORD,
-            sslmode=Config.SSL_MODE
-        )
-        return conn
-    except Exception as e:
-        raise e
 
 # -----------------------------------------------------------------------------
 # Utils
 # -----------------------------------------------------------------------------
-ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # lisible: pas de 0/O/I/l
-
 def current_year() -> int:
     return datetime.now().year
 
-def year_prefix(year: int) -> str:
-    """Retourne un préfixe année sur 2 chiffres + tiret, ex: 2025 -> '25-'"""
-    return f"{str(year)[-2:]}-"
-
-def new_id_year_prefixed(year: int, core_len: int = 8) -> str:
-    """
-    Génère un identifiant lisible, court et préfixé par l'année (2 chiffres).
-    Exemple: '25-8FK2Z91P'
-    """
-    core = "".join(secrets.choice(ALPHABET) for _ in range(core_len))
-    return f"{year_prefix(year)}{core}"
-
 def current_prev_week_label() -> str:
     """Retourne 'Wn' pour la semaine ISO précédente (ex: W42)."""
     iso_week = datetime.now().isocalendar()[1]
     prev_week = iso_week - 1 if iso_week > 1 else 1
     return f"W{prev_week}"
 
+def weighted_hours(form, prefix=''):
+    """Heures saisies -> heures stockées (H125 x1.25, H150 x0.5, H200 x2)."""
+    return {
+        'h100': float(form[f'{prefix}h100']),
+        'h125': float(form[f'{prefix}h125']) * 1.25,
+        'h150': float(form[f'{prefix}h150']) * 0.5,
+        'h200': float(form[f'{prefix}h200']) * 2,
+    }
+
 def parse_form_data(form):
     """Extrait et convertit les données du formulaire pour l'UPDATE (sans modifier import_date ni year)."""
     return {
@@ -65,90 +52,207 @@ def parse_form_data(form):
         'bu': form['bu'],
         'production_line': form['production_line'],
         'dl_headcount': int(form['dl_headcount']),
-        'h100': float(form['h100']),
-        'h125': float(form['h125']) * 1.25,
-        'h150': float(form['h150']) * 0.5,
-        'h200': float(form['h200']) * 2,
-        'weekno': form['weekno']
+        **weighted_hours(form),
+        'weekno': form['weekno'],
+        'version': int(form['version']),
     }
 
-# Helper d’insertion: réessaie si l’ID (uniquement) est en conflit
-# Nécessite un index UNIQUE sur "ID"
+def parse_week_form(form, year, weekno, bu):
+    """
+    Lignes modifiées de la grille de correction (champs `<ID>_version`, `<ID>_h100`...),
+    au format de WEEK_UPDATE_TEMPLATE. Le navigateur n'envoie que les lignes modifiées.
+    """
+    rows = []
+    for key in form:
+        if not key.endswith('_version'):
+            continue
+        rid = key[:-len('_version')]
+        hours = weighted_hours(form, f'{rid}_')
+        rows.append((rid, int(form[key]), int(form[f'{rid}_dl_headcount']),
+                     hours['h100'], hours['h125'], hours['h150'], hours['h200'], year, weekno, bu))
+    return rows
+
+TABLE = "weekly_dl_metrics"
+
+# Insertion groupée : une seule requête multi-lignes pour toute la semaine.
+# Nécessite un index UNIQUE sur "ID" (les collisions d'ID sont réessayées)
 INSERT_SQL = """
     INSERT INTO weekly_dl_metrics
     ("ID","BU","Production_line","DL_Headcount","H100","H125","H150","H200","WeekNo","Import_Date","Year")
-    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    VALUES %s
     ON CONFLICT ("ID") DO NOTHING
     RETURNING "ID"
 """
 
-def insert_with_short_id(cur, year: int, values_builder, max_tries: int = 5):
+# Lecture paginée (keyset) : heures remises à leur valeur saisie (sans coefficient)
+SELECT_SQL = """
+    SELECT "ID", "BU", "Production_line", "DL_Headcount",
+           "H100",
+           COALESCE("H125",0) / 1.25 as "H125",
+           COALESCE("H150",0) / 0.5  as "H150",
+           COALESCE("H200",0) / 2    as "H200",
+           "WeekNo", "Import_Date", "Year"
+    FROM weekly_dl_metrics
+"""
+
+# Grille de la page d'accueil (api_columns) : colonnes de SELECT_SQL envoyées au navigateur
+GRID_COLUMNS = ["ID", "BU", "Production_line", "DL_Headcount", "H100", "H125", "H150", "H200", "WeekNo"]
+
+# Bannière "semaine déjà saisie"
+FILLED_WEEK_SQL = 'SELECT 1 FROM weekly_dl_metrics WHERE "Year" = %s AND "WeekNo" = %s LIMIT 1'
+
+# Chargement d'une ligne pour le formulaire de modification
+SELECT_BY_ID_SQL = """
+    SELECT
+       "ID" as id,
+       "BU" as bu,
+       "Production_line" as production_line,
+       "DL_Headcount" as dl_headcount,
+       "H100" as h100,
+       ROUND(CAST(COALESCE("H125", 0.00) / 1.25 AS numeric), 2) AS h125,
+       ROUND(CAST(COALESCE("H150", 0.00) / 0.5 AS numeric), 2) AS h150,
+       ROUND(CAST(COALESCE("H200", 0.00) / 2 AS numeric), 2) AS h200,
+       "WeekNo" as weekno,
+       "Import_Date" as import_date,
+       "Year" as year,
+       "Version" as version
+    FROM weekly_dl_metrics
+    WHERE "ID" = %s
+"""
+
+# Modification en une instruction (concurrence optimiste) : la version lue par le formulaire
+# et l'année courante sont vérifiées, la ligne est écrite et renvoyée ; Import_Date et Year
+# ne changent pas. old."WeekNo" sert au recalcul des agrégats si la semaine change.
+UPDATE_SQL = """
+    UPDATE weekly_dl_metrics AS m SET
+      "BU"=%(bu)s, "Production_line"=%(production_line)s, "DL_Headcount"=%(dl_headcount)s,
+      "H100"=%(h100)s, "H125"=%(h125)s, "H150"=%(h150)s, "H200"=%(h200)s,
+      "WeekNo"=%(weekno)s, "Version" = m."Version" + 1
+    FROM (SELECT "ID", "WeekNo" FROM weekly_dl_metrics WHERE "ID" = %(id)s FOR UPDATE) AS old
+    WHERE m."ID" = old."ID" AND m."Version" = %(version)s AND m."Year" = %(year)s
+    RETURNING m.*, old."WeekNo" AS old_week
+"""
+
+# Grille de correction d'une semaine (une BU) : heures remises à leur valeur saisie
+WEEK_GRID_SQL = """
+    SELECT "ID", "Production_line" AS line, "DL_Headcount",
+           "H100",
+           ROUND(CAST(COALESCE("H125", 0.00) / 1.25 AS numeric), 2) AS "H125",
+           ROUND(CAST(COALESCE("H150", 0.00) / 0.5 AS numeric), 2) AS "H150",
+           ROUND(CAST(COALESCE("H200", 0.00) / 2 AS numeric), 2) AS "H200",
+           "Version"
+    FROM weekly_dl_metrics
+    WHERE "Year" = %s AND "WeekNo" = %s AND "BU" = %s
+"""
+
+# Correction groupée : toutes les lignes modifiées en un seul UPDATE ... FROM (VALUES ...).
+# Chaque ligne porte sa version (concurrence optimiste) et la portée de la grille
+# (année courante, semaine, BU) : une ligne hors portée ou modifiée entre-temps n'est pas écrite.
+WEEK_UPDATE_SQL = """
+    UPDATE weekly_dl_metrics AS m SET
+      "DL_Headcount" = v.dl_headcount,
+      "H100" = v.h100, "H125" = v.h125, "H150" = v.h150, "H200" = v.h200,
+      "Version" = m."Version" + 1
+    FROM (VALUES %s) AS v(id, version, dl_headcount, h100, h125, h150, h200, year, weekno, bu)
+    WHERE m."ID" = v.id AND m."Version" = v.version
+      AND m."Year" = v.year AND m."WeekNo" = v.weekno AND m."BU" = v.bu
+    RETURNING m."ID"
+"""
+WEEK_UPDATE_TEMPLATE = ("(%s, %s::integer, %s::integer, %s::float8, %s::float8, %s::float8, %s::float8, "
+                        "%s::integer, %s, %s)")
+
+# Paramètres de filtre acceptés par l'API -> colonnes SQL
+FILTER_COLUMNS = {
+    'line': '"Production_line"',
+    'bu': '"BU"',
+    'week': '"WeekNo"',
+    'year': '"Year"',
+}
+
+# Import historique (importer.py) : table, colonnes et référentiels de validation
+IMPORT_SPEC = {
+    'table': TABLE,
+    'source': 'DL',
+    'line_column': 'Production_line',
+    'typed': False,
+}
+
+def build_week_rows(form, lines, weekno, import_date, year):
+    """Lignes à insérer pour la semaine (toutes les lignes actives du référentiel, ordre INSERT_SQL)."""
+    rows = []
+    for bu in lines.bus:
+        for line in lines.lines[bu]:
+            dl_headcount = int(form.get(f"{line}_dl_headcount", 0) or 0)
+            h100 = float(form.get(f"{line}_h100", 0) or 0)
+            h125 = float(form.get(f"{line}_h125", 0) or 0) * 1.25
+            h150 = float(form.get(f"{line}_h150", 0) or 0) * 0.5
+            h200 = float(form.get(f"{line}_h200", 0) or 0) * 2
+            rows.append((bu, line, dl_headcount, h100, h125, h150, h200, weekno, import_date, year))
+    return rows
+
+def week_sort_key(weekno: str) -> int:
+    """'W42' -> 42 (tri numérique des semaines, pas alphabétique)."""
+    try:
+        return int(str(weekno).lstrip('W'))
+    except ValueError:
+        return 0
+
+def editable_week() -> str:
+    """Semaine modifiable de l'année courante (la précédente)."""
+    return f"W{datetime.utcnow().isocalendar()[1] - 1}"
+
+def is_editable(metric) -> bool:
+    """Seule la semaine précédente de l'année courante est modifiable."""
+    return str(metric['WeekNo']) == editable_week() and int(metric['Year']) == current_year()
+
+def week_is_filled(cur, year: int, weekno: str) -> bool:
+    """Sonde de la bannière, mise en cache (invalidée par les écritures de ce blueprint)."""
+    def probe():
+        cur.execute(FILLED_WEEK_SQL, (year, weekno))
+        return cur.fetchone() is not None
+    return filled_weeks.get_or_load((TABLE, year, weekno), probe)
+
+def index_cache_key():
     """
-    Tente d'insérer avec un ID court préfixé par l'année (ex: '25-XXXXXXX').
-    - Si conflit sur "ID": on regénère un ID et on réessaie (ON CONFLICT DO NOTHING).
-    - Tout autre conflit (ex: contrainte métier BU+ligne+semaine+année) remonte normalement.
+    Éléments de la page d'accueil indépendants de la table (ETag, voir http_cache.py).
+    Connexion de lecture : celle que @conditional vient d'emprunter, pas une du primaire par GET.
     """
-    for _ in range(max_tries):
-        rid = new_id_year_prefixed(year)  # core par défaut: 8 caractères
-        values = values_builder(rid)
-        cur.execute(INSERT_SQL, values)
-        row = cur.fetchone()  # None si DO NOTHING (collision d'ID), sinon renvoie l'ID inséré
-        if row is not None:
-            return rid
-    raise RuntimeError("Impossible de générer un ID court unique après plusieurs tentatives.")
+    return (current_year(), current_prev_week_label(), catalog('DL', get_read_connection()).version)
 
 # -----------------------------------------------------------------------------
 # Routes : INDEX (INSERT, SELECT)
 # -----------------------------------------------------------------------------
 @rh_bp.route('/', methods=['GET', 'POST'])
+@guarded_write
+@conditional(TABLE, REGISTRY_TABLE, key=lambda: index_cache_key())
 def index():
     conn = None
-    metrics = []
-    colnames = ["ID", "BU", "Production_line", "DL_Headcount", "H100", "H125", "H150", "H200", "WeekNo", "Import_Date", "Year"]
     this_year = current_year()
     banner_week = None  # sera passé au template comme 'filled_week'
+    lines = None        # référentiel des lignes (registry.py)
 
     try:
-        conn = get_db_connection()
+        # saisie sur le primaire ; listing et bannière sur la réplique (si configurée)
+        conn = get_db_connection() if request.method == 'POST' else get_read_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        lines = catalog('DL', conn)  # instantané en mémoire (formulaire, insertion, filtres)
 
         if request.method == 'POST':
             try:
-                # ✅ Lignes fixes Valeo et Nidec
-                lines_valeo = ["FLEX", "MNG2", "FP", "GENII R", "GENII C", "BUA", "VM4"]
-                lines_nidec = ["NEM2", "SIM AS", "SKP42", "NGMAP", "POWERTOOLS", "10T", "11TA", "DCK", "CM3", "CM4", "FAIX"]
-
                 weekno = request.form['weekno']
                 import_date = datetime.now().date()   # ✅ automatique à la saisie
                 year = this_year                      # ✅ forcer l'année courante
 
-                # === Valeo ===
-                for line in lines_valeo:
-                    dl_headcount = int(request.form.get(f"{line}_dl_headcount", 0) or 0)
-                    h100 = float(request.form.get(f"{line}_h100", 0) or 0)
-                    h125 = float(request.form.get(f"{line}_h125", 0) or 0) * 1.25
-                    h150 = float(request.form.get(f"{line}_h150", 0) or 0) * 0.5
-                    h200 = float(request.form.get(f"{line}_h200", 0) or 0) * 2
-
-                    def values_builder(rid):
-                        return (rid, "VALEO", line, dl_headcount, h100, h125, h150, h200, weekno, import_date, year)
-
-                    insert_with_short_id(cur, year, values_builder)
-
-                # === Nidec ===
-                for line in lines_nidec:
-                    dl_headcount = int(request.form.get(f"{line}_dl_headcount", 0) or 0)
-                    h100 = float(request.form.get(f"{line}_h100", 0) or 0)
-                    h125 = float(request.form.get(f"{line}_h125", 0) or 0) * 1.25
-                    h150 = float(request.form.get(f"{line}_h150", 0) or 0) * 0.5
-                    h200 = float(request.form.get(f"{line}_h200", 0) or 0) * 2
-
-                    def values_builder(rid):
-                        return (rid, "NIDEC", line, dl_headcount, h100, h125, h150, h200, weekno, import_date, year)
-
-                    insert_with_short_id(cur, year, values_builder)
+                # === Toutes les BU (Valeo + Nidec) : un seul INSERT pour la semaine ===
+                rows = build_week_rows(request.form, lines, weekno, import_date, year)
+                annotate(cur)  # route, client... pour le journal des modifications (history.py)
+                bulk_insert_with_short_ids(cur, INSERT_SQL, rows, year)
+                # agrégats recalculés après la réponse (travail de fond enregistré avec la saisie)
+                enqueue(cur, 'refresh_rollup', {'source': 'DL', 'year': year, 'weeks': [weekno]})
 
                 conn.commit()
+                wake_jobs()
+                filled_weeks.set((TABLE, year, weekno), True)  # write-through : la semaine est saisie
                 flash(f"Toutes les lignes Valeo + Nidec {year} ont été enregistrées avec succès !", "success")
                 # redirect avec ?filled_week=...
                 return redirect(url_for('rh.index', filled_week=weekno))
@@ -167,30 +271,12 @@ def index():
                 if conn: conn.rollback()
                 flash(f"❌ Erreur de base de données : {db_error}", 'danger')
 
-        # ✅ Récupération des données existantes de l'année courante uniquement
-        select_query = """
-        SELECT "ID", "BU", "Production_line", "DL_Headcount",
-               "H100",
-               COALESCE("H125",0) / 1.25 as "H125",
-               COALESCE("H150",0) / 0.5  as "H150",
-               COALESCE("H200",0) / 2    as "H200",
-               "WeekNo", "Import_Date", "Year"
-        FROM weekly_dl_metrics
-        WHERE "Year" = %s
-        ORDER BY "Import_Date" DESC, "WeekNo" DESC
-        """
-        cur.execute(select_query, (this_year,))
-        metrics = cur.fetchall()
-
+        # ✅ Les lignes (et les valeurs des filtres) sont chargées par la grille via api_columns
         # --- NEW: compute banner_week for normal visits ---
         banner_week = request.args.get('filled_week')  # garde le comportement post-submit
         if not banner_week:
             default_week = current_prev_week_label()
-            cur.execute(
-                'SELECT 1 FROM weekly_dl_metrics WHERE "Year" = %s AND "WeekNo" = %s LIMIT 1',
-                (this_year, default_week)
-            )
-            if cur.fetchone():
+            if week_is_filled(cur, this_year, default_week):
                 banner_week = default_week
         # ---------------------------------------------------
 
@@ -199,24 +285,138 @@ def index():
             conn.rollback()
         flash(f"❌ Erreur système : {e}", 'danger')
 
-    finally:
-        if conn:
-            conn.close()
-
     # passe filled_week au template (utilisé par la bannière d'info)
     return render_template(
         'rh/index.html',
-        metrics=metrics,
-        column_names=colnames,
-        datetime=datetime,
+        lines=lines,
         this_year=this_year,
+        editable_week=editable_week(),
         filled_week=banner_week
     )
 
+# -----------------------------------------------------------------------------
+# Routes : API JSON (pagination keyset, colonnes de la grille)
+# -----------------------------------------------------------------------------
+@rh_bp.route('/api/metrics')
+@conditional(TABLE, key=lambda: (current_year(), current_prev_week_label()))
+def api_metrics():
+    """
+    Page de métriques filtrée côté serveur.
+    Paramètres : line, bu, week, year (défaut: année courante), cursor, limit.
+    """
+    args = request.args.to_dict()
+    args.setdefault('year', str(current_year()))
+    try:
+        clauses, params = build_filters(args, FILTER_COLUMNS)
+        limit = parse_limit(args.get('limit'))
+        conn = get_read_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        rows, next_cursor = fetch_page(cur, SELECT_SQL, clauses, params, args.get('cursor'), limit)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    except psycopg2.Error as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+
+    items = []
+    for row in rows:
+        item = serialize_row(row)
+        item['editable'] = is_editable(row)
+        items.append(item)
+    return jsonify(items=items, next_cursor=next_cursor)
+
+@rh_bp.route('/api/columns')
+@conditional(TABLE, primary=True)
+def api_columns():
+    """
+    Lignes d'une année au format colonnaire pour la grille virtualisée (voir pagination.year_columns).
+    Paramètre : year (défaut : année courante).
+    """
+    try:
+        year = int(request.args.get('year', current_year()))
+    except ValueError:
+        return jsonify(error="Paramètre attendu : year (entier)."), 400
+
+    try:
+        # primaire, comme tout fragment mis en cache : versions des semaines et lignes lues sur le même serveur
+        conn = get_db_connection()
+        conn.rollback()  # versions lues par @conditional : year_columns ouvre son propre instantané
+        cur = conn.cursor()
+        payload, source = year_columns(
+            cur, TABLE, SELECT_SQL, year, GRID_COLUMNS,
+            encoded={'BU': None, 'Production_line': None, 'WeekNo': week_sort_key},
+            live_week=editable_week() if year == current_year() else None,
+        )
+    except psycopg2.Error as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+
+    response = make_response(payload)
+    response.mimetype = 'application/json'
+    response.headers['X-Fragment-Cache'] = source
+    return response
+
+# -----------------------------------------------------------------------------
+# Routes : EXPORT (CSV / XLSX en flux, mêmes filtres que l'API)
+# -----------------------------------------------------------------------------
+EXPORT_COLUMNS = ["ID", "BU", "Production_line", "DL_Headcount", "H100", "H125", "H150", "H200", "WeekNo", "Import_Date", "Year"]
+
+@rh_bp.route('/export.<fmt>')
+def export(fmt):
+    args = request.args.to_dict()
+    args.setdefault('year', str(current_year()))
+    try:
+        clauses, params = build_filters(args, FILTER_COLUMNS)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+
+    filename = f"dl_metrics_{args['year']}.{fmt}"
+    rows = iter_rows(SELECT_SQL, clauses, params)
+    if fmt == 'csv':
+        return csv_response(filename, EXPORT_COLUMNS, rows)
+    if fmt == 'xlsx':
+        if not xlsx_available():
+            return jsonify(error="Export XLSX indisponible (openpyxl non installé)."), 501
+        return xlsx_response(filename, EXPORT_COLUMNS, rows)
+    abort(404)
+
+# -----------------------------------------------------------------------------
+# Routes : IMPORT (semaines historiques, CSV / XLSX)
+# -----------------------------------------------------------------------------
+@rh_bp.route('/import', methods=['GET', 'POST'])
+@guarded_write
+def import_weeks():
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Veuillez choisir un fichier CSV ou XLSX.", 'warning')
+        else:
+            try:
+                report = run_import(get_db_connection(), IMPORT_SPEC, upload.filename, upload.stream,
+                                    skip_invalid=bool(request.form.get('skip_invalid')))
+                filled_weeks.invalidate_prefix((TABLE,))
+                fragments.invalidate_prefix((TABLE,))
+                flash(f"{report['inserted']} ligne(s) importée(s), {report['skipped_existing']} déjà présente(s).", 'success')
+            except ImportErrors as e:
+                report = e.report
+                flash(f"❌ Import annulé : {e}. Corrigez le fichier ou cochez « Ignorer les lignes invalides ».", 'danger')
+            except (ValueError, RuntimeError, psycopg2.Error) as e:
+                flash(f"❌ Erreur lors de l'import : {e}", 'danger')
+            except Exception as e:
+                flash(f"❌ Erreur système : {e}", 'danger')
+
+    return render_template(
+        'import.html',
+        report=report,
+        source='DL',
+        columns=EXPORT_COLUMNS,
+        back_url=url_for('rh.index'),
+    )
+
 # -----------------------------------------------------------------------------
 # Routes : UPDATE
 # -----------------------------------------------------------------------------
 @rh_bp.route('/update/<string:id>', methods=['GET', 'POST'])
+@guarded_write
 def update(id):
     conn = None
     metric = None
@@ -226,23 +426,36 @@ def update(id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
+        if request.method == 'POST':
+            data = parse_form_data(request.form)
+
+            # ✅ Version, année et écriture en un seul aller-retour
+            annotate(cur)
+            cur.execute(UPDATE_SQL, dict(data, id=id, year=this_year))
+            changed = cur.fetchone()
+
+            if changed is not None:
+                refresh_rollup(cur, 'DL', this_year, [changed['old_week'], changed['WeekNo']])
+                conn.commit()
+                filled_weeks.invalidate_prefix((TABLE,))
+                flash('Métrique mise à jour avec succès !', 'success')
+                return redirect(url_for('rh.index'))
+
+            # ❌ Rien d'écrit : ligne absente, autre année, ou modifiée entre-temps par quelqu'un d'autre
+            conn.rollback()
+            cur.execute(SELECT_BY_ID_SQL, (id,))
+            metric = cur.fetchone()
+            if metric is None:
+                abort(404)
+            if int(metric['year']) != this_year:
+                flash(f"Modification refusée : seules les données de {this_year} sont modifiables.", "danger")
+                return redirect(url_for('rh.index'))
+            flash("⚠️ Cette ligne a été modifiée par un autre utilisateur pendant votre saisie. "
+                  "Les valeurs actuelles sont affichées : vérifiez-les puis enregistrez à nouveau.", 'warning')
+            return render_template('rh/update.html', metric=metric, this_year=this_year), 409
+
         # ✅ Charger la ligne
-        cur.execute("""
-            SELECT 
-               "ID" as id,
-               "BU" as bu,
-               "Production_line" as production_line,
-               "DL_Headcount" as dl_headcount,
-               "H100" as h100,
-               ROUND(CAST(COALESCE("H125", 0.00) / 1.25 AS numeric), 2) AS h125,
-               ROUND(CAST(COALESCE("H150", 0.00) / 0.5 AS numeric), 2) AS h150,
-               ROUND(CAST(COALESCE("H200", 0.00) / 2 AS numeric), 2) AS h200,
-               "WeekNo" as weekno,
-               "Import_Date" as import_date,
-               "Year" as year
-            FROM weekly_dl_metrics
-            WHERE "ID" = %s
-        """, (id,))
+        cur.execute(SELECT_BY_ID_SQL, (id,))
         metric = cur.fetchone()
 
         # ❌ Si la ligne n'existe pas
@@ -254,40 +467,134 @@ def update(id):
             flash(f"Modification non autorisée : seules les données de {this_year} sont modifiables.", "warning")
             abort(404)
 
-        if request.method == 'POST':
-            data = parse_form_data(request.form)
+    except (ValueError, psycopg2.Error) as e:
+        if conn:
+            conn.rollback()
+        flash(f"Erreur lors de la modification : {e}", 'danger')
+        return render_template('rh/update.html', metric=metric, this_year=this_year)
 
-            # ✅ On ne touche pas Import_Date ni Year lors d’un update
-            update_query = """
-            UPDATE weekly_dl_metrics SET
-              "BU"=%s, "Production_line"=%s, "DL_Headcount"=%s,
-              "H100"=%s, "H125"=%s, "H150"=%s, "H200"=%s,
-              "WeekNo"=%s
-            WHERE "ID" = %s AND "Year" = %s
-            """
-            values = (
-                data['bu'], data['production_line'], data['dl_headcount'],
-                data['h100'], data['h125'], data['h150'], data['h200'],
-                data['weekno'], id, this_year
-            )
-            cur.execute(update_query, values)
-
-            if cur.rowcount == 0:
-                conn.rollback()
-                flash(f"Modification refusée : seules les données de {this_year} sont modifiables.", "danger")
+    return render_template('rh/update.html', metric=metric, this_year=this_year)
+
+# -----------------------------------------------------------------------------
+# Routes : CORRECTION D'UNE SEMAINE (une BU, un seul UPDATE)
+# -----------------------------------------------------------------------------
+@rh_bp.route('/week/<string:weekno>', methods=['GET', 'POST'])
+@guarded_write
+def edit_week(weekno):
+    """
+    Grille de toutes les lignes d'une (BU, semaine) de l'année courante. Le navigateur n'envoie
+    que les lignes modifiées ; elles sont écrites en une instruction, tout ou rien.
+    """
+    conn = None
+    lines = None
+    rows = []
+    status = 200
+    this_year = current_year()
+    bu = request.args.get('bu', '')
+
+    try:
+        conn = get_db_connection()
+        lines = catalog('DL', conn)
+        if not bu and not lines.bus:
+            raise ValueError("référentiel DL vide : aucune BU à afficher (voir `flask lines-add`).")
+        bu = bu or lines.bus[0]
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+        if request.method == 'POST':
+            changes = parse_week_form(request.form, this_year, weekno, bu)
+            if not changes:
+                flash("Aucune modification à enregistrer.", 'warning')
+                return redirect(url_for('rh.edit_week', weekno=weekno, bu=bu))
+
+            annotate(cur)
+            written = bulk_update(cur, WEEK_UPDATE_SQL, changes, WEEK_UPDATE_TEMPLATE)
+            if len(written) == len(changes):
+                refresh_rollup(cur, 'DL', this_year, [weekno])
+                conn.commit()
+                flash(f"{len(written)} ligne(s) {bu} de la semaine {weekno} mise(s) à jour avec succès !", 'success')
                 return redirect(url_for('rh.index'))
 
-            conn.commit()
-            flash('Métrique mise à jour avec succès !', 'success')
-            return redirect(url_for('rh.index'))
+            # ❌ Tout ou rien : au moins une ligne a été modifiée entre-temps (ou n'est plus dans la grille)
+            conn.rollback()
+            stale = {c[0] for c in changes} - written
+            status = 409
+
+        cur.execute(WEEK_GRID_SQL, (this_year, weekno, bu))
+        order = {line: i for i, line in enumerate(lines.known.get(bu, ()))}
+        rows = sorted(cur.fetchall(), key=lambda r: (order.get(r['line'], len(order)), r['line']))
+
+        if status == 409:
+            names = ", ".join(r['line'] for r in rows if r['ID'] in stale) or f"{len(stale)} ligne(s)"
+            flash(f"⚠️ Aucune modification enregistrée : {names} modifiée(s) par un autre utilisateur "
+                  "pendant votre saisie. Les valeurs actuelles sont affichées : vérifiez-les puis enregistrez à nouveau.",
+                  'warning')
 
     except (ValueError, psycopg2.Error) as e:
         if conn:
             conn.rollback()
         flash(f"Erreur lors de la modification : {e}", 'danger')
-        return render_template('rh/update.html', metric=metric, this_year=this_year)
-    finally:
-        if conn:
-            conn.close()
 
-    return render_template('rh/update.html', metric=metric, this_year=this_year)
+    return render_template(
+        'edit_week.html',
+        rows=rows,
+        source='DL',
+        line_label='Ligne',
+        bus=lines.bus if lines else (),
+        bu=bu,
+        weekno=weekno,
+        year=this_year,
+        endpoint='rh.edit_week',
+        history_url=url_for('rh.week_history', weekno=weekno, bu=bu),
+        back_url=url_for('rh.index'),
+    ), status
+
+# -----------------------------------------------------------------------------
+# Routes : HISTORIQUE DES MODIFICATIONS (journal metrics_history, voir history.py)
+# -----------------------------------------------------------------------------
+@rh_bp.route('/history/<string:id>')
+def history(id):
+    """Modifications d'une ligne, de la plus récente à la plus ancienne."""
+    entries, before = [], None
+    try:
+        cur = get_read_connection().cursor(cursor_factory=psycopg2.extras.DictCursor)
+        entries, before = row_history(cur, TABLE, IMPORT_SPEC['line_column'], id,
+                                      before=request.args.get('before', type=int),
+                                      limit=parse_limit(request.args.get('limit')))
+    except (ValueError, psycopg2.Error) as e:
+        flash(f"❌ Erreur de base de données : {e}", 'danger')
+
+    return render_template(
+        'history.html',
+        entries=entries,
+        source='DL',
+        line_label='Ligne',
+        title=f"ligne {id}",
+        more_url=url_for('rh.history', id=id, before=before) if before else None,
+        back_url=url_for('rh.index'),
+    )
+
+
+@rh_bp.route('/week/<string:weekno>/history')
+def week_history(weekno):
+    """Modifications d'une semaine (toutes les BU, ou ?bu=...)."""
+    entries, before = [], None
+    bu = request.args.get('bu') or None
+    year = current_year()
+    try:
+        year = int(request.args.get('year', year))
+        cur = get_read_connection().cursor(cursor_factory=psycopg2.extras.DictCursor)
+        entries, before = week_history_entries(cur, TABLE, IMPORT_SPEC['line_column'], year, weekno, bu,
+                                               before=request.args.get('before', type=int),
+                                               limit=parse_limit(request.args.get('limit')))
+    except (ValueError, psycopg2.Error) as e:
+        flash(f"❌ Erreur de base de données : {e}", 'danger')
+
+    return render_template(
+        'history.html',
+        entries=entries,
+        source='DL',
+        line_label='Ligne',
+        title=f"semaine {weekno} / {year}" + (f" — {bu}" if bu else ""),
+        more_url=url_for('rh.week_history', weekno=weekno, bu=bu, year=year, before=before) if before else None,
+        back_url=url_for('rh.edit_week', weekno=weekno, bu=bu) if year == current_year() else url_for('rh.index'),
+    )
@@ -0,0 +1,134 @@
+# rollups.py
+"""
+Agrégats hebdomadaires des heures (table weekly_hours_rollup).
+
+Une ligne par (Source, Year, WeekNo, BU, Type) :
+- Source 'DL'  : weekly_dl_metrics, Type = 'DL'
+- Source 'VOH' : weekly_voh_metrics, Type = VOH / FOH / ADMIN (référentiel, registry.py)
+avec l'effectif, les heures saisies (sans coefficient) et le total pondéré
+(H100 + H125*1.25 + H150*0.5 + H200*2, tel que stocké dans les tables brutes).
+
+refresh_rollup() recalcule seulement les semaines touchées par une écriture,
+dans la transaction de l'appelant : le tableau de bord ne lit jamais les
+tables brutes. Chaque semaine est d'abord verrouillée (verrou consultatif de
+transaction, semaines dans l'ordre) : deux écritures concurrentes sur une même
+semaine recalculent l'une après l'autre, la seconde voit les lignes validées
+par la première au lieu d'écraser l'agrégat avec un instantané incomplet.
+"""
+
+ROLLUP_TABLE = "weekly_hours_rollup"
+
+SOURCES = {
+    'DL': {'table': 'public.weekly_dl_metrics', 'type_expr': "'DL'"},
+    'VOH': {'table': 'public.weekly_voh_metrics', 'type_expr': '"Type"'},
+}
+
+CREATE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS public.{ROLLUP_TABLE} (
+        "Source"         varchar(3)  NOT NULL,
+        "Year"           integer     NOT NULL,
+        "WeekNo"         varchar(4)  NOT NULL,
+        "BU"             varchar(20) NOT NULL,
+        "Type"           varchar(10) NOT NULL,
+        "Lines"          integer     NOT NULL DEFAULT 0,
+        "DL_Headcount"   integer     NOT NULL DEFAULT 0,
+        "H100"           double precision NOT NULL DEFAULT 0,
+        "H125"           double precision NOT NULL DEFAULT 0,
+        "H150"           double precision NOT NULL DEFAULT 0,
+        "H200"           double precision NOT NULL DEFAULT 0,
+        "Raw_hours"      double precision NOT NULL DEFAULT 0,
+        "Weighted_hours" double precision NOT NULL DEFAULT 0,
+        "Updated_at"     timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY ("Source", "Year", "WeekNo", "BU", "Type")
+    )
+"""
+
+# Agrégat d'une table brute ; {where} restreint aux semaines touchées
+_AGGREGATE_SQL = """
+    SELECT %(source)s AS "Source", "Year", "WeekNo", "BU", {type_expr} AS "Type",
+           count(*) AS "Lines",
+           COALESCE(sum("DL_Headcount"), 0) AS "DL_Headcount",
+           COALESCE(sum("H100"), 0) AS "H100",
+           COALESCE(sum("H125"), 0) / 1.25 AS "H125",
+           COALESCE(sum("H150"), 0) / 0.5 AS "H150",
+           COALESCE(sum("H200"), 0) / 2 AS "H200",
+           COALESCE(sum("H100"), 0) + COALESCE(sum("H125"), 0) / 1.25
+             + COALESCE(sum("H150"), 0) / 0.5 + COALESCE(sum("H200"), 0) / 2 AS "Raw_hours",
+           COALESCE(sum(COALESCE("H100",0) + COALESCE("H125",0) + COALESCE("H150",0) + COALESCE("H200",0)), 0)
+             AS "Weighted_hours",
+           now() AS "Updated_at"
+    FROM {table}
+    {where}
+    GROUP BY 2, 3, 4, 5  -- Year, WeekNo, BU, Type
+"""
+
+_COLUMNS = ('"Source", "Year", "WeekNo", "BU", "Type", "Lines", "DL_Headcount", '
+            '"H100", "H125", "H150", "H200", "Raw_hours", "Weighted_hours", "Updated_at"')
+
+# Upsert des groupes recalculés + suppression des groupes disparus, en une seule requête
+_REFRESH_SQL = f"""
+    WITH fresh AS ({{aggregate}}),
+    upserted AS (
+        INSERT INTO public.{ROLLUP_TABLE} ({_COLUMNS})
+        SELECT * FROM fresh
+        ON CONFLICT ("Source", "Year", "WeekNo", "BU", "Type") DO UPDATE SET
+            "Lines" = EXCLUDED."Lines",
+            "DL_Headcount" = EXCLUDED."DL_Headcount",
+            "H100" = EXCLUDED."H100",
+            "H125" = EXCLUDED."H125",
+            "H150" = EXCLUDED."H150",
+            "H200" = EXCLUDED."H200",
+            "Raw_hours" = EXCLUDED."Raw_hours",
+            "Weighted_hours" = EXCLUDED."Weighted_hours",
+            "Updated_at" = EXCLUDED."Updated_at"
+        RETURNING 1
+    )
+    DELETE FROM public.{ROLLUP_TABLE} r
+    WHERE r."Source" = %(source)s AND r."Year" = %(year)s AND r."WeekNo" = ANY(%(weeks)s)
+      AND NOT EXISTS (
+          SELECT 1 FROM fresh f
+          WHERE f."WeekNo" = r."WeekNo" AND f."BU" = r."BU" AND f."Type" = r."Type"
+      )
+"""
+
+
+# Verrou d'une (source, année, semaine), libéré à la fin de la transaction
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('rollup:' || %s || ':' || %s || ':' || %s))"
+
+
+def _aggregate_sql(source, where):
+    spec = SOURCES[source]
+    return _AGGREGATE_SQL.format(table=spec['table'], type_expr=spec['type_expr'], where=where)
+
+
+def refresh_query(source, year, weeks):
+    """(SQL, paramètres nommés) du recalcul de `weeks` ; None si aucune semaine."""
+    weeks = sorted({str(w) for w in weeks})
+    if not weeks:
+        return None
+    aggregate = _aggregate_sql(source, 'WHERE "Year" = %(year)s AND "WeekNo" = ANY(%(weeks)s)')
+    return _REFRESH_SQL.format(aggregate=aggregate), {'source': source, 'year': int(year), 'weeks': weeks}
+
+
+def refresh_rollup(cur, source, year, weeks):
+    """
+    Recalcule les agrégats de `source` ('DL' ou 'VOH') pour les semaines `weeks` de `year`.
+    À appeler dans la même transaction que l'écriture sur la table brute.
+    """
+    query = refresh_query(source, year, weeks)
+    if query is None:
+        return
+    # instruction séparée : l'instantané du recalcul est pris après l'obtention des verrous
+    for week in query[1]['weeks']:
+        cur.execute(LOCK_SQL, (source, str(int(year)), week))
+    cur.execute(*query)
+
+
+def rebuild_all(cur):
+    """Reconstruit entièrement la table d'agrégats (migration / réparation)."""
+    cur.execute(f"TRUNCATE public.{ROLLUP_TABLE}")
+    for source in SOURCES:
+        cur.execute(
+            f"INSERT INTO public.{ROLLUP_TABLE} ({_COLUMNS}) " + _aggregate_sql(source, ''),
+            {'source': source}
+        )
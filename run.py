@@ -1,19 +1,238 @@
 # run.py
-from flask import Flask, render_template
-from rh_app.routes import rh_bp
-from voh_app.routes import voh_bp
+"""
+Fabrique de l'application Flask.
+
+    python run.py                               # développement (rechargeur, threads de fond)
+    flask --app run db-upgrade                  # commandes CLI (sans préchauffage ni threads de fond)
+    gunicorn wsgi:app                           # production (voir wsgi.py, gunicorn.conf.py)
+
+create_app() construit l'application (configuration, pool, blueprints, CLI) ;
+les modules de routes ne sont importés qu'à ce moment-là. Deux étapes sont
+séparées pour gunicorn --preload :
+- warm_up() : compilation des templates (cache de bytecode sur disque,
+  TEMPLATE_CACHE_DIR), référentiel des lignes, connexions du pool ; faite une
+  fois dans le processus maître, héritée par les workers au fork ;
+- start_background() : threads de fond (auto-contrôle du schéma, vue KPI,
+  travaux de fond) et connexions propres au worker ; à faire après le fork.
+
+La durée de chaque phase du démarrage est journalisée et exposée dans
+/health et /metrics (app_startup_seconds).
+
+`run.app` reste disponible (asgi.py, bench, `flask --app run`) : l'application
+est créée et démarrée au premier accès à l'attribut. Sous la commande `flask`
+(FLASK_RUN_FROM_CLI), elle n'est ni préchauffée ni démarrée : db-upgrade,
+import-weeks, jobs-run... ne lancent ni auto-contrôle, ni rafraîchissement KPI,
+ni workers concurrents, et ne touchent pas au schéma avant la migration.
+`flask --app run run` sert donc sans threads de fond ; préférer `python run.py`.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime
+
+from flask import Flask, Response, render_template, jsonify
 from config import Config  # ✅ config globale
 
-app = Flask(__name__)
-app.config.from_object(Config)
+logger = logging.getLogger(__name__)
+
+_app = None
+
+
+def create_app(config=Config, warm=True, background=True):
+    """Construit l'application ; `warm` / `background` : voir warm_up() et start_background()."""
+    started = time.perf_counter()
+    phases = {}
+
+    from rh_app.routes import rh_bp
+    from voh_app.routes import voh_bp
+    from dashboard_app.routes import dashboard_bp
+    from kpi_app.routes import kpi_bp
+    from jobs_app.routes import jobs_bp
+    from db import init_pool
+    from instrumentation import init_instrumentation, render_metrics
+    from http_cache import init_http_cache
+    from cache import all_stats as cache_stats
+    from migrations import register_cli
+    from importer import register_cli as register_import_cli
+    from registry import registry, register_cli as register_registry_cli
+    from kpi import register_cli as register_kpi_cli
+    from jobs import register_cli as register_jobs_cli
+    from write_guard import guard, init_write_guard
+    from history import register_cli as register_history_cli
+    phases['imports'] = time.perf_counter() - started
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    # Templates compilés une fois puis relus depuis le disque (redémarrages, workers)
+    init_template_cache(app)
+
+    # Chronométrage des requêtes, du SQL et des templates (Server-Timing, logs JSON, /metrics)
+    init_instrumentation(app)
+
+    # Compression gzip / brotli (les ETag des pages de listing sont posés par @conditional)
+    init_http_cache(app)
+
+    # Pool de connexions PostgreSQL partagé par les blueprints
+    db_pool = init_pool(app)
+
+    # Limiteur de débit et clés d'idempotence des POST (état partagé dans PostgreSQL si WRITE_GUARD_SHARED)
+    init_write_guard(app)
+
+    # Commandes `flask db-upgrade` / `flask db-check`
+    register_cli(app)
+
+    # Référentiel des lignes / fonctions (`flask lines-*` pour le modifier)
+    register_registry_cli(app)
+
+    # Commande `flask import-weeks {rh|voh} FICHIER` (import historique en masse)
+    register_import_cli(app)
+
+    # Vue matérialisée du ratio indirects / directs (`flask kpi-refresh`)
+    register_kpi_cli(app)
+
+    # Travaux de fond (`flask jobs-run`, `flask jobs-retry`)
+    register_jobs_cli(app)
+
+    # Journal des modifications (`flask history-partitions`, `flask history-prune`)
+    register_history_cli(app)
+
+    # Enregistre les blueprints
+    app.register_blueprint(rh_bp, url_prefix="/rh")
+    app.register_blueprint(voh_bp, url_prefix="/voh")
+    app.register_blueprint(dashboard_bp, url_prefix="/dashboard")
+    app.register_blueprint(kpi_bp, url_prefix="/kpi")
+    app.register_blueprint(jobs_bp, url_prefix="/jobs")
+
+    @app.route('/')
+    def home():
+        return render_template('home.html')
+
+    @app.route('/health')
+    def health():
+        """Statistiques d'exploitation (démarrage, pools de connexions, caches en mémoire, référentiel, routes d'écriture)."""
+        replica = app.extensions.get('db_replica')
+        return jsonify(startup=app.extensions['startup'], db_pool=db_pool.stats(),
+                       db_replica=replica.stats() if replica else None, caches=cache_stats(),
+                       registry=registry.stats(), write_guard=guard.stats())
+
+    @app.route('/metrics')
+    def metrics():
+        """Métriques au format Prometheus (histogrammes de latence par route, pool, caches, démarrage, routes d'écriture)."""
+        body = render_metrics(pool_stats=db_pool.stats(), cache_stats=cache_stats(),
+                              startup=app.extensions['startup'], guard_stats=guard.stats())
+        return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    phases['init'] = time.perf_counter() - started - phases['imports']
+    app.extensions['startup'] = {'phases': phases, 'total': None}
+    if warm:
+        warm_up(app)
+    if background:
+        start_background(app)
+    _report_startup(app, started)
+    return app
+
+
+# -----------------------------------------------------------------------------
+# Démarrage
+# -----------------------------------------------------------------------------
+def init_template_cache(app):
+    """Cache de bytecode Jinja sur disque (TEMPLATE_CACHE_DIR, vide = désactivé)."""
+    directory = app.config['TEMPLATE_CACHE_DIR']
+    if not directory:
+        return
+    from jinja2 import FileSystemBytecodeCache
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(directory)}
+
+
+def precompile_templates(app):
+    """Charge tous les templates (app + blueprints) : plus de compilation à la première requête."""
+    count = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        try:
+            app.jinja_env.get_template(name)
+            count += 1
+        except Exception as e:  # un template invalide ne doit pas empêcher le démarrage
+            logger.warning("Template %s non compilé : %s", name, e)
+    return count
+
+
+def warm_up(app):
+    """Templates, référentiel, pool et partitions du journal prêts avant la première requête (n'échoue jamais)."""
+    from registry import registry
+    from history import ensure_partitions
+    phases = app.extensions['startup']['phases']
+    pool = app.extensions['db_pool']
+
+    started = time.perf_counter()
+    app.extensions['startup']['templates'] = precompile_templates(app)
+    phases['templates'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pool.warm()
+    registry.preload(pool)
+    try:
+        # année courante et suivante : le journal ne déborde pas dans sa partition par défaut
+        year = datetime.now().year
+        with pool.connection() as conn:
+            ensure_partitions(conn, (year, year + 1))
+    except Exception as e:
+        logger.warning("Partitions du journal des modifications non vérifiées : %s", e)
+    phases['warmup'] = time.perf_counter() - started
+
+
+def start_background(app):
+    """Threads de fond du processus courant (après le fork sous gunicorn --preload)."""
+    from migrations import start_self_check
+    from kpi import start_refresh_scheduler
+    from jobs import start_workers
+    cfg = app.config
+    pool = app.extensions['db_pool']
+
+    # Auto-contrôle du schéma (index manquants, plans EXPLAIN), non bloquant
+    if cfg['DB_STARTUP_CHECK']:
+        start_self_check(pool)
+
+    # Vue matérialisée du ratio indirects / directs : rafraîchie après chaque écriture et périodiquement
+    if cfg['KPI_REFRESH_POLL'] > 0:
+        start_refresh_scheduler(pool, cfg['KPI_REFRESH_POLL'], cfg['KPI_REFRESH_INTERVAL'])
+
+    # Travaux de fond (recalcul des agrégats après une saisie...) : file persistante + workers en threads
+    if cfg['JOB_WORKERS'] > 0:
+        start_workers(pool, cfg['JOB_WORKERS'], cfg['JOB_POLL_INTERVAL'], cfg['JOB_RETENTION_DAYS'],
+                      max_attempts=cfg['JOB_MAX_ATTEMPTS'], backoff_base=cfg['JOB_BACKOFF_BASE'],
+                      lease=cfg['JOB_LEASE'])
+
+
+def _report_startup(app, started):
+    startup = app.extensions['startup']
+    startup['total'] = time.perf_counter() - started
+    logger.info("Application prête en %.0f ms (%s)", startup['total'] * 1000,
+                ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in startup['phases'].items()))
+
+
+def get_app():
+    """Application du module, créée au premier appel (démarrée, sauf sous la commande `flask`)."""
+    global _app
+    if _app is None:
+        if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+            _app = create_app(warm=False, background=False)
+        else:
+            _app = create_app()
+    return _app
+
 
-# Enregistre les deux blueprints
-app.register_blueprint(rh_bp, url_prefix="/rh")
-app.register_blueprint(voh_bp, url_prefix="/voh")
+def __getattr__(name):
+    # `from run import app`, `flask --app run` : création paresseuse
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-@app.route('/')
-def home():
-    return render_template('home.html')
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # rechargeur : le processus parent ne fait que surveiller les fichiers, seul l'enfant
+    # (WERKZEUG_RUN_MAIN) sert les requêtes, se préchauffe et lance les threads de fond
+    serving = os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    create_app(warm=serving, background=serving).run(debug=True)
@@ -0,0 +1,23 @@
+/*
+ * static/js/submit_key.js
+ *
+ * Clé d'idempotence des formulaires POST (voir write_guard.py) : chaque champ
+ * caché `idempotency_key` reçoit une clé nouvelle à chaque affichage de la
+ * page, y compris depuis le cache de navigation (retour arrière). Un double
+ * clic ou un rafraîchissement après soumission renvoie la même clé : le
+ * serveur rejoue le résultat de la première soumission sans réécrire.
+ */
+
+function newSubmitKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  // contexte non sécurisé (HTTP hors localhost) : randomUUID indisponible
+  const bytes = new Uint8Array(16);
+  crypto.getRandomValues(bytes);
+  return Array.from(bytes, b => b.toString(16).padStart(2, "0")).join("");
+}
+
+window.addEventListener("pageshow", () => {
+  document.querySelectorAll('input[name="idempotency_key"]').forEach(input => {
+    input.value = newSubmitKey();
+  });
+});
@@ -0,0 +1,208 @@
+/*
+ * static/js/vgrid.js
+ *
+ * Grille virtualisée de l'onglet « Modification » (pages RH et VOH).
+ *
+ * ColumnStore : lignes reçues de /api/columns, une année par réponse (en blocs), au
+ * format colonnaire. Les colonnes codées par dictionnaire (BU, ligne,
+ * semaine...) gardent, pour chaque valeur, la liste de ses lignes : un filtre
+ * part de la plus courte de ces listes au lieu de parcourir toute la table.
+ * Le tri compare des rangs (colonnes codées) ou les valeurs brutes.
+ *
+ * VirtualGrid : seules les lignes visibles (plus une marge) existent dans le
+ * DOM ; deux lignes d'espacement donnent au tableau sa hauteur totale.
+ */
+
+function compareValues(a, b) {
+  if (a === b) return 0;
+  if (a === null || a === undefined) return 1;
+  if (b === null || b === undefined) return -1;
+  return a < b ? -1 : a > b ? 1 : 0;
+}
+
+class ColumnStore {
+  // columns : colonnes affichées ; encoded : colonnes codées ; keys : clé de tri par colonne (ex : 'W12' -> 12)
+  constructor(columns, encoded, keys = {}) {
+    this.columns = columns;
+    this.encoded = new Set(encoded);
+    this.keys = keys;
+    this.length = 0;
+    this.data = {};    // colonne -> valeurs (ou codes) des lignes
+    this.values = {};  // colonne codée -> valeur de chaque code
+    this.codes = {};   // colonne codée -> Map(valeur en texte -> code)
+    this.index = {};   // colonne codée -> numéros de ligne de chaque code
+    this.ranks = {};   // colonne codée -> rang de tri de chaque code (recalculé après append)
+    columns.forEach(name => { this.data[name] = []; });
+    encoded.forEach(name => {
+      this.values[name] = [];
+      this.codes[name] = new Map();
+      this.index[name] = [];
+    });
+  }
+
+  code(name, value) {
+    const key = String(value);
+    let code = this.codes[name].get(key);
+    if (code === undefined) {
+      code = this.values[name].length;
+      this.codes[name].set(key, code);
+      this.values[name].push(value);
+      this.index[name].push([]);
+    }
+    return code;
+  }
+
+  // Ajoute un bloc (chunks[i]) de /api/columns ; constants : colonnes absentes de la réponse (ex : { Year: 2025 })
+  append(chunk, constants = {}) {
+    const base = this.length;
+    const count = chunk.count;
+    this.columns.forEach(name => {
+      const out = this.data[name];
+      if (name in constants) {
+        const code = this.code(name, constants[name]);
+        const rows = this.index[name][code];
+        for (let i = 0; i < count; i++) {
+          out.push(code);
+          rows.push(base + i);
+        }
+      } else if (this.encoded.has(name)) {
+        const remap = chunk.values[name].map(value => this.code(name, value));
+        const src = chunk.columns[name];
+        const index = this.index[name];
+        for (let i = 0; i < count; i++) {
+          const code = remap[src[i]];
+          out.push(code);
+          index[code].push(base + i);
+        }
+      } else {
+        const src = chunk.columns[name];
+        for (let i = 0; i < count; i++) out.push(src[i]);
+      }
+    });
+    this.length += count;
+    this.ranks = {};
+  }
+
+  value(name, row) {
+    const value = this.data[name][row];
+    return this.encoded.has(name) ? this.values[name][value] : value;
+  }
+
+  // Lignes dont chaque colonne de `filters` ({ colonne: valeur }, "" = pas de filtre) vaut la valeur demandée
+  select(filters) {
+    const active = [];
+    for (const [name, value] of Object.entries(filters)) {
+      if (value === "" || value === null || value === undefined) continue;
+      const code = this.codes[name].get(String(value));
+      if (code === undefined) return [];
+      active.push([name, code]);
+    }
+    if (!active.length) return Array.from({ length: this.length }, (_, i) => i);
+    active.sort((a, b) => this.index[a[0]][a[1]].length - this.index[b[0]][b[1]].length);
+    const [[name, code], ...rest] = active;
+    if (!rest.length) return this.index[name][code].slice();
+    return this.index[name][code].filter(row => rest.every(([n, c]) => this.data[n][row] === c));
+  }
+
+  rank(name) {
+    if (!this.ranks[name]) {
+      const key = this.keys[name] || (value => value);
+      const values = this.values[name];
+      const order = values.map((_, code) => code)
+        .sort((a, b) => compareValues(key(values[a]), key(values[b])));
+      const rank = new Array(values.length);
+      order.forEach((code, i) => { rank[code] = i; });
+      this.ranks[name] = rank;
+    }
+    return this.ranks[name];
+  }
+
+  // Trie `rows` sur une colonne (direction 1 / -1) ; à égalité, l'ordre du serveur est conservé
+  sort(rows, name, direction = 1) {
+    const data = this.data[name];
+    if (this.encoded.has(name)) {
+      const rank = this.rank(name);
+      return rows.sort((a, b) => (rank[data[a]] - rank[data[b]]) * direction || a - b);
+    }
+    return rows.sort((a, b) => {
+      const x = data[a], y = data[b];
+      const missing = x === null || x === undefined || y === null || y === undefined;  // toujours en fin de liste
+      return compareValues(x, y) * (missing ? 1 : direction) || a - b;
+    });
+  }
+
+  // Valeurs distinctes d'une colonne codée, triées (listes des filtres)
+  distinct(name, direction = 1) {
+    const rank = this.rank(name);
+    return this.values[name]
+      .map((value, code) => [rank[code], value])
+      .sort((a, b) => (a[0] - b[0]) * direction)
+      .map(([, value]) => value);
+  }
+}
+
+class VirtualGrid {
+  // viewport : conteneur qui défile ; table : <table> avec <thead> ; renderRow(numéro de ligne) -> <tr>
+  constructor(viewport, table, renderRow, { rowHeight = 48, overscan = 10 } = {}) {
+    this.viewport = viewport;
+    this.tbody = table.tBodies[0];
+    this.colspan = table.tHead.rows[0].cells.length;
+    this.renderRow = renderRow;
+    this.rowHeight = rowHeight;
+    this.overscan = overscan;
+    this.rows = [];
+    this.pending = false;
+    this.top = this.spacer();
+    this.bottom = this.spacer();
+    viewport.addEventListener("scroll", () => this.schedule(), { passive: true });
+    // onglet affiché, fenêtre redimensionnée : nombre de lignes visibles à recalculer
+    new ResizeObserver(() => this.schedule()).observe(viewport);
+  }
+
+  spacer() {
+    const tr = document.createElement("tr");
+    const td = document.createElement("td");
+    td.colSpan = this.colspan;
+    td.style.padding = "0";
+    td.style.border = "0";
+    tr.appendChild(td);
+    return tr;
+  }
+
+  setRows(rows, { keepScroll = false } = {}) {
+    this.rows = rows;
+    if (!keepScroll) this.viewport.scrollTop = 0;
+    this.render();
+  }
+
+  schedule() {
+    if (this.pending) return;
+    this.pending = true;
+    requestAnimationFrame(() => {
+      this.pending = false;
+      this.render();
+    });
+  }
+
+  render() {
+    const top = this.viewport.scrollTop;
+    const height = this.viewport.clientHeight || window.innerHeight;
+    const first = Math.max(0, Math.floor(top / this.rowHeight) - this.overscan);
+    const last = Math.min(this.rows.length, Math.ceil((top + height) / this.rowHeight) + this.overscan);
+    const frag = document.createDocumentFragment();
+    for (let i = first; i < last; i++) frag.appendChild(this.renderRow(this.rows[i]));
+    this.top.firstChild.style.height = `${first * this.rowHeight}px`;
+    this.bottom.firstChild.style.height = `${(this.rows.length - last) * this.rowHeight}px`;
+    this.tbody.replaceChildren(this.top, frag, this.bottom);
+
+    // hauteur réelle d'une ligne (police, zoom), mesurée dès que la grille est affichée
+    const sample = this.top.nextElementSibling;
+    if (sample !== this.bottom) {
+      const measured = sample.getBoundingClientRect().height;
+      if (measured && Math.abs(measured - this.rowHeight) > 0.5) {
+        this.rowHeight = measured;
+        this.schedule();
+      }
+    }
+  }
+}
@@ -0,0 +1,52 @@
+# tests/test_analytics.py
+"""
+Calculs vectorisés des rapports (analytics) : pivot, moyenne glissante, écart hebdomadaire.
+Sans base de données.
+"""
+
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from analytics import pivot, ratio, rolling_mean, to_json, week_axis, week_over_week  # noqa: E402
+
+
+def test_pivot_sums_by_key_and_week():
+    weeks, week_idx = week_axis(np.array(['W1', 'W2', 'W1', 'W2', 'W1']))
+    keys = np.array(['L2', 'L1', 'L2', 'L2', 'L1'])
+    labels, matrix = pivot(keys, week_idx, len(weeks), np.array([1.0, 2.0, 3.0, 4.0, 5.0]))
+    assert weeks.tolist() == ['W1', 'W2']
+    assert labels.tolist() == ['L1', 'L2']
+    assert matrix.tolist() == [[5.0, 2.0], [4.0, 4.0]]
+
+
+def test_pivot_without_rows():
+    labels, matrix = pivot(np.array([], dtype=str), np.array([], dtype=np.intp), 0, np.array([]))
+    assert labels.size == 0 and matrix.shape == (0, 0)
+
+
+def test_rolling_mean_shrinks_window_at_start():
+    result = rolling_mean([2, 4, 6, 8], 2)
+    assert result.tolist() == [2.0, 3.0, 5.0, 7.0]
+
+
+def test_rolling_mean_window_of_one_and_wider_than_data():
+    assert rolling_mean([1, 5, 3], 1).tolist() == [1.0, 5.0, 3.0]
+    assert rolling_mean([1, 5, 3], 10).tolist() == [1.0, 3.0, 3.0]
+
+
+def test_rolling_mean_runs_along_last_axis():
+    result = rolling_mean(np.array([[1, 3, 5], [10, 10, 40]]), 2)
+    assert result.tolist() == [[1.0, 2.0, 4.0], [10.0, 10.0, 25.0]]
+
+
+def test_week_over_week():
+    result = week_over_week(np.array([[3.0, 5.0, 4.0]]))
+    assert math.isnan(result[0, 0])
+    assert result[0, 1:].tolist() == [2.0, -1.0]
+
+
+def test_ratio_and_json_turn_zero_division_into_null():
+    assert to_json(ratio([1, 2, 3], np.array([2, 0, 4]))) == [0.5, None, 0.75]
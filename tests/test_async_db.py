@@ -0,0 +1,28 @@
+# tests/test_async_db.py
+"""
+Conversion des paramètres psycopg2 (%s, %(nom)s) en paramètres asyncpg ($n).
+Sans base de données.
+"""
+
+import pytest
+
+pytest.importorskip("asyncpg")
+pytest.importorskip("quart")
+
+from async_app.db import to_asyncpg  # noqa: E402
+
+
+def test_positional_params():
+    sql, args = to_asyncpg('SELECT * FROM t WHERE "Year" = %s AND "WeekNo" = %s', (2025, 'W7'))
+    assert sql == 'SELECT * FROM t WHERE "Year" = $1 AND "WeekNo" = $2'
+    assert args == [2025, 'W7']
+
+
+def test_named_params_are_numbered_once():
+    sql, args = to_asyncpg('%(burst)s, LEAST(%(burst)s, %(rate)s)', {'rate': 0.5, 'burst': 10})
+    assert sql == '$1, LEAST($1, $2)'
+    assert args == [10, 0.5]
+
+
+def test_without_params():
+    assert to_asyncpg('SELECT 1') == ('SELECT 1', [])
@@ -0,0 +1,60 @@
+# tests/test_ids.py
+"""
+Identifiants courts (ids) : format des ID et permutation du mode séquence.
+Sans base de données.
+"""
+
+from ids import (
+    ALPHABET, CORE_LEN, _FEISTEL_KEYS, _HALF_BITS, _HALF_MASK, _permute, encode, random_ids, year_prefix,
+)
+
+
+def _decode(rid):
+    """Inverse de la base 32 d'encode() : ID -> valeur permutée."""
+    value = 0
+    for char in rid.split('-', 1)[1]:
+        value = value * len(ALPHABET) + ALPHABET.index(char)
+    return value
+
+
+def _unpermute(value):
+    """Feistel déroulé à l'envers : inverse de ids._permute()."""
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for key in reversed(_FEISTEL_KEYS):
+        left, right = right ^ (((left * 0x9E3779B1) ^ key) >> 7 & _HALF_MASK), left
+    return (left << _HALF_BITS) | right
+
+
+def test_year_prefix():
+    assert year_prefix(2025) == '25-'
+    assert year_prefix(2100) == '00-'
+
+
+def test_encode_format():
+    rid = encode(2025, 1)
+    assert rid.startswith('25-')
+    assert len(rid) == 3 + CORE_LEN
+    assert set(rid[3:]) <= set(ALPHABET)
+
+
+def test_feistel_round_trip():
+    """encode() est bijectif : chaque ID redonne sa valeur de séquence."""
+    top = (1 << CORE_LEN * 5) - 1
+    for value in [0, 1, 2, 31, 32, 1023, 123456789, top - 1, top]:
+        permuted = _decode(encode(2025, value))
+        assert permuted == _permute(value)
+        assert 0 <= permuted <= top
+        assert _unpermute(permuted) == value
+
+
+def test_consecutive_values_give_distinct_ids():
+    ids = [encode(2025, value) for value in range(1, 5001)]
+    assert len(set(ids)) == len(ids)
+
+
+def test_random_ids_are_distinct_and_exclude():
+    taken = set(random_ids(2025, 50))
+    ids = random_ids(2025, 200, exclude=taken)
+    assert len(set(ids)) == 200
+    assert not taken & set(ids)
+    assert all(rid.startswith('25-') and set(rid[3:]) <= set(ALPHABET) for rid in ids)
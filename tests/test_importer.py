@@ -0,0 +1,85 @@
+# tests/test_importer.py
+"""
+Validation des lignes importées (importer.validate) : bornes et conversions.
+Le référentiel est un instantané factice : pas de base de données.
+"""
+
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("click")
+
+from importer import MIN_YEAR, validate  # noqa: E402
+
+SPEC = {'line_column': 'Production_line', 'typed': False}
+HEADER = ['BU', 'Production_line', 'DL_Headcount', 'H100', 'H125', 'H150', 'H200', 'WeekNo', 'Year']
+LINES = SimpleNamespace(known={'ATL': {'L1', 'L2'}}, type_map={})
+YEAR = date.today().year
+
+
+def _row(**values):
+    row = {'BU': 'ATL', 'Production_line': 'L1', 'DL_Headcount': '12', 'H100': '10', 'H125': '2',
+           'H150': '0', 'H200': '1', 'WeekNo': 'W7', 'Year': str(YEAR)}
+    row.update(values)
+    return [row[name] for name in HEADER]
+
+
+def _errors(**values):
+    valid, errors = validate(SPEC, HEADER, [_row(**values)], LINES)
+    assert not valid
+    return [e['error'] for e in errors]
+
+
+def test_valid_row_is_converted():
+    valid, errors = validate(SPEC, HEADER, [_row(H150='1,5', WeekNo='w07')], LINES)
+    assert errors == []
+    record, = valid
+    assert record['DL_Headcount'] == 12
+    assert record['WeekNo'] == 'W7'
+    assert record['Year'] == YEAR
+    assert record['H125'] == 2.5 and record['H150'] == 0.75 and record['H200'] == 2
+
+
+@pytest.mark.parametrize('week', ['W0', 'W54', '0', 'semaine'])
+def test_week_out_of_bounds(week):
+    assert len(_errors(WeekNo=week)) == 1
+
+
+@pytest.mark.parametrize('year', [str(MIN_YEAR - 1), str(YEAR + 2), '2025,5'])
+def test_year_out_of_bounds(year):
+    assert len(_errors(Year=year)) == 1
+
+
+def test_year_bounds_are_inclusive():
+    for year in (MIN_YEAR, YEAR + 1):
+        valid, errors = validate(SPEC, HEADER, [_row(Year=str(year))], LINES)
+        assert errors == [] and valid[0]['Year'] == year
+
+
+@pytest.mark.parametrize('headcount', ['12,7', '12.5', 3.2, 'douze'])
+def test_headcount_must_be_a_whole_number(headcount):
+    assert len(_errors(DL_Headcount=headcount)) == 1
+
+
+def test_headcount_accepts_whole_decimals():
+    valid, errors = validate(SPEC, HEADER, [_row(DL_Headcount='12,0')], LINES)
+    assert errors == [] and valid[0]['DL_Headcount'] == 12
+
+
+def test_unknown_bu_and_line():
+    assert _errors(BU='XYZ') == ['BU inconnue : XYZ']
+    assert _errors(Production_line='L9') == ['Production_line inconnu(e) pour ATL : L9']
+
+
+def test_duplicate_rows_and_line_numbers():
+    rows = [_row(), _row(WeekNo='W53'), _row()]
+    valid, errors = validate(SPEC, HEADER, rows, LINES)
+    assert len(valid) == 2
+    assert [e['line'] for e in errors] == [4]
+
+
+def test_missing_columns_raise():
+    with pytest.raises(ValueError, match='Colonnes manquantes'):
+        validate(SPEC, HEADER[:-1], [], LINES)
@@ -0,0 +1,46 @@
+# tests/test_pagination.py
+"""
+Pagination par clé : curseurs opaques et filtres des paramètres de requête.
+Sans base de données.
+"""
+
+from datetime import date
+
+import pytest
+
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, build_filters, decode_cursor, encode_cursor, parse_limit
+
+COLUMNS = {'line': '"Production_line"', 'bu': '"BU"', 'week': '"WeekNo"', 'year': '"Year"'}
+
+
+def test_cursor_round_trip():
+    row = {'Import_Date': date(2025, 3, 14), 'WeekNo': 'W11', 'ID': '25-8FK2Z91P'}
+    assert decode_cursor(encode_cursor(row)) == (date(2025, 3, 14), 'W11', '25-8FK2Z91P')
+
+
+@pytest.mark.parametrize('token', ['', 'pas-un-curseur', 'W10=', 'WyIyMDI1LTAzLTE0Il0='])
+def test_invalid_cursor_raises_value_error(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+def test_build_filters_skips_empty_and_casts_year():
+    clauses, params = build_filters({'bu': 'ATL', 'line': '', 'year': '2025'}, COLUMNS)
+    assert clauses == ['"BU" = %s', '"Year" = %s']
+    assert params == ['ATL', 2025]
+
+
+def test_build_filters_without_arguments():
+    assert build_filters({}, COLUMNS) == ([], [])
+
+
+def test_build_filters_rejects_invalid_year():
+    with pytest.raises(ValueError):
+        build_filters({'year': 'deux-mille'}, COLUMNS)
+
+
+def test_parse_limit_bounds():
+    assert parse_limit(None) == DEFAULT_LIMIT
+    assert parse_limit('') == DEFAULT_LIMIT
+    assert parse_limit('0') == 1
+    assert parse_limit(str(MAX_LIMIT * 10)) == MAX_LIMIT
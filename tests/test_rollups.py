@@ -0,0 +1,96 @@
+# tests/test_rollups.py
+"""
+Agrégats hebdomadaires sous écritures concurrentes (rollups.refresh_rollup).
+
+Nécessite une base PostgreSQL migrée (`flask db-upgrade`) désignée par
+TEST_DATABASE_DSN (DSN libpq, ex : "host=127.0.0.1 port=5433 dbname=metrics
+user=postgres") ; jamais la base de Config. Sans cette variable, le test est
+ignoré.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from rollups import ROLLUP_TABLE, refresh_rollup  # noqa: E402
+
+DSN = os.environ.get("TEST_DATABASE_DSN")
+WEEK = "Z990"  # semaine fictive, supprimée en fin de test
+YEAR = datetime.now().year
+
+pytestmark = pytest.mark.skipif(not DSN, reason="TEST_DATABASE_DSN non défini")
+
+INSERT_SQL = """
+    INSERT INTO public.weekly_dl_metrics
+        ("ID", "BU", "Production_line", "DL_Headcount", "H100", "H125", "H150", "H200", "WeekNo", "Year")
+    VALUES (%s, 'TEST', %s, 1, 10, 0, 0, 0, %s, %s)
+"""
+
+
+def _cleanup(conn):
+    with conn.cursor() as cur:
+        for table in ("weekly_dl_metrics", ROLLUP_TABLE):
+            cur.execute(f'DELETE FROM public.{table} WHERE "WeekNo" = %s AND "Year" = %s', (WEEK, YEAR))
+    conn.commit()
+
+
+@pytest.fixture
+def connections():
+    conns = [psycopg2.connect(DSN) for _ in range(3)]
+    _cleanup(conns[0])
+    yield conns
+    for conn in conns:
+        conn.rollback()
+    _cleanup(conns[0])
+    for conn in conns:
+        conn.close()
+
+
+def test_refresh_overlapping_a_write_sees_its_rows(connections):
+    """
+    Une saisie (ligne + recalcul, transaction ouverte) et le recalcul de la même semaine
+    par un travail de fond : le second ne doit pas réécrire l'agrégat avec un instantané
+    antérieur à la saisie.
+    """
+    writer, job, check = connections
+    errors = []
+
+    # semaine déjà saisie : une ligne et son agrégat validés
+    with writer.cursor() as cur:
+        cur.execute(INSERT_SQL, ("TEST-ROLL-0", "L0", WEEK, YEAR))
+        refresh_rollup(cur, 'DL', YEAR, [WEEK])
+    writer.commit()
+
+    # saisie d'une deuxième ligne, agrégat recalculé, transaction encore ouverte
+    with writer.cursor() as cur:
+        cur.execute(INSERT_SQL, ("TEST-ROLL-1", "L1", WEEK, YEAR))
+        refresh_rollup(cur, 'DL', YEAR, [WEEK])
+
+    def run_job():
+        try:
+            with job.cursor() as cur:
+                refresh_rollup(cur, 'DL', YEAR, [WEEK])
+            job.commit()
+        except Exception as e:  # remonté dans le thread principal
+            errors.append(e)
+            job.rollback()
+
+    thread = threading.Thread(target=run_job)
+    thread.start()
+    thread.join(0.5)
+    assert thread.is_alive(), "le recalcul concurrent aurait dû attendre la saisie"
+
+    writer.commit()
+    thread.join(10)
+    assert not thread.is_alive() and not errors, errors
+
+    with check.cursor() as cur:
+        cur.execute(f'SELECT "Lines", "H100" FROM public.{ROLLUP_TABLE} '
+                    'WHERE "Source" = %s AND "Year" = %s AND "WeekNo" = %s AND "BU" = %s',
+                    ('DL', YEAR, WEEK, 'TEST'))
+        assert cur.fetchone() == (2, 20)
+    check.rollback()
@@ -0,0 +1,75 @@
+# tests/test_write_guard.py
+"""
+Limiteur de débit et clés d'idempotence en mémoire (write_guard, mode 'process').
+L'horloge monotone est figée : pas d'attente réelle, pas de base de données.
+"""
+
+import pytest
+
+import write_guard
+from write_guard import PENDING_LEASE, IdempotencyKeys, TokenBuckets
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(write_guard.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_bucket_allows_burst_then_limits(clock):
+    buckets = TokenBuckets(burst=3, rate=0.5)
+    assert [buckets.take('a') for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take('a') == pytest.approx(2.0)  # 1 jeton / 0,5 par seconde
+
+
+def test_bucket_refills_over_time(clock):
+    buckets = TokenBuckets(burst=1, rate=2)
+    assert buckets.take('a') == 0.0
+    assert buckets.take('a') == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert buckets.take('a') == 0.0
+
+
+def test_buckets_are_per_client(clock):
+    buckets = TokenBuckets(burst=1, rate=1)
+    assert buckets.take('a') == 0.0
+    assert buckets.take('a') > 0
+    assert buckets.take('b') == 0.0
+
+
+def test_bucket_never_exceeds_burst(clock):
+    buckets = TokenBuckets(burst=2, rate=1)
+    buckets.take('a')
+    clock[0] += 3600
+    assert [buckets.take('a') for _ in range(2)] == [0.0, 0.0]
+    assert buckets.take('a') > 0
+
+
+def test_key_claim_complete_replay(clock):
+    keys = IdempotencyKeys()
+    assert keys.claim('k1') is None
+    assert keys.claim('k1') == ('pending', None)
+    keys.complete('k1', '/rh/', ttl=60)
+    assert keys.claim('k1') == ('done', '/rh/')
+
+
+def test_key_release_only_drops_pending(clock):
+    keys = IdempotencyKeys()
+    keys.claim('k1')
+    keys.release('k1')
+    assert keys.claim('k1') is None
+    keys.complete('k1', '/rh/', ttl=60)
+    keys.release('k1')
+    assert keys.claim('k1') == ('done', '/rh/')
+
+
+def test_key_expires(clock):
+    keys = IdempotencyKeys()
+    keys.claim('pending')
+    keys.claim('done')
+    keys.complete('done', '/voh/', ttl=10)
+    clock[0] += 11
+    assert keys.claim('done') is None
+    clock[0] += PENDING_LEASE
+    assert keys.claim('pending') is None
@@ -1,13 +1,22 @@
 # voh_app/route.py
 
-from flask import Flask, render_template, request, redirect, url_for, flash, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, jsonify, make_response
 import psycopg2  # type: ignore
 import psycopg2.extras  # type: ignore
 import psycopg2.errors  # type: ignore
 from datetime import datetime
-from config import Config
+from db import get_db_connection, get_read_connection, bulk_insert_with_short_ids, bulk_update
+from cache import filled_weeks, fragments
+from rollups import refresh_rollup
+from jobs import enqueue, wake as wake_jobs
+from exports import iter_rows, csv_response, xlsx_response, xlsx_available
+from pagination import build_filters, fetch_page, parse_limit, serialize_row, year_columns
+from importer import run_import, ImportErrors
+from registry import REGISTRY_TABLE, catalog
+from http_cache import conditional
+from write_guard import guarded_write
+from history import annotate, row_history, week_history as week_history_entries
 from flask import Blueprint
-import secrets
 
 # =====================================================
 # INITIALISATION DE L'APPLICATION
@@ -15,43 +24,14 @@ import secrets
 
 voh_bp = Blueprint('voh', __name__, template_folder='templates')
 
-# =====================================================
-# CONNEXION À LA BASE DE DONNÉES
-# =====================================================
-
-def get_db_connection():
-    """Connexion à PostgreSQL"""
-    try:
-        conn = psycopg2.connect(
-            host=Config.DB_HOST,
-            port=Config.DB_PORT,
-            database=Config.DB_DATABASE,
-            user=Config.DB_LOGIN,
-            password=Config.DB_PASSWORD,
-            sslmode=Config.SSL_MODE
-        )
-        return conn
-    except Exception as e:
-        raise e
 
 # =====================================================
-# IDS COURTS & LISIBLE (préfixés par l'année)
+# ANNÉE & SEMAINE COURANTES
 # =====================================================
 
-ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # lisible: pas de 0/O/I/l
-
 def current_year() -> int:
     return datetime.now().year
 
-def year_prefix(year: int) -> str:
-    """Ex: 2025 -> '25-'"""
-    return f"{str(year)[-2:]}-"
-
-def new_id_year_prefixed(year: int, core_len: int = 8) -> str:
-    """ID lisible et court, préfixé par l'année. Ex: '25-8FK2Z91P'"""
-    core = "".join(secrets.choice(ALPHABET) for _ in range(core_len))
-    return f"{year_prefix(year)}{core}"
-
 def current_prev_week_label() -> str:
     """Retourne 'Wn' pour la semaine ISO précédente (ex: W42)."""
     iso_week = datetime.now().isocalendar()[1]
@@ -62,6 +42,15 @@ def current_prev_week_label() -> str:
 # FONCTION UTILITAIRE POUR UPDATE
 # =====================================================
 
+def weighted_hours(form, prefix=''):
+    """Heures saisies -> heures stockées (H125 x1.25, H150 x0.5, H200 x2)."""
+    return {
+        'h100': float(form[f'{prefix}h100']),
+        'h125': float(form[f'{prefix}h125']) * 1.25,
+        'h150': float(form[f'{prefix}h150']) * 0.5,
+        'h200': float(form[f'{prefix}h200']) * 2,
+    }
+
 def parse_form_data(form):
     """Prépare les données pour l’update sans modifier import_date ni year."""
     return {
@@ -70,113 +59,219 @@ def parse_form_data(form):
         'department_function': form['department_function'],
         'dl_headcount': int(form['dl_headcount']),
         'type': form['type'],
-        'h100': float(form['h100']),
-        'h125': float(form['h125']) * 1.25,
-        'h150': float(form['h150']) * 0.5,
-        'h200': float(form['h200']) * 2,
-        'weekno': form['weekno']
+        **weighted_hours(form),
+        'weekno': form['weekno'],
+        'version': int(form['version']),
     }
 
+def parse_week_form(form, year, weekno, bu):
+    """Lignes modifiées de la grille de correction (`<ID>_version`, `<ID>_h100`...), ordre WEEK_UPDATE_TEMPLATE."""
+    rows = []
+    for key in form:
+        if not key.endswith('_version'):
+            continue
+        rid = key[:-len('_version')]
+        hours = weighted_hours(form, f'{rid}_')
+        rows.append((rid, int(form[key]), int(form[f'{rid}_dl_headcount']),
+                     hours['h100'], hours['h125'], hours['h150'], hours['h200'], year, weekno, bu))
+    return rows
+
 # =====================================================
-# INSERT AVEC RETRY SUR COLLISION D'ID
+# INSERT GROUPÉ (RETRY UNIQUEMENT SUR COLLISION D'ID)
 # =====================================================
 
+TABLE = "weekly_voh_metrics"
+
 INSERT_SQL = """
     INSERT INTO public.weekly_voh_metrics
     ("ID","BU","Department_function","Type","DL_Headcount",
      "H100","H125","H150","H200","WeekNo","Import_Date","Year")
-    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    VALUES %s
     ON CONFLICT ("ID") DO NOTHING
     RETURNING "ID"
 """
 
-def insert_with_short_id(cur, year: int, values_builder, max_tries: int = 5):
+# =====================================================
+# LECTURE PAGINÉE (KEYSET) + FILTRES SERVEUR
+# =====================================================
+
+SELECT_SQL = """
+    SELECT "ID", "BU", "Department_function", "Type", "DL_Headcount",
+           "H100",
+           COALESCE("H125",0) / 1.25 as "H125",
+           COALESCE("H150",0) / 0.5 as "H150",
+           COALESCE("H200",0) / 2 as "H200",
+           "WeekNo", "Import_Date", "Year"
+    FROM public.weekly_voh_metrics
+"""
+
+# Grille de la page d'accueil (api_columns) : colonnes de SELECT_SQL envoyées au navigateur
+GRID_COLUMNS = ["ID", "BU", "Department_function", "Type", "DL_Headcount", "H100", "H125", "H150", "H200", "WeekNo"]
+
+# Requêtes annexes de la page d'accueil (années de la grille, bannière "semaine déjà saisie")
+YEARS_SQL = 'SELECT DISTINCT "Year" FROM public.weekly_voh_metrics'
+FILLED_WEEK_SQL = 'SELECT 1 FROM public.weekly_voh_metrics WHERE "Year" = %s AND "WeekNo" = %s LIMIT 1'
+
+# Chargement d'une ligne pour le formulaire de modification
+SELECT_BY_ID_SQL = """
+    SELECT
+        "ID",
+        "BU",
+        "Department_function",
+        "Type",
+        "DL_Headcount",
+        "H100",
+        ROUND(CAST(COALESCE("H125", 0.00) / 1.25 AS numeric), 2) AS "H125",
+        ROUND(CAST(COALESCE("H150", 0.00) / 0.5 AS numeric), 2) AS "H150",
+        ROUND(CAST(COALESCE("H200", 0.00) / 2 AS numeric), 2) AS "H200",
+        "WeekNo",
+        "Import_Date",
+        "Year",
+        "Version"
+    FROM public.weekly_voh_metrics
+    WHERE "ID" = %s
+"""
+
+# Modification en une instruction (concurrence optimiste) : écrit seulement si la ligne est
+# encore dans la version lue par le formulaire, et la renvoie ; old."WeekNo" sert au
+# recalcul des agrégats si la semaine change.
+UPDATE_SQL = """
+    UPDATE public.weekly_voh_metrics AS m SET
+      "BU"=%(bu)s, "Department_function"=%(department_function)s, "Type"=%(type)s,
+      "DL_Headcount"=%(dl_headcount)s,
+      "H100"=%(h100)s, "H125"=%(h125)s, "H150"=%(h150)s, "H200"=%(h200)s,
+      "WeekNo"=%(weekno)s, "Version" = m."Version" + 1
+    FROM (SELECT "ID", "WeekNo" FROM public.weekly_voh_metrics WHERE "ID" = %(id)s FOR UPDATE) AS old
+    WHERE m."ID" = old."ID" AND m."Version" = %(version)s
+    RETURNING m.*, old."WeekNo" AS old_week
+"""
+
+# =====================================================
+# CORRECTION D'UNE SEMAINE (GRILLE, UN SEUL UPDATE)
+# =====================================================
+
+WEEK_GRID_SQL = """
+    SELECT "ID", "Department_function" AS line, "Type", "DL_Headcount",
+           "H100",
+           ROUND(CAST(COALESCE("H125", 0.00) / 1.25 AS numeric), 2) AS "H125",
+           ROUND(CAST(COALESCE("H150", 0.00) / 0.5 AS numeric), 2) AS "H150",
+           ROUND(CAST(COALESCE("H200", 0.00) / 2 AS numeric), 2) AS "H200",
+           "Version"
+    FROM public.weekly_voh_metrics
+    WHERE "Year" = %s AND "WeekNo" = %s AND "BU" = %s
+"""
+
+# Lignes modifiées en une instruction ; une ligne modifiée entre-temps (version) ou
+# hors de la grille (année, semaine, BU) n'est pas écrite et n'est pas renvoyée.
+WEEK_UPDATE_SQL = """
+    UPDATE public.weekly_voh_metrics AS m SET
+      "DL_Headcount" = v.dl_headcount,
+      "H100" = v.h100, "H125" = v.h125, "H150" = v.h150, "H200" = v.h200,
+      "Version" = m."Version" + 1
+    FROM (VALUES %s) AS v(id, version, dl_headcount, h100, h125, h150, h200, year, weekno, bu)
+    WHERE m."ID" = v.id AND m."Version" = v.version
+      AND m."Year" = v.year AND m."WeekNo" = v.weekno AND m."BU" = v.bu
+    RETURNING m."ID"
+"""
+WEEK_UPDATE_TEMPLATE = ("(%s, %s::integer, %s::integer, %s::float8, %s::float8, %s::float8, %s::float8, "
+                        "%s::integer, %s, %s)")
+
+# Paramètres de filtre acceptés par l'API -> colonnes SQL
+FILTER_COLUMNS = {
+    'function': '"Department_function"',
+    'bu': '"BU"',
+    'week': '"WeekNo"',
+    'year': '"Year"',
+}
+
+# Import historique (importer.py) : table, colonnes et référentiels de validation
+IMPORT_SPEC = {
+    'table': TABLE,
+    'source': 'VOH',
+    'line_column': 'Department_function',
+    'typed': True,  # colonne "Type" déduite du référentiel
+}
+
+def build_week_rows(form, functions, weekno, import_date, year):
+    """Lignes à insérer pour la semaine (toutes les fonctions actives du référentiel, ordre INSERT_SQL)."""
+    rows = []
+    for bu in functions.bus:
+        for line in functions.lines[bu]:
+            dl_headcount = int(form.get(f"{line}_dl_headcount", 0) or 0)
+            h100 = float(form.get(f"{line}_h100", 0) or 0)
+            h125 = float(form.get(f"{line}_h125", 0) or 0) * 1.25
+            h150 = float(form.get(f"{line}_h150", 0) or 0) * 0.5
+            h200 = float(form.get(f"{line}_h200", 0) or 0) * 2
+            rows.append((
+                bu, line, functions.type_map[line], dl_headcount,
+                h100, h125, h150, h200, weekno, import_date, year
+            ))
+    return rows
+
+def week_sort_key(weekno: str) -> int:
+    """'W42' -> 42 (tri numérique des semaines, pas alphabétique)."""
+    try:
+        return int(str(weekno).lstrip('W'))
+    except ValueError:
+        return 0
+
+def editable_week() -> str:
+    """Semaine modifiable de l'année courante (la précédente)."""
+    return f"W{datetime.utcnow().isocalendar()[1] - 1}"
+
+def is_editable(metric) -> bool:
+    """Seule la semaine précédente de l'année courante est modifiable."""
+    return str(metric['WeekNo']) == editable_week() and int(metric['Year']) == current_year()
+
+def week_is_filled(cur, year: int, weekno: str) -> bool:
+    """Sonde de la bannière, mise en cache (invalidée par les écritures de ce blueprint)."""
+    def probe():
+        cur.execute(FILLED_WEEK_SQL, (year, weekno))
+        return cur.fetchone() is not None
+    return filled_weeks.get_or_load((TABLE, year, weekno), probe)
+
+def index_cache_key():
     """
-    Tente d'insérer avec un ID court préfixé par l'année (ex: '25-XXXXXXX').
-    - Si conflit uniquement sur "ID": on regénère et on réessaie (ON CONFLICT DO NOTHING).
-    - Toute autre contrainte (ex: métier) remonte via psycopg2.errors.UniqueViolation.
+    Éléments de la page d'accueil indépendants de la table (ETag, voir http_cache.py).
+    Connexion de lecture : celle que @conditional vient d'emprunter, pas une du primaire par GET.
     """
-    for _ in range(max_tries):
-        rid = new_id_year_prefixed(year)  # core 8 par défaut
-        values = values_builder(rid)
-        cur.execute(INSERT_SQL, values)
-        row = cur.fetchone()  # None si DO NOTHING (collision d'ID), sinon l'ID inséré
-        if row is not None:
-            return rid
-    raise RuntimeError("Impossible de générer un ID court unique après plusieurs tentatives.")
+    return (current_year(), current_prev_week_label(), catalog('VOH', get_read_connection()).version)
 
 # =====================================================
 # ROUTE PRINCIPALE (INSERT + SELECT)
 # =====================================================
 
 @voh_bp.route('/', methods=['GET', 'POST'])
+@guarded_write
+@conditional(TABLE, REGISTRY_TABLE, key=lambda: index_cache_key())
 def index():
     conn = None
-    metrics = []
-    column_names = [
-        "ID", "BU", "Department_function", "DL_Headcount",
-        "H100", "H125", "H150", "H200", "WeekNo", "Import_Date", "Year"
-    ]
+    years = []  # années saisies ; les lignes sont chargées par la grille, une année à la fois
+    functions = None      # référentiel des fonctions (registry.py)
     filled_week = None  # pour la bannière d'info
 
     try:
-        conn = get_db_connection()
+        # saisie sur le primaire ; listing et bannière sur la réplique (si configurée)
+        conn = get_db_connection() if request.method == 'POST' else get_read_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        functions = catalog('VOH', conn)  # instantané en mémoire (formulaire, insertion, filtres)
 
         if request.method == 'POST':
             try:
-                # Dictionnaire des types selon les lignes
-                TYPE_MAP = {
-                    "SUPERVISOR VALEO": "VOH", "AQC VALEO": "VOH", "REG VALEO": "VOH", "SPC VALEO": "VOH",
-                    "TRAINER VALEO": "ADMIN", "METHODS VALEO": "FOH", "TEAM LEADER VALEO": "FOH", "CSL VALEO": "VOH",
-                    "SUPERVISOR NIDEC": "VOH", "AQC NIDEC": "VOH", "REG NIDEC": "VOH", "SPC NIDEC": "VOH",
-                    "TRAINER NIDEC": "ADMIN", "METHODS NIDEC": "FOH", "TEAM LEADER NIDEC": "FOH", "CSL NIDEC": "VOH",
-                    "MAINTENANCE": "VOH", "AQF": "VOH", "WAREHOUSE": "VOH", "SCRAP": "VOH",
-                    "QUALITY": "FOH", "LOGISTICS": "FOH", "FINANCE": "ADMIN", "INDUS/CIP": "FOH",
-                    "HR": "ADMIN", "PURCHASING": "ADMIN", "EXECUTIVE ASSISTANT": "ADMIN", "IT": "ADMIN", "PROJECT": "FOH"
-                }
-
-                lines_valeo = [
-                    "SUPERVISOR VALEO", "AQC VALEO", "REG VALEO", "SPC VALEO",
-                    "TRAINER VALEO", "METHODS VALEO", "TEAM LEADER VALEO", "CSL VALEO"
-                ]
-                lines_nidec = [
-                    "SUPERVISOR NIDEC", "AQC NIDEC", "REG NIDEC", "SPC NIDEC",
-                    "TRAINER NIDEC", "METHODS NIDEC", "TEAM LEADER NIDEC", "CSL NIDEC"
-                ]
-                lines_other = [
-                    "MAINTENANCE", "AQF", "WAREHOUSE", "SCRAP", "QUALITY", "LOGISTICS",
-                    "FINANCE", "INDUS/CIP", "HR", "PURCHASING", "EXECUTIVE ASSISTANT", "IT", "PROJECT"
-                ]
-
                 weekno = request.form['weekno']
                 import_date = datetime.now().date()
                 year = current_year()
 
-                # === Fonction générique d’insertion (ID court auto-généré) ===
-                def insert_lines(bu, lines):
-                    for line in lines:
-                        dl_headcount = int(request.form.get(f"{line}_dl_headcount", 0) or 0)
-                        h100 = float(request.form.get(f"{line}_h100", 0) or 0)
-                        h125 = float(request.form.get(f"{line}_h125", 0) or 0) * 1.25
-                        h150 = float(request.form.get(f"{line}_h150", 0) or 0) * 0.5
-                        h200 = float(request.form.get(f"{line}_h200", 0) or 0) * 2
-                        type_value = TYPE_MAP.get(line, "VOH")
-
-                        def values_builder(rid):
-                            return (
-                                rid, bu, line, type_value, dl_headcount,
-                                h100, h125, h150, h200, weekno, import_date, year
-                            )
-
-                        insert_with_short_id(cur, year, values_builder)
-
-                # Insertion pour chaque BU
-                insert_lines("VALEO", lines_valeo)
-                insert_lines("NIDEC", lines_nidec)
-                insert_lines("OTHER", lines_other)
+                # Insertion de toutes les BU en un seul INSERT multi-lignes (l'ID court est ajouté à l'insertion)
+                rows = build_week_rows(request.form, functions, weekno, import_date, year)
+                annotate(cur)  # route, client... pour le journal des modifications (history.py)
+                bulk_insert_with_short_ids(cur, INSERT_SQL, rows, year)
+                # agrégats recalculés après la réponse (travail de fond enregistré avec la saisie)
+                enqueue(cur, 'refresh_rollup', {'source': 'VOH', 'year': year, 'weeks': [weekno]})
 
                 conn.commit()
+                wake_jobs()
+                filled_weeks.set((TABLE, year, weekno), True)  # write-through : la semaine est saisie
                 flash("✅ Toutes les lignes ont été enregistrées avec succès !", "success")
                 # NEW: rediriger avec ?filled_week=Wnn
                 return redirect(url_for('voh.index', filled_week=weekno))
@@ -195,29 +290,15 @@ def index():
                 if conn: conn.rollback()
                 flash(f"❌ Erreur de base de données : {db_error}", 'danger')
 
-        # Sélection de toutes les données existantes
-        select_query = """
-            SELECT "ID", "BU", "Department_function", "DL_Headcount",
-                   "H100",
-                   COALESCE("H125",0) / 1.25 as "H125",
-                   COALESCE("H150",0) / 0.5 as "H150",
-                   COALESCE("H200",0) / 2 as "H200",
-                   "WeekNo", "Import_Date", "Year"
-            FROM public.weekly_voh_metrics
-            ORDER BY "Import_Date" DESC, "WeekNo" DESC
-        """
-        cur.execute(select_query)
-        metrics = cur.fetchall()
+        # Années saisies (les autres filtres viennent de api_columns, année par année)
+        cur.execute(YEARS_SQL)
+        years = sorted((int(r[0]) for r in cur.fetchall()), reverse=True)
 
         # NEW: compute banner week for normal visits if previous week exists
         filled_week = request.args.get('filled_week')  # post-submit behavior
         if not filled_week:
             default_week = current_prev_week_label()
-            cur.execute(
-                'SELECT 1 FROM public.weekly_voh_metrics WHERE "Year" = %s AND "WeekNo" = %s LIMIT 1',
-                (current_year(), default_week)
-            )
-            if cur.fetchone():
+            if week_is_filled(cur, current_year(), default_week):
                 filled_week = default_week
 
     except Exception as e:
@@ -226,24 +307,141 @@ def index():
         flash(f"❌ Erreur système : {e}", 'danger')
         return redirect(url_for('voh.index'))
 
-    finally:
-        if conn:
-            conn.close()
-
     # NEW: pass filled_week to template for the info banner
     return render_template(
         'voh/index.html',
-        metrics=metrics,
-        column_names=column_names,
-        datetime=datetime,
+        years=years,
+        functions=functions,
+        this_year=current_year(),
+        editable_week=editable_week(),
         filled_week=filled_week
     )
 
+# =====================================================
+# API JSON (PAGINATION KEYSET, COLONNES DE LA GRILLE)
+# =====================================================
+
+@voh_bp.route('/api/metrics')
+@conditional(TABLE, key=lambda: (current_year(), current_prev_week_label()))
+def api_metrics():
+    """
+    Page de métriques filtrée côté serveur.
+    Paramètres : function, bu, week, year (toutes années si absent), cursor, limit.
+    """
+    try:
+        clauses, params = build_filters(request.args, FILTER_COLUMNS)
+        limit = parse_limit(request.args.get('limit'))
+        conn = get_read_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        rows, next_cursor = fetch_page(cur, SELECT_SQL, clauses, params, request.args.get('cursor'), limit)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    except psycopg2.Error as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+
+    items = []
+    for row in rows:
+        item = serialize_row(row)
+        item['editable'] = is_editable(row)
+        items.append(item)
+    return jsonify(items=items, next_cursor=next_cursor)
+
+@voh_bp.route('/api/columns')
+@conditional(TABLE, primary=True)
+def api_columns():
+    """
+    Lignes d'une année au format colonnaire pour la grille virtualisée (voir pagination.year_columns).
+    Paramètre : year (défaut : année courante).
+    """
+    try:
+        year = int(request.args.get('year', current_year()))
+    except ValueError:
+        return jsonify(error="Paramètre attendu : year (entier)."), 400
+
+    try:
+        # primaire, comme tout fragment mis en cache : versions des semaines et lignes lues sur le même serveur
+        conn = get_db_connection()
+        conn.rollback()  # versions lues par @conditional : year_columns ouvre son propre instantané
+        cur = conn.cursor()
+        payload, source = year_columns(
+            cur, TABLE, SELECT_SQL, year, GRID_COLUMNS,
+            encoded={'BU': None, 'Department_function': None, 'Type': None, 'WeekNo': week_sort_key},
+            live_week=editable_week() if year == current_year() else None,
+        )
+    except psycopg2.Error as db_error:
+        return jsonify(error=f"Erreur de base de données : {db_error}"), 500
+
+    response = make_response(payload)
+    response.mimetype = 'application/json'
+    response.headers['X-Fragment-Cache'] = source
+    return response
+
+# =====================================================
+# EXPORT CSV / XLSX EN FLUX (MÊMES FILTRES QUE L'API)
+# =====================================================
+
+EXPORT_COLUMNS = [
+    "ID", "BU", "Department_function", "Type", "DL_Headcount",
+    "H100", "H125", "H150", "H200", "WeekNo", "Import_Date", "Year"
+]
+
+@voh_bp.route('/export.<fmt>')
+def export(fmt):
+    try:
+        clauses, params = build_filters(request.args, FILTER_COLUMNS)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+
+    filename = f"voh_metrics_{request.args.get('year') or 'all'}.{fmt}"
+    rows = iter_rows(SELECT_SQL, clauses, params)
+    if fmt == 'csv':
+        return csv_response(filename, EXPORT_COLUMNS, rows)
+    if fmt == 'xlsx':
+        if not xlsx_available():
+            return jsonify(error="Export XLSX indisponible (openpyxl non installé)."), 501
+        return xlsx_response(filename, EXPORT_COLUMNS, rows)
+    abort(404)
+
+# =====================================================
+# IMPORT HISTORIQUE (CSV / XLSX)
+# =====================================================
+@voh_bp.route('/import', methods=['GET', 'POST'])
+@guarded_write
+def import_weeks():
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Veuillez choisir un fichier CSV ou XLSX.", 'warning')
+        else:
+            try:
+                report = run_import(get_db_connection(), IMPORT_SPEC, upload.filename, upload.stream,
+                                    skip_invalid=bool(request.form.get('skip_invalid')))
+                filled_weeks.invalidate_prefix((TABLE,))
+                fragments.invalidate_prefix((TABLE,))
+                flash(f"{report['inserted']} ligne(s) importée(s), {report['skipped_existing']} déjà présente(s).", 'success')
+            except ImportErrors as e:
+                report = e.report
+                flash(f"❌ Import annulé : {e}. Corrigez le fichier ou cochez « Ignorer les lignes invalides ».", 'danger')
+            except (ValueError, RuntimeError, psycopg2.Error) as e:
+                flash(f"❌ Erreur lors de l'import : {e}", 'danger')
+            except Exception as e:
+                flash(f"❌ Erreur système : {e}", 'danger')
+
+    return render_template(
+        'import.html',
+        report=report,
+        source='VOH',
+        columns=EXPORT_COLUMNS,
+        back_url=url_for('voh.index'),
+    )
+
 # =====================================================
 # ROUTE DE MISE À JOUR
 # =====================================================
 
 @voh_bp.route('/update/<string:id>', methods=['GET', 'POST'])
+@guarded_write
 def update(id):
     conn = None
     metric = None
@@ -254,41 +452,30 @@ def update(id):
         if request.method == 'POST':
             data = parse_form_data(request.form)
 
-            update_query = """
-                UPDATE public.weekly_voh_metrics SET
-                "BU"=%s, "Department_function"=%s, "Type"=%s, "DL_Headcount"=%s,
-                "H100"=%s, "H125"=%s, "H150"=%s, "H200"=%s,
-                "WeekNo"=%s
-                WHERE "ID" = %s
-            """
-            values = (
-                data['bu'], data['department_function'], data['type'], data['dl_headcount'],
-                data['h100'], data['h125'], data['h150'], data['h200'],
-                data['weekno'], id
-            )
-            cur.execute(update_query, values)
-            conn.commit()
-            flash('✅ Métrique mise à jour avec succès !', 'success')
-            return redirect(url_for('voh.index'))
+            # Contrôle de version + écriture en un seul aller-retour
+            annotate(cur)
+            cur.execute(UPDATE_SQL, dict(data, id=id))
+            changed = cur.fetchone()
+
+            if changed is not None:
+                refresh_rollup(cur, 'VOH', changed['Year'], [changed['old_week'], changed['WeekNo']])
+                conn.commit()
+                filled_weeks.invalidate_prefix((TABLE,))
+                flash('✅ Métrique mise à jour avec succès !', 'success')
+                return redirect(url_for('voh.index'))
+
+            # Rien d'écrit : ligne supprimée, ou modifiée entre-temps par quelqu'un d'autre
+            conn.rollback()
+            cur.execute(SELECT_BY_ID_SQL, (id,))
+            metric = cur.fetchone()
+            if metric is None:
+                abort(404)
+            flash("⚠️ Cette ligne a été modifiée par un autre utilisateur pendant votre saisie. "
+                  "Les valeurs actuelles sont affichées : vérifiez-les puis enregistrez à nouveau.", 'warning')
+            return render_template('voh/update.html', metric=metric), 409
 
         # Récupération pour affichage du formulaire
-        cur.execute("""
-          SELECT 
-                "ID",
-                "BU",
-                "Department_function",
-                "Type",
-                "DL_Headcount",
-                "H100",
-                ROUND(CAST(COALESCE("H125", 0.00) / 1.25 AS numeric), 2) AS "H125",
-                ROUND(CAST(COALESCE("H150", 0.00) / 0.5 AS numeric), 2) AS "H150",
-                ROUND(CAST(COALESCE("H200", 0.00) / 2 AS numeric), 2) AS "H200",
-                "WeekNo",
-                "Import_Date",
-                "Year"
-          FROM public.weekly_voh_metrics
-          WHERE "ID" = %s
-        """, (id,))
+        cur.execute(SELECT_BY_ID_SQL, (id,))
 
         metric = cur.fetchone()
 
@@ -299,7 +486,128 @@ def update(id):
         if conn: conn.rollback()
         flash(f"Erreur lors de la modification : {e}", 'danger')
         return render_template('voh/update.html', metric=metric)
-    finally:
-        if conn: conn.close()
 
     return render_template('voh/update.html', metric=metric)
+
+
+# =====================================================
+# CORRECTION D'UNE SEMAINE (une BU, tout ou rien)
+# =====================================================
+
+@voh_bp.route('/week/<string:weekno>', methods=['GET', 'POST'])
+@guarded_write
+def edit_week(weekno):
+    """Grille d'une (BU, semaine) ; seules les lignes modifiées sont envoyées et écrites en un UPDATE."""
+    conn = None
+    functions = None
+    rows = []
+    status = 200
+    bu = request.args.get('bu', '')
+
+    try:
+        year = int(request.args.get('year', current_year()))
+        conn = get_db_connection()
+        functions = catalog('VOH', conn)
+        if not bu and not functions.bus:
+            raise ValueError("référentiel VOH vide : aucune BU à afficher (voir `flask lines-add`).")
+        bu = bu or functions.bus[0]
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+        if request.method == 'POST':
+            changes = parse_week_form(request.form, year, weekno, bu)
+            if not changes:
+                flash("Aucune modification à enregistrer.", 'warning')
+                return redirect(url_for('voh.edit_week', weekno=weekno, bu=bu, year=year))
+
+            annotate(cur)
+            written = bulk_update(cur, WEEK_UPDATE_SQL, changes, WEEK_UPDATE_TEMPLATE)
+            if len(written) == len(changes):
+                refresh_rollup(cur, 'VOH', year, [weekno])
+                conn.commit()
+                flash(f"✅ {len(written)} ligne(s) {bu} de la semaine {weekno} mise(s) à jour avec succès !", 'success')
+                return redirect(url_for('voh.index'))
+
+            # Tout ou rien : au moins une ligne a changé entre-temps
+            conn.rollback()
+            stale = {c[0] for c in changes} - written
+            status = 409
+
+        cur.execute(WEEK_GRID_SQL, (year, weekno, bu))
+        order = {line: i for i, line in enumerate(functions.known.get(bu, ()))}
+        rows = sorted(cur.fetchall(), key=lambda r: (order.get(r['line'], len(order)), r['line']))
+
+        if status == 409:
+            names = ", ".join(r['line'] for r in rows if r['ID'] in stale) or f"{len(stale)} ligne(s)"
+            flash(f"⚠️ Aucune modification enregistrée : {names} modifiée(s) par un autre utilisateur "
+                  "pendant votre saisie. Les valeurs actuelles sont affichées : vérifiez-les puis enregistrez à nouveau.",
+                  'warning')
+
+    except (ValueError, psycopg2.Error) as e:
+        if conn: conn.rollback()
+        flash(f"Erreur lors de la modification : {e}", 'danger')
+        year = current_year()
+
+    return render_template(
+        'edit_week.html',
+        rows=rows,
+        source='VOH',
+        line_label='Fonction',
+        bus=functions.bus if functions else (),
+        bu=bu,
+        weekno=weekno,
+        year=year,
+        endpoint='voh.edit_week',
+        history_url=url_for('voh.week_history', weekno=weekno, bu=bu, year=year),
+        back_url=url_for('voh.index'),
+    ), status
+
+# -----------------------------------------------------------------------------
+# Routes : HISTORIQUE DES MODIFICATIONS (journal metrics_history, voir history.py)
+# -----------------------------------------------------------------------------
+@voh_bp.route('/history/<string:id>')
+def history(id):
+    """Modifications d'une ligne, de la plus récente à la plus ancienne."""
+    entries, before = [], None
+    try:
+        cur = get_read_connection().cursor(cursor_factory=psycopg2.extras.DictCursor)
+        entries, before = row_history(cur, TABLE, IMPORT_SPEC['line_column'], id,
+                                      before=request.args.get('before', type=int),
+                                      limit=parse_limit(request.args.get('limit')))
+    except (ValueError, psycopg2.Error) as e:
+        flash(f"❌ Erreur de base de données : {e}", 'danger')
+
+    return render_template(
+        'history.html',
+        entries=entries,
+        source='VOH',
+        line_label='Fonction',
+        title=f"ligne {id}",
+        more_url=url_for('voh.history', id=id, before=before) if before else None,
+        back_url=url_for('voh.index'),
+    )
+
+
+@voh_bp.route('/week/<string:weekno>/history')
+def week_history(weekno):
+    """Modifications d'une semaine (toutes les BU, ou ?bu=...)."""
+    entries, before = [], None
+    bu = request.args.get('bu') or None
+    year = current_year()
+    try:
+        year = int(request.args.get('year', year))
+        cur = get_read_connection().cursor(cursor_factory=psycopg2.extras.DictCursor)
+        entries, before = week_history_entries(cur, TABLE, IMPORT_SPEC['line_column'], year, weekno, bu,
+                                               before=request.args.get('before', type=int),
+                                               limit=parse_limit(request.args.get('limit')))
+    except (ValueError, psycopg2.Error) as e:
+        flash(f"❌ Erreur de base de données : {e}", 'danger')
+
+    return render_template(
+        'history.html',
+        entries=entries,
+        source='VOH',
+        line_label='Fonction',
+        title=f"semaine {weekno} / {year}" + (f" — {bu}" if bu else ""),
+        more_url=url_for('voh.week_history', weekno=weekno, bu=bu, year=year, before=before) if before else None,
+        back_url=url_for('voh.edit_week', weekno=weekno, bu=bu, year=year),
+    )
@@ -0,0 +1,423 @@
+# write_guard.py
+"""
+Protection des routes d'écriture (POST des formulaires) : limiteur de débit
+par client et clés d'idempotence.
+
+Limiteur : un seau de WRITE_RATE_BURST jetons par client (adresse IP, voir
+client_key), regagnés au rythme de WRITE_RATE_PER_MINUTE. Un POST sans jeton
+est refusé avant toute écriture : message flash, redirection vers la page en
+GET et en-tête Retry-After.
+
+Idempotence : chaque formulaire porte un champ caché `idempotency_key`, tiré
+par le navigateur à l'affichage de la page (static/js/submit_key.js). La
+première soumission d'une clé la réserve ('pending'), puis mémorise son
+résultat (la redirection et ses messages flash) IDEMPOTENCY_TTL secondes. Un
+double clic ou un rafraîchissement renvoie la même clé : le résultat est
+rejoué sans connexion aux tables de métriques. Si la première soumission est
+encore en cours, la copie l'attend au plus IDEMPOTENCY_WAIT secondes. Une
+page réaffichée avec un avertissement (semaine déjà saisie...) est mémorisée
+comme une redirection vers la page en GET avec ses messages ; une page
+d'erreur ('danger' : saisie invalide, base indisponible...) libère sa clé, la
+soumission suivante est traitée normalement.
+
+État en mémoire du processus par défaut ; WRITE_GUARD_SHARED=1 le place dans
+PostgreSQL (tables UNLOGGED write_rate_buckets et idempotency_keys, migration
+11), commun à tous les workers gunicorn. Sous WSGI, ces instructions passent
+par la connexion de la requête (transaction courte, avant ou après celle de
+la vue) : le limiteur n'emprunte pas une deuxième connexion au pool. Les tables UNLOGGED ne sont pas
+journalisées : elles sont vidées après un arrêt brutal du serveur et absentes
+des répliques, ce qui convient à un état de quelques minutes.
+
+Compteurs (allowed, rejected, replayed, in_flight) : /health et /metrics.
+"""
+
+import json
+import logging
+import math
+import re
+import threading
+import time
+from functools import wraps
+
+import psycopg2  # type: ignore
+import psycopg2.extensions  # type: ignore
+from flask import flash, get_flashed_messages, make_response, redirect, request, session
+
+from config import Config
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+RATE_TABLE = "write_rate_buckets"
+KEYS_TABLE = "idempotency_keys"
+FORM_FIELD = "idempotency_key"
+PENDING_LEASE = 120  # réservation d'une clé dont la soumission ne s'est jamais terminée (s)
+PURGE_EVERY = 300    # purge des seaux pleins et des clés expirées (s)
+CLAIM_ATTEMPTS = 3   # clé libérée entre la réservation et la lecture : nouveaux essais
+WAIT_STEP = 0.1      # attente d'une soumission identique en cours (s)
+
+_KEY_PATTERN = re.compile(r'^[A-Za-z0-9-]{8,64}$')
+
+RATE_LIMITED_MESSAGE = "⚠️ Trop de soumissions rapprochées : réessayez dans {seconds} s."
+IN_FLIGHT_MESSAGE = "⏳ Cette soumission est déjà en cours de traitement : actualisez la page dans quelques secondes."
+
+CREATE_BUCKETS_SQL = f"""
+    CREATE UNLOGGED TABLE IF NOT EXISTS public.{RATE_TABLE} (
+        "Client"     text        PRIMARY KEY,
+        "Tokens"     float8      NOT NULL,
+        "Updated_at" timestamptz NOT NULL DEFAULT clock_timestamp()
+    )
+"""
+
+CREATE_KEYS_SQL = f"""
+    CREATE UNLOGGED TABLE IF NOT EXISTS public.{KEYS_TABLE} (
+        "Key"        text        PRIMARY KEY,
+        "State"      text        NOT NULL DEFAULT 'pending',
+        "Result"     jsonb,
+        "Expires_at" timestamptz NOT NULL
+    )
+"""
+
+# Jetons disponibles au moment de la requête (réserve plafonnée à WRITE_RATE_BURST)
+_REFILLED = ('LEAST(%(burst)s::float8, b."Tokens" + extract(epoch FROM clock_timestamp() - b."Updated_at")'
+             ' * %(rate)s::float8)')
+
+# Prend un jeton ; aucune ligne retournée = seau vide
+TAKE_SQL = f"""
+    INSERT INTO public.{RATE_TABLE} AS b ("Client", "Tokens") VALUES (%(client)s, %(burst)s::float8 - 1)
+    ON CONFLICT ("Client") DO UPDATE
+        SET "Tokens" = {_REFILLED} - 1, "Updated_at" = clock_timestamp()
+        WHERE {_REFILLED} >= 1
+    RETURNING "Tokens"
+"""
+
+# Réserve une clé nouvelle (ou expirée) ; aucune ligne retournée = clé déjà connue
+CLAIM_SQL = f"""
+    INSERT INTO public.{KEYS_TABLE} AS k ("Key", "Expires_at")
+    VALUES (%(key)s, clock_timestamp() + make_interval(secs => %(lease)s::float8))
+    ON CONFLICT ("Key") DO UPDATE
+        SET "State" = 'pending', "Result" = NULL, "Expires_at" = EXCLUDED."Expires_at"
+        WHERE k."Expires_at" < clock_timestamp()
+    RETURNING "Key"
+"""
+
+LOOKUP_SQL = f'SELECT "State", "Result" FROM public.{KEYS_TABLE} WHERE "Key" = %s'
+
+COMPLETE_SQL = f"""
+    UPDATE public.{KEYS_TABLE}
+    SET "State" = 'done', "Result" = %(result)s::jsonb,
+        "Expires_at" = clock_timestamp() + make_interval(secs => %(ttl)s::float8)
+    WHERE "Key" = %(key)s
+"""
+
+RELEASE_SQL = f"""DELETE FROM public.{KEYS_TABLE} WHERE "Key" = %s AND "State" = 'pending'"""
+
+PURGE_KEYS_SQL = f'DELETE FROM public.{KEYS_TABLE} WHERE "Expires_at" < clock_timestamp()'
+
+# Un seau inactif depuis `secs` secondes est plein : inutile de le garder
+PURGE_BUCKETS_SQL = f"""
+    DELETE FROM public.{RATE_TABLE}
+    WHERE "Updated_at" < clock_timestamp() - make_interval(secs => %s::float8)
+"""
+
+
+def install(cur):
+    """Seaux du limiteur et clés d'idempotence partagés (migration 11)."""
+    cur.execute(CREATE_BUCKETS_SQL)
+    cur.execute(CREATE_KEYS_SQL)
+
+
+# -----------------------------------------------------------------------------
+# État en mémoire du processus
+# -----------------------------------------------------------------------------
+class TokenBuckets:
+    """Seaux à jetons par client, thread-safe."""
+
+    def __init__(self, burst, rate):
+        self.burst = burst
+        self.rate = rate  # jetons par seconde
+        self._buckets = {}  # client -> (jetons, dernière mise à jour)
+        self._lock = threading.Lock()
+        self._purged_at = time.monotonic()
+
+    def take(self, client, conn=None):
+        """0 si un jeton est pris, sinon le délai (s) avant le prochain jeton."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self._buckets[client] = (tokens - 1, now)
+            if now - self._purged_at > PURGE_EVERY:
+                full = self.burst / self.rate
+                self._buckets = {c: b for c, b in self._buckets.items() if now - b[1] < full}
+                self._purged_at = now
+            return 0.0
+
+
+class IdempotencyKeys:
+    """Clé -> (état, résultat, expiration), thread-safe."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._purged_at = time.monotonic()
+
+    def claim(self, key):
+        """None si la clé est réservée par cet appel, sinon (état, résultat) de la clé existante."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._purged_at > PURGE_EVERY:
+                self._entries = {k: e for k, e in self._entries.items() if e[2] > now}
+                self._purged_at = now
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                return entry[0], entry[1]
+            self._entries[key] = ('pending', None, now + PENDING_LEASE)
+            return None
+
+    def complete(self, key, result, ttl):
+        with self._lock:
+            self._entries[key] = ('done', result, time.monotonic() + ttl)
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == 'pending':
+                del self._entries[key]
+
+
+# -----------------------------------------------------------------------------
+# Limiteur + idempotence (un objet par processus)
+# -----------------------------------------------------------------------------
+class WriteGuard:
+    """
+    Point d'entrée commun aux applications WSGI et asyncio. `configure()` (run.py)
+    fixe les réglages et, si WRITE_GUARD_SHARED, le pool du stockage PostgreSQL.
+    """
+
+    def __init__(self, cfg):
+        self._counters = {'allowed': 0, 'rejected': 0, 'replayed': 0, 'in_flight': 0}
+        self._lock = threading.Lock()
+        self.configure(cfg)
+
+    def configure(self, cfg, pool=None):
+        per_minute = cfg['WRITE_RATE_PER_MINUTE']
+        self.burst = max(1, cfg['WRITE_RATE_BURST'])
+        self.rate = per_minute / 60 if per_minute > 0 else 0.0  # 0 : pas de limite
+        self.ttl = cfg['IDEMPOTENCY_TTL']
+        self.wait = cfg['IDEMPOTENCY_WAIT']
+        self.trust_forwarded = cfg['WRITE_GUARD_TRUST_FORWARDED']
+        self.pool = pool if cfg['WRITE_GUARD_SHARED'] else None
+        self.buckets = TokenBuckets(self.burst, self.rate) if self.rate else None
+        self.keys = IdempotencyKeys()
+        self._purged_at = time.monotonic()
+
+    @property
+    def shared(self):
+        return self.pool is not None
+
+    def count(self, outcome):
+        with self._lock:
+            self._counters[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats.update(shared=self.shared, rate_per_minute=self.rate * 60, burst=self.burst)
+        return stats
+
+    # -- stockage PostgreSQL ---------------------------------------------------
+    def _unavailable(self, error):
+        # table absente (migration 11 non appliquée), base injoignable... : repli sur la mémoire
+        logger.warning("État partagé du limiteur / des clés d'idempotence indisponible : %s", error)
+
+    def _execute(self, sql, params, conn=None):
+        """
+        `conn` : connexion de la requête (WSGI), utilisée dans sa propre transaction si aucune
+        n'y est ouverte ; sinon (asyncio, transaction de la vue en cours) connexion du pool.
+        """
+        if conn is not None and conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return self._run(conn, sql, params)
+        with self.pool.connection() as pooled:
+            return self._run(pooled, sql, params)
+
+    def _run(self, conn, sql, params):
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall() if cur.description else []
+                if time.monotonic() - self._purged_at > PURGE_EVERY:
+                    self._purged_at = time.monotonic()
+                    cur.execute(PURGE_KEYS_SQL)
+                    cur.execute(PURGE_BUCKETS_SQL, (self.burst / self.rate if self.rate else 0,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows
+
+    # -- limiteur --------------------------------------------------------------
+    def take(self, client, conn=None):
+        """0 si la requête peut passer, sinon le délai (s) avant de réessayer."""
+        if not self.rate:
+            return 0.0
+        retry_after = None
+        if self.shared:
+            try:
+                rows = self._execute(TAKE_SQL, {'client': client, 'burst': self.burst, 'rate': self.rate}, conn)
+                retry_after = 0.0 if rows else 1 / self.rate
+            except psycopg2.Error as e:
+                self._unavailable(e)
+        if retry_after is None:
+            retry_after = self.buckets.take(client)
+        self.count('rejected' if retry_after else 'allowed')
+        return retry_after
+
+    # -- idempotence -----------------------------------------------------------
+    def claim(self, key, conn=None):
+        """None si la clé est réservée par cet appel, sinon (état, résultat) de la soumission d'origine."""
+        if self.shared:
+            try:
+                for _ in range(CLAIM_ATTEMPTS):
+                    if self._execute(CLAIM_SQL, {'key': key, 'lease': PENDING_LEASE}, conn):
+                        return None
+                    rows = self._execute(LOOKUP_SQL, (key,), conn)
+                    if rows:
+                        state, result = rows[0]
+                        return state, json.loads(result) if isinstance(result, str) else result
+                    # libérée entre la réservation et la lecture : nouvel essai
+                # réservée puis libérée à chaque essai : traitée comme une soumission en cours
+                return 'pending', None
+            except psycopg2.Error as e:
+                self._unavailable(e)
+        return self.keys.claim(key)
+
+    def complete(self, key, result, conn=None):
+        if self.shared:
+            try:
+                return self._execute(COMPLETE_SQL, {'key': key, 'result': json.dumps(result), 'ttl': self.ttl}, conn)
+            except psycopg2.Error as e:
+                self._unavailable(e)
+        self.keys.complete(key, result, self.ttl)
+
+    def release(self, key, conn=None):
+        if self.shared:
+            try:
+                return self._execute(RELEASE_SQL, (key,), conn)
+            except psycopg2.Error as e:
+                self._unavailable(e)
+        self.keys.release(key)
+
+
+guard = WriteGuard(vars(Config))
+
+
+def init_write_guard(app):
+    guard.configure(app.config, app.extensions['db_pool'])
+
+
+# -----------------------------------------------------------------------------
+# Requête courante (Flask et Quart exposent les mêmes attributs)
+# -----------------------------------------------------------------------------
+def client_key(req):
+    """Adresse du client ; premier saut de X-Forwarded-For derrière un proxy de confiance."""
+    if guard.trust_forwarded and req.access_route:
+        return req.access_route[0]
+    return req.remote_addr or 'inconnu'
+
+
+def submission_key(req, form):
+    """Clé d'idempotence du formulaire, propre à la route ; None si absente ou invalide."""
+    token = form.get(FORM_FIELD, '')
+    if not _KEY_PATTERN.match(token):
+        return None
+    return f"{req.path}|{token}"
+
+
+def is_redirect(response):
+    return response.status_code in (301, 302, 303, 307, 308)
+
+
+def new_flashes(sess, read_flashes, before):
+    """
+    Messages flash posés par la vue : encore en session (redirection) ou déjà lus par le
+    template rendu (`read_flashes` : get_flashed_messages de Flask ou de Quart).
+    """
+    if '_flashes' in sess:
+        return sess['_flashes'][before:]
+    return read_flashes(with_categories=True)[before:]
+
+
+def recorded_result(response, flashes, url):
+    """
+    Résultat mémorisé d'une soumission (redirection et messages flash posés), ou None si
+    sa clé doit être libérée. Une page réaffichée avec un avertissement est rejouée comme
+    une redirection vers `url` (la page en GET) ; une page d'erreur n'est pas mémorisée.
+    """
+    flashes = [list(f) for f in flashes]
+    if is_redirect(response):
+        return {'location': response.headers['Location'], 'flashes': flashes}
+    if response.status_code == 200 and flashes and all(category != 'danger' for category, _ in flashes):
+        return {'location': url, 'flashes': flashes}
+    return None
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+# -----------------------------------------------------------------------------
+# Décorateur des routes d'écriture (WSGI)
+# -----------------------------------------------------------------------------
+def guarded_write(view):
+    """POST : limiteur de débit du client, puis rejeu des soumissions déjà traitées."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'POST':
+            return view(*args, **kwargs)
+
+        # état partagé : connexion de la requête, jamais une deuxième connexion du pool
+        conn = get_db_connection() if guard.shared else None
+        retry_after = guard.take(client_key(request), conn)
+        if retry_after:
+            flash(RATE_LIMITED_MESSAGE.format(seconds=retry_after_header(retry_after)), 'warning')
+            response = redirect(request.url)
+            response.headers['Retry-After'] = retry_after_header(retry_after)
+            return response
+
+        key = submission_key(request, request.form)
+        if key is None:
+            return view(*args, **kwargs)
+
+        deadline = time.monotonic() + guard.wait
+        while (existing := guard.claim(key, conn)) is not None:
+            state, result = existing
+            if state == 'done':
+                guard.count('replayed')
+                for category, message in result['flashes']:
+                    flash(message, category)
+                response = redirect(result['location'])
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+            if time.monotonic() >= deadline:
+                guard.count('in_flight')
+                flash(IN_FLIGHT_MESSAGE, 'warning')
+                return redirect(request.url)
+            time.sleep(WAIT_STEP)
+
+        flashes_before = len(session.get('_flashes', []))
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            guard.release(key, conn)
+            raise
+        result = recorded_result(response, new_flashes(session, get_flashed_messages, flashes_before), request.url)
+        if result is not None:
+            guard.complete(key, result, conn)
+        else:
+            guard.release(key, conn)
+        return response
+    return wrapper
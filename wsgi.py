@@ -0,0 +1,18 @@
+# wsgi.py
+"""
+Point d'entrée WSGI de production.
+
+    gunicorn wsgi:app               # réglages : gunicorn.conf.py (lu automatiquement)
+
+Avec preload_app (réglage par défaut de gunicorn.conf.py), ce module est
+importé une seule fois, dans le processus maître : imports, compilation des
+templates et référentiel sont faits avant le fork et partagés par les workers.
+Les connexions ouvertes pendant le préchauffage sont fermées ici ; chaque
+worker ouvre les siennes et lance ses threads de fond après son démarrage
+(post_worker_init, gunicorn.conf.py).
+"""
+
+from run import create_app
+
+app = create_app(background=False)
+app.extensions['db_pool'].reset()